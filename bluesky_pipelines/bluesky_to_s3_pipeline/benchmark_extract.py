@@ -0,0 +1,68 @@
+"""
+Benchmark of BlueSkyFirehose.extract_message against a recorded frame corpus.
+
+Record a corpus from the live firehose (see replay.py for the format):
+    python3 benchmark_extract.py record frames.bin --frames 20000
+Compare decoding every commit against the post pre-filter:
+    python3 benchmark_extract.py run frames.bin
+"""
+import sys
+import time
+import argparse
+from unittest.mock import MagicMock
+from atproto import CAR, firehose_models, models, parse_subscribe_repos_message
+from extract import BlueSkyFirehose, POST_COLLECTION
+from utilities import Message
+from replay import read_frames, record
+
+
+def decode_every_commit(firehose: BlueSkyFirehose, message) -> None:
+    """The extract path before the pre-filter, decoding the CAR of every commit"""
+    commit = parse_subscribe_repos_message(message)
+    if not isinstance(commit, models.ComAtprotoSyncSubscribeRepos.Commit):
+        return
+    car = CAR.from_bytes(commit.blocks)
+    for op in commit.ops:
+        if op.action == "create" and op.cid:
+            raw_message = car.blocks.get(op.cid)
+            if raw_message and raw_message.get("$type") == POST_COLLECTION \
+                    and "en" in (raw_message.get("langs") or []):
+                firehose.message_handling(Message(raw_message))
+
+
+def frames_per_second(handler, frames: list) -> float:
+    """Times a handler over every frame, returning the throughput"""
+    time1 = time.perf_counter()
+    for frame in frames:
+        handler(frame)
+    return len(frames) / (time.perf_counter() - time1)
+
+
+def run(path: str) -> None:
+    """Prints frames/sec with and without the post pre-filter"""
+    frames = [firehose_models.Frame.from_bytes(raw) for _, raw in read_frames(path)]
+    firehose = BlueSkyFirehose(uploader=MagicMock())
+
+    before = frames_per_second(
+        lambda frame: decode_every_commit(firehose, frame), frames)
+    after = frames_per_second(firehose.extract_message, frames)
+
+    print(f"{len(frames)} frames")
+    print(f"decode every commit: {before:,.0f} frames/sec")
+    print(f"post pre-filter:     {after:,.0f} frames/sec ({after/before:.1f}x)")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    subparsers = parser.add_subparsers(dest="command", required=True)
+    record_parser = subparsers.add_parser("record")
+    record_parser.add_argument("path")
+    record_parser.add_argument("--frames", type=int, default=20000)
+    run_parser = subparsers.add_parser("run")
+    run_parser.add_argument("path")
+    args = parser.parse_args(sys.argv[1:])
+
+    if args.command == "record":
+        record(args.path, args.frames)
+    else:
+        run(args.path)
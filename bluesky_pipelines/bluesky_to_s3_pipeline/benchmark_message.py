@@ -0,0 +1,102 @@
+"""
+Micro-benchmark of the memory and time each post costs between arriving from
+the firehose and being serialised for upload.
+
+    python3 benchmark_message.py --posts 45000
+"""
+import sys
+import json
+import time
+import argparse
+import tracemalloc
+from utilities import Message
+from load_s3 import MemoryBatch, S3Loader, JSON
+
+RAW_POST = {
+    "text": "I love football and cooking and photography, what a day it has been",
+    "langs": ["en"],
+    "$type": "app.bsky.feed.post",
+    "reply": {"root": {"cid": "bafyreidcbtn7o3q5eksnj2qt5bff2glucf2wbwt6yo3zd4nzarneweibs4"}},
+    "createdAt": "2025-07-28T12:36:42.475Z",
+}
+
+
+class DictMessage:
+    """The Message before __slots__ and pre-encoding, kept for comparison"""
+
+    def __init__(self, message_dict: dict):
+        self.text = message_dict.get("text")
+        self.langs = message_dict.get("langs")
+        self.type = message_dict.get("$type")
+        self._timestamp = None
+        self._timestamp_string = message_dict.get("createdAt")
+        self._json = None
+
+    @property
+    def json(self) -> dict:
+        """Builds and caches the kept fields"""
+        if self._json is None:
+            self._json = {"text": self.text, "langs": self.langs,
+                          "$type": self.type, "createdAt": self._timestamp_string}
+        return self._json
+
+
+def raw_posts(posts: int) -> list[bytes]:
+    """Distinct raw posts, decoded inside each run so every post owns its strings"""
+    return [json.dumps({**RAW_POST, "text": f"{RAW_POST['text']} #{number}"}).encode()
+            for number in range(posts)]
+
+
+def fill_list(raw: list[bytes]) -> list[dict]:
+    """The old window: message dicts appended to a list"""
+    json_list = []
+    for raw_post in raw:
+        json_list.append(DictMessage(json.loads(raw_post)).json)
+    return json_list
+
+
+def fill_buffer(raw: list[bytes]) -> MemoryBatch:
+    """The new window: pre-encoded lines appended to one buffer"""
+    batch = MemoryBatch(output_format=JSON)
+    for raw_post in raw:
+        batch.append(Message(json.loads(raw_post)).encoded)
+    return batch
+
+
+def measure(fill, serialise, raw: list[bytes]) -> dict:
+    """Memory held per post by a full window, and the time to fill and serialise it"""
+    posts = len(raw)
+    time1 = time.perf_counter()
+    window = fill(raw)
+    time2 = time.perf_counter()
+    serialise(window)
+    time3 = time.perf_counter()
+    del window
+
+    tracemalloc.start()
+    before = tracemalloc.take_snapshot()
+    window = fill(raw)
+    held = tracemalloc.take_snapshot().compare_to(before, "filename")
+    tracemalloc.reset_peak()
+    serialise(window)
+    current, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+
+    return {
+        "held_blocks_per_post": round(sum(stat.count_diff for stat in held) / posts, 2),
+        "held_bytes_per_post": round(sum(stat.size_diff for stat in held) / posts, 1),
+        "append_us_per_post": round((time2 - time1) / posts * 1e6, 2),
+        "serialise_ms": round((time3 - time2) * 1e3, 1),
+        "serialise_peak_extra_mb": round((peak - current) / 1e6, 1),
+    }
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--posts", type=int, default=45000)
+    args = parser.parse_args(sys.argv[1:])
+
+    raw = raw_posts(args.posts)
+    print(" list of dicts:", measure(fill_list, json.dumps, raw))
+    print("encoded buffer:", measure(
+        fill_buffer, lambda batch: S3Loader.encode(batch.seal().args[0], JSON), raw))
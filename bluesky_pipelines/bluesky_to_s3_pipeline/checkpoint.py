@@ -0,0 +1,44 @@
+"""Local checkpoint of the last firehose sequence number safely stored."""
+import os
+import json
+import logging
+
+logging.basicConfig(
+    filename="pipeline.log",
+    filemode="a",
+    level=logging.INFO,
+    format="%(asctime)s - %(levelname)s - %(message)s"
+)
+
+CHECKPOINT_PATH = os.getenv("CHECKPOINT_PATH", "firehose_cursor.json")
+
+
+class CursorCheckpoint:
+    """Persists the firehose cursor so a restarted extractor can resume from it"""
+
+    def __init__(self, path: str = CHECKPOINT_PATH) -> None:
+        self.path = path
+        self.seq = self.load()
+
+    def load(self) -> int | None:
+        """Reads the saved sequence number, or None if there is no checkpoint"""
+        try:
+            with open(self.path, "r", encoding="utf-8") as file:
+                return json.load(file)["seq"]
+        except FileNotFoundError:
+            return None
+        except (json.JSONDecodeError, KeyError) as error:
+            logging.error(f"Ignoring unreadable checkpoint {self.path}: {error}")
+            return None
+
+    def save(self, seq: int | None) -> None:
+        """Atomically replaces the checkpoint, never moving it backwards"""
+        if seq is None or (self.seq is not None and seq <= self.seq):
+            return
+        temporary_path = f"{self.path}.tmp"
+        with open(temporary_path, "w", encoding="utf-8") as file:
+            json.dump({"seq": seq}, file)
+            file.flush()
+            os.fsync(file.fileno())
+        os.replace(temporary_path, self.path)
+        self.seq = seq
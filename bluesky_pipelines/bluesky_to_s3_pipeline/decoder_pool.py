@@ -0,0 +1,190 @@
+"""
+Multi-process firehose decoding: the websocket reader only receives raw frames,
+a pool of decoder processes runs the post/English filter, and a single
+collector feeds the results, in stream order, to BlueSkyFirehose.message_handling
+"""
+import os
+import time
+import logging
+import threading
+from multiprocessing import Pool
+from collections.abc import Callable, Iterable, Iterator
+from websockets.exceptions import WebSocketException
+from websockets.sync.client import connect
+from atproto import firehose_models, models, parse_subscribe_repos_message
+from extract import BlueSkyFirehose
+from metrics import METRICS
+from utilities import Message
+
+logging.basicConfig(
+    filename="pipeline.log",
+    filemode="a",
+    level=logging.INFO,
+    format="%(asctime)s - %(levelname)s - %(message)s"
+)
+
+FIREHOSE_URI = "wss://bsky.network/xrpc/com.atproto.sync.subscribeRepos"
+DECODER_WORKERS = 2
+CHUNK_SIZE = 50  # frames sent to a worker at a time
+FRAMES_IN_FLIGHT = 2000  # frames read but not yet collected
+STATS_INTERVAL = 60  # seconds
+
+
+def read_raw_frames(cursor: Callable[[], int | None] = lambda: None,
+                    uri: str = FIREHOSE_URI,
+                    on_connect: Callable[[int | None], None] = lambda seq: None) -> Iterator[bytes]:
+    """
+    Yields undecoded frames from the firehose websocket, reconnecting with
+    exponential backoff from the cursor returned by cursor() on disconnect.
+    on_connect is called with the cursor of every connection made
+    """
+    attempt = 0
+    while True:
+        seq = cursor()
+        url = uri if seq is None else f"{uri}?cursor={seq}"
+        try:
+            with connect(url, max_size=None) as websocket:
+                logging.info("Connected to firehose at %s", url)
+                on_connect(seq)
+                attempt = 0
+                for raw_frame in websocket:
+                    yield raw_frame
+        except (WebSocketException, OSError) as error:
+            attempt += 1
+            delay = BlueSkyFirehose.reconnect_delay(attempt)
+            logging.warning(
+                "Firehose connection lost (%s), reconnecting in %s seconds",
+                error, round(delay, 1))
+            time.sleep(delay)
+
+
+def decode_frame(raw_frame: bytes) -> tuple[int, float, int | None, int | None, list[bytes]]:
+    """
+    Runs in a decoder process. Decodes one raw frame and returns the worker
+    pid, the time spent decoding, the frame's sequence number, the number of
+    posts created (None if the frame was not a commit) and any English posts
+    as encoded message lines
+    """
+    time1 = time.perf_counter()
+    seq = None
+    post_count = None
+    posts = []
+    try:
+        frame = firehose_models.Frame.from_bytes(raw_frame)
+        if frame.is_message:
+            commit = parse_subscribe_repos_message(frame)
+            seq = getattr(commit, "seq", None)
+            if isinstance(commit, models.ComAtprotoSyncSubscribeRepos.Commit):
+                post_ops = BlueSkyFirehose.get_post_ops(commit)
+                post_count = len(post_ops)
+                posts = [Message(raw_message).encoded for raw_message
+                         in BlueSkyFirehose.get_english_posts(commit, post_ops)]
+    except Exception as error:
+        logging.error(f"Error occurred during frame decoding: {error}")
+    return os.getpid(), time.perf_counter() - time1, seq, post_count, posts
+
+
+class DecoderPool:
+    """Fans raw frames out to decoder processes and collects the posts in order"""
+
+    def __init__(self, firehose: BlueSkyFirehose, workers: int = DECODER_WORKERS,
+                 chunk_size: int = CHUNK_SIZE, frames_in_flight: int = FRAMES_IN_FLIGHT,
+                 decoder: Callable = decode_frame) -> None:
+        self.firehose = firehose
+        self.workers = workers
+        self.chunk_size = chunk_size
+        # the pool's feeder needs at least one full chunk per worker to make progress
+        self.frames_in_flight = max(frames_in_flight, chunk_size * workers)
+        self.decoder = decoder
+        self.worker_counters = {}
+        self._started = None
+        self._last_stats = None
+
+    @staticmethod
+    def _throttle(frames: Iterable[bytes], slots: threading.Semaphore,
+                  stopped: threading.Event) -> Iterator[bytes]:
+        """Stops the reader from running ahead of the collector"""
+        for raw_frame in frames:
+            while not slots.acquire(timeout=1):
+                if stopped.is_set():
+                    return
+            if stopped.is_set():
+                return
+            yield raw_frame
+
+    def _count(self, pid: int, decode_seconds: float,
+               post_count: int | None, posts: list) -> None:
+        counters = self.worker_counters.setdefault(
+            pid, {"frames": 0, "posts": 0, "decode_seconds": 0.0})
+        counters["frames"] += 1
+        counters["posts"] += len(posts)
+        counters["decode_seconds"] += decode_seconds
+
+        METRICS.increment("firehose_frames_total")
+        METRICS.observe("firehose_decode_seconds", decode_seconds)
+        if post_count is not None:
+            METRICS.increment("firehose_commits_total")
+            METRICS.increment("firehose_posts_total", post_count)
+            METRICS.increment("firehose_english_posts_total", len(posts))
+
+    def stats(self) -> dict:
+        """Per-worker throughput: frames and posts decoded, and frames/sec while busy"""
+        elapsed = time.time() - self._started if self._started else 0
+        return {
+            pid: {
+                **counters,
+                "frames_per_second": round(counters["frames"] / elapsed, 1) if elapsed else 0.0,
+                "busy_frames_per_second": round(
+                    counters["frames"] / counters["decode_seconds"], 1)
+                if counters["decode_seconds"] else 0.0
+            }
+            for pid, counters in self.worker_counters.items()
+        }
+
+    def _log_stats(self) -> None:
+        if time.time() - self._last_stats < STATS_INTERVAL:
+            return
+        self._last_stats = time.time()
+        for pid, counters in self.stats().items():
+            logging.info("Decoder %s: %s", pid, counters)
+
+    def run(self, frames: Iterable[bytes]) -> None:
+        """Decodes frames across the pool and passes each post on in stream order"""
+        self._started = self._last_stats = time.time()
+        slots = threading.BoundedSemaphore(self.frames_in_flight)
+        stopped = threading.Event()
+
+        with Pool(self.workers) as pool:
+            results = pool.imap(
+                self.decoder, self._throttle(frames, slots, stopped), self.chunk_size)
+            try:
+                self._collect(results, slots)
+            finally:
+                # lets the pool's feeder thread finish so the pool can shut down
+                stopped.set()
+
+    def _collect(self, results: Iterator[tuple], slots: threading.Semaphore) -> None:
+        """Feeds decoded posts to the firehose in stream order"""
+        for pid, decode_seconds, seq, post_count, posts in results:
+            slots.release()
+            self._count(pid, decode_seconds, post_count, posts)
+            last_seq = self.firehose.last_seq
+            if seq is not None and last_seq is not None and seq <= last_seq:
+                continue  # already collected before a reconnect
+            for post in posts:
+                self.firehose.handle_encoded(post)
+            self.firehose.track_seq(seq)
+            self._log_stats()
+
+    def start(self, frames: Iterable[bytes] | None = None) -> None:
+        """Starts the uploader and decodes the live firehose until it stops"""
+        logging.info("Starting firehose stream with %s decoder processes", self.workers)
+        self.firehose.uploader.start()
+        self.firehose.replay_spool()
+        try:
+            if frames is None:
+                frames = read_raw_frames(self.firehose.resume_cursor,
+                                         on_connect=self.firehose.expect_resume)
+            self.run(frames)
+        finally:
+            self.firehose.uploader.stop()
@@ -1,9 +1,17 @@
 """Extract script to read live data from the Bluesky firehose API"""
+import os
 import time
+import random
 import logging
+from functools import partial
+from collections.abc import Callable
 from atproto import FirehoseSubscribeReposClient, parse_subscribe_repos_message, CAR, models
 from utilities import Message
-from load_s3 import S3Loader
+from load_s3 import MemoryBatch, MultipartBatch, STREAM_UPLOADS
+from uploader import BatchUploader
+from spool import Segment, SegmentSpool, SPOOL_DIRECTORY
+from checkpoint import CursorCheckpoint
+from metrics import METRICS, COUNT_BUCKETS, SIZE_BUCKETS, serve_metrics
 
 logging.basicConfig(
     filename="pipeline.log",
@@ -13,70 +21,242 @@ logging.basicConfig(
 )
 
 TIME_PERIOD_LENGTH = 600  # seconds
+MAX_BATCH_BYTES = int(os.getenv("MAX_BATCH_BYTES", str(32 * 1024 * 1024)))
+POST_COLLECTION = "app.bsky.feed.post"
+DECODER_WORKERS = int(os.getenv("DECODER_WORKERS", "0"))  # 0 decodes in-process
+CURSOR_UPDATE_INTERVAL = 1000  # commits between client cursor updates
+RECONNECT_BASE_DELAY = 1  # seconds
+RECONNECT_MAX_DELAY = 300  # seconds
+LOG_SAMPLE_RATE = float(os.getenv("LOG_SAMPLE_RATE", "0"))  # share of posts logged
 
 
 class BlueSkyFirehose:
     """Tracks all Bluesky messages"""
 
-    def __init__(self) -> None:
+    def __init__(self, uploader: BatchUploader | None = None,
+                 spool: SegmentSpool | None = None,
+                 checkpoint: CursorCheckpoint | None = None,
+                 spool_directory: str | None = SPOOL_DIRECTORY) -> None:
         """its tuesday innit"""
-        self.client = FirehoseSubscribeReposClient()
+        self.checkpoint = checkpoint or CursorCheckpoint()
+        self.last_seq = None
+        self.resumed_from = None
+        self.unrecovered_events = 0
+        self.commits_since_cursor_update = 0
+        self.client = self.make_client(self.checkpoint.seq)
+        self.uploader = uploader or BatchUploader()
+        if spool is None and spool_directory:
+            spool = SegmentSpool(spool_directory)
+        self.spool = spool
+        self.unshipped = spool.recover() if spool is not None else []
         self.time_period_start = time.time()
-        self.json_list = []
+        self.batch = self.new_batch()
+
+    def expect_resume(self, cursor: int | None) -> None:
+        """Notes that the stream restarts after cursor, so track_seq reports any gap"""
+        self.resumed_from = cursor
+
+    def make_client(self, cursor: int | None) -> FirehoseSubscribeReposClient:
+        """Creates a firehose client resuming after the given sequence number"""
+        self.expect_resume(cursor)
+        if cursor is None:
+            return FirehoseSubscribeReposClient()
+        logging.info("Resuming firehose from cursor %s", cursor)
+        return FirehoseSubscribeReposClient({"cursor": cursor})
+
+    @staticmethod
+    def reconnect_delay(attempt: int) -> float:
+        """Exponential backoff with jitter for the nth failed connection"""
+        delay = min(RECONNECT_BASE_DELAY * 2 ** attempt, RECONNECT_MAX_DELAY)
+        return delay / 2 + random.uniform(0, delay / 2)
+
+    def track_seq(self, seq: int | None) -> None:
+        """
+        Records a fully processed sequence number, reporting any events the
+        relay could no longer replay after resuming from a cursor
+        """
+        if seq is None:
+            return
+        if self.resumed_from is not None and seq > self.resumed_from:
+            gap = seq - self.resumed_from - 1
+            if gap > 0:
+                self.unrecovered_events += gap
+                logging.warning(
+                    "Resumed from cursor %s but the stream restarted at %s, "
+                    "%s events could not be recovered", self.resumed_from, seq, gap)
+            self.resumed_from = None
+        self.last_seq = seq
+
+    def resume_cursor(self) -> int | None:
+        """The sequence number to resume after: the last one processed in this
+        run, or the saved checkpoint if nothing has been processed yet"""
+        return self.last_seq if self.last_seq is not None else self.checkpoint.seq
+
+    def _upload_then_checkpoint(self, job: Callable, seq: int | None) -> None:
+        """Runs an upload job and only then moves the saved cursor past its posts"""
+        job()
+        self.checkpoint.save(seq)
+
+    def seal_batch(self) -> None:
+        """Hands the current batch to the uploader and checkpoints once it is safe"""
+        job = self.batch.seal()
+        if self.spool is not None:
+            # a sealed segment is already durable, it is replayed if the upload fails
+            self.checkpoint.save(self.last_seq)
+            self.uploader.submit(job)
+        else:
+            # a streamed batch whose completing job is shed aborts its upload
+            self.uploader.submit(partial(self._upload_then_checkpoint, job, self.last_seq),
+                                 on_drop=getattr(self.batch, "abort", None))
+
+    def new_batch(self) -> MemoryBatch | MultipartBatch | Segment:
+        """
+        Starts a batch, written to an on-disk spool segment if a spool is 
+        configured, or streamed to S3 as it fills if STREAM_UPLOADS is set
+        """
+        if self.spool is not None:
+            return self.spool.new_segment()
+        if STREAM_UPLOADS:
+            return MultipartBatch(self.uploader.submit)
+        return MemoryBatch()
 
     def message_handling(self, message: Message) -> bool:
+        """Adds a message to the current batch, see handle_encoded"""
+        return self.handle_encoded(message.encoded)
+
+    def handle_encoded(self, line: bytes) -> bool:
         """
         manages the messages, if it's been 10 minutes since last 
-        upload (time_period_start) then upload current batch of 
-        jsons and reset json_list if not then just add the new message 
-        json to the list
+        upload (time_period_start) or the batch has reached MAX_BATCH_BYTES
+        then seal the current batch, hand it to the background uploader 
+        and start a new one if not then just add the encoded message line to the batch
         """
         try:
-            self.json_list.append(message.json)
+            self.batch.append(line)
             current_time = time.time()
-            if current_time-self.time_period_start < TIME_PERIOD_LENGTH:
+            if current_time-self.time_period_start < TIME_PERIOD_LENGTH \
+                    and self.batch.size_bytes < MAX_BATCH_BYTES:
                 return False
             logging.info(
-                f"Uploading to s3 json of length {len(self.json_list)}")
-            S3Loader.load_to_s3(self.json_list)
-            # S3Loader.download_json(self.json_list)
+                f"Queueing batch of length {len(self.batch)} for upload, "
+                f"uploader stats: {self.uploader.stats()}")
+            METRICS.observe("batch_posts", len(self.batch), COUNT_BUCKETS)
+            METRICS.observe("batch_bytes", self.batch.size_bytes, SIZE_BUCKETS)
+            self.seal_batch()
             self.time_period_start = current_time
-            self.json_list = []
+            self.batch = self.new_batch()
             return True
         except Exception as error:
             logging.error(f"Error occurred during message handling: {error}")
 
-    def extract_message(self, message) -> None:
-        """Reads a message from the stream and prints the raw output if it is a post"""
+    @staticmethod
+    def get_post_ops(commit) -> list:
+        """
+        Returns the ops in a commit that create a post, judged from the op
+        path alone so that commits without posts never need their blocks decoded
+        """
+        return [op for op in commit.ops
+                if op.action == "create" and op.cid
+                and op.path.startswith(f"{POST_COLLECTION}/")]
+
+    @staticmethod
+    def get_english_posts(commit, post_ops: list | None = None) -> list[dict]:
+        """Decodes the posts created in a commit and returns the English ones"""
+        if post_ops is None:
+            post_ops = BlueSkyFirehose.get_post_ops(commit)
+        if not post_ops:
+            return []
+
+        car = CAR.from_bytes(commit.blocks)
 
+        posts = []
+        for op in post_ops:
+            raw_message = car.blocks.get(op.cid)
+            if not raw_message:
+                continue
+            if raw_message.get("$type") == POST_COLLECTION \
+                and raw_message.get("langs") \
+                    and "en" in raw_message.get("langs"):
+                posts.append(raw_message)
+        return posts
+
+    @staticmethod
+    def log_sampled(raw_message: dict) -> None:
+        """Logs an English post for LOG_SAMPLE_RATE of the posts found"""
+        if LOG_SAMPLE_RATE and random.random() < LOG_SAMPLE_RATE:
+            logging.info("English message found: %s", raw_message.get("text"))
+
+    def extract_message(self, message) -> None:
+        """Reads a message from the stream and adds it to the batch if it is an English post"""
+        time1 = time.perf_counter()
+        METRICS.increment("firehose_frames_total")
         commit = parse_subscribe_repos_message(message)
 
+        if isinstance(commit, models.ComAtprotoSyncSubscribeRepos.Info):
+            logging.warning("Firehose info: %s %s", commit.name, commit.message)
+            return
+
         if not isinstance(commit, models.ComAtprotoSyncSubscribeRepos.Commit):
+            self.track_seq(getattr(commit, "seq", None))
             return
 
+        if self.last_seq is not None and commit.seq <= self.last_seq:
+            return  # replayed by the client reconnecting from its last cursor update
+
+        METRICS.increment("firehose_commits_total")
         try:
-            car = CAR.from_bytes(commit.blocks)
-
-            for op in commit.ops:
-                if op.action == "create" and op.cid:
-                    print("Compiling posts...", end="\r")
-                    raw_message = car.blocks.get(op.cid)
-                    if not raw_message:
-                        continue
-                    if raw_message.get("$type") == "app.bsky.feed.post" \
-                        and raw_message.get("langs") \
-                            and "en" in raw_message.get("langs"):
-                        self.message_handling(Message(raw_message))
-                        logging.info("English message found")
+            post_ops = self.get_post_ops(commit)
+            english_posts = self.get_english_posts(commit, post_ops)
+            METRICS.observe("firehose_decode_seconds", time.perf_counter() - time1)
+            METRICS.increment("firehose_posts_total", len(post_ops))
+            METRICS.increment("firehose_english_posts_total", len(english_posts))
+            for raw_message in english_posts:
+                self.message_handling(Message(raw_message))
+                self.log_sampled(raw_message)
         except Exception as error:
             logging.error(f"Error occurred during message extraction: {error}")
 
+        self.track_seq(commit.seq)
+        self.commits_since_cursor_update += 1
+        if self.commits_since_cursor_update >= CURSOR_UPDATE_INTERVAL:
+            # the client reconnects internally, keep it from rewinding to the start cursor
+            self.client.update_params({"cursor": commit.seq})
+            self.commits_since_cursor_update = 0
+
+    def replay_spool(self) -> None:
+        """Queues any segments a previous run did not manage to ship"""
+        while self.unshipped:
+            self.uploader.submit(self.unshipped.pop(0))
+
     def start(self) -> None:
-        """Starts the firehose stream"""
+        """
+        Starts the firehose stream, reconnecting with exponential backoff
+        from the last processed sequence number whenever the client fails
+        """
         logging.info("Starting firehose stream")
-        self.client.start(self.extract_message)
+        self.uploader.start()
+        self.replay_spool()
+        attempt = 0
+        try:
+            while True:
+                seq_before = self.last_seq
+                try:
+                    self.client.start(self.extract_message)
+                    return
+                except Exception as error:
+                    logging.error(f"Firehose client failed: {error}")
+                attempt = 0 if self.last_seq != seq_before else attempt + 1
+                time.sleep(self.reconnect_delay(attempt))
+                self.client = self.make_client(self.resume_cursor())
+        finally:
+            self.uploader.stop()
 
 
 if __name__ == "__main__":
+    serve_metrics()
     firehose = BlueSkyFirehose()
-    firehose.start()
+    if DECODER_WORKERS:
+        from decoder_pool import DecoderPool  # pylint: disable=C0415
+        DecoderPool(firehose, workers=DECODER_WORKERS).start()
+    else:
+        firehose.start()
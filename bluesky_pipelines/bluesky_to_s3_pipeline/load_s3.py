@@ -1,13 +1,22 @@
 """Script to upload Message objects to the S3 bucket."""
 import os
 import json
-from datetime import datetime
+import gzip
+import zlib
+from datetime import datetime, timezone
+from functools import partial
+from contextlib import contextmanager
+from collections.abc import Callable
 import time
 import uuid
 import logging
+import threading
 import boto3
+import zstandard
+from botocore.exceptions import ClientError
 from dotenv import load_dotenv
 from utilities import Message
+from metrics import METRICS, SIZE_BUCKETS
 
 
 logging.basicConfig(
@@ -21,10 +30,32 @@ load_dotenv()
 
 BUCKET_NAME = 'c18-trend-getter-s3'
 FILE_PATH = 'bluesky/raw_posts/'
+PARTITION_FORMAT = "%Y/%m/%d/%H/"  # UTC hour the batch was started in
+MANIFEST_PATH = 'bluesky/manifests/'  # outside FILE_PATH so it never triggers the ETL
+LATEST_MANIFEST = f"{MANIFEST_PATH}latest.json"
+MANIFEST_HOURS_KEPT = 2  # hourly manifests held in memory
+
+JSON = "json"  # legacy single json array
+NDJSON_GZIP = "ndjson.gz"
+NDJSON_ZSTD = "ndjson.zst"
+OUTPUT_FORMATS = {
+    JSON: {"ContentType": "application/json"},
+    NDJSON_GZIP: {"ContentType": "application/x-ndjson", "ContentEncoding": "gzip"},
+    NDJSON_ZSTD: {"ContentType": "application/x-ndjson", "ContentEncoding": "zstd"},
+}
+OUTPUT_FORMAT = os.getenv("OUTPUT_FORMAT", JSON)
+
+STREAM_UPLOADS = os.getenv("STREAM_UPLOADS", "false").lower() == "true"
+STREAM_FORMAT = NDJSON_ZSTD if OUTPUT_FORMAT == NDJSON_ZSTD else NDJSON_GZIP
+# compressed bytes, S3 needs at least 5 MiB for every part but the last. A
+# 10-minute window is about 4 MB gzipped, so it fits one part at this size.
+PART_SIZE = 5 * 1024 * 1024
 
 
 class S3Loader:
     """Static methods used to load a Message object to the S3"""
+    _client = None  # set by using_client
+
     @staticmethod
     def random_string() -> str:
         """Generates a universally unique identifier (UUID) for use as a unique filename."""
@@ -36,25 +67,87 @@ class S3Loader:
         return date.strftime("%d-%m-%YT%H-%M-%S")
 
     @staticmethod
-    def load_to_s3(data: list[dict]):
-        """Uploads message object to the S3 as a JSON."""
-        time1 = time.time()
+    def make_filename(output_format: str = OUTPUT_FORMAT) -> str:
+        """Builds a unique filename for a batch in the given output format."""
+        return (f"{S3Loader.random_string()}--"
+                f"{S3Loader.format_date(datetime.now())}.{output_format}")
+
+    @staticmethod
+    def make_key(output_format: str = OUTPUT_FORMAT, started: datetime | None = None) -> str:
+        """Builds the S3 key for a batch, under the UTC date/hour partition it started in."""
+        started = started or datetime.now(timezone.utc)
+        return (f"{FILE_PATH}{started.strftime(PARTITION_FORMAT)}"
+                f"{S3Loader.make_filename(output_format)}")
+
+    @staticmethod
+    @contextmanager
+    def using_client(client):
+        """Sends every upload made inside the block to client instead of S3,
+        e.g. a local directory for replays."""
+        previous = S3Loader._client
+        S3Loader._client = client
+        try:
+            yield client
+        finally:
+            S3Loader._client = previous
+
+    @staticmethod
+    def get_client():
+        """Returns an S3 client using the credentials in the environment,
+        or the client set by using_client."""
+        if S3Loader._client is not None:
+            return S3Loader._client
         session = boto3.Session(
             aws_access_key_id=os.getenv("AWS_ACCESS_KEY_ID"),
             aws_secret_access_key=os.getenv("AWS_SECRET_ACCESS_KEY"),
             region_name=os.getenv("AWS_DEFAULT_REGION", "eu-west-2")
         )
+        return session.client("s3")
 
-        client = session.client("s3")
+    @staticmethod
+    def encode(data: list[dict] | bytes, output_format: str = OUTPUT_FORMAT) -> str | bytes:
+        """
+        Serialises a batch in the given output format. The batch is either a
+        list of message jsons or a buffer of already encoded NDJSON lines.
+        """
+        if isinstance(data, (bytes, bytearray)):
+            ndjson = bytes(data)
+            if output_format == JSON:
+                # json.dumps escapes newlines inside strings, so every newline ends a line
+                return b"[" + ndjson.rstrip(b"\n").replace(b"\n", b",") + b"]"
+        elif output_format == JSON:
+            return json.dumps(data)
+        else:
+            ndjson = "".join(f"{json.dumps(item)}\n" for item in data).encode("utf-8")
 
-        filename = f"{S3Loader.random_string()}--{S3Loader.format_date(datetime.now())}.json"
+        if output_format == NDJSON_GZIP:
+            return gzip.compress(ndjson)
+        if output_format == NDJSON_ZSTD:
+            return zstandard.ZstdCompressor().compress(ndjson)
+        raise ValueError(f"Unknown output format: {output_format}")
+
+    @staticmethod
+    def load_to_s3(data: list[dict] | bytes, output_format: str = OUTPUT_FORMAT,
+                   started: datetime | None = None):
+        """
+        Uploads message object to the S3 in the given output format, under
+        the partition of the hour the batch was started in, or of now.
+        """
+        time1 = time.time()
+        client = S3Loader.get_client()
+        key = S3Loader.make_key(output_format, started)
+        filename = key.rsplit("/", 1)[-1]
+        body = S3Loader.encode(data, output_format)
 
         client.put_object(
             Bucket=BUCKET_NAME,
-            Key=f'{FILE_PATH}{filename}',
-            Body=json.dumps(data),
-            ContentType='application/json'
+            Key=key,
+            Body=body,
+            **OUTPUT_FORMATS[output_format]
         )
+        METRICS.observe("upload_bytes", len(body), SIZE_BUCKETS)
+        posts = data.count(b"\n") if isinstance(data, (bytes, bytearray)) else len(data)
+        MANIFEST.record(client, key, posts, len(body))
 
         time2 = time.time()
         logging.info(
@@ -75,6 +168,220 @@ class S3Loader:
         logging.info("%s saved", filename)
 
 
+class BatchManifest:
+    """
+    Hourly manifests listing the batches sealed into each partition, and a
+    pointer to the newest batch, so readers find new batches with a few GETs
+    instead of listing the whole prefix. Only the uploader thread writes it.
+    """
+
+    def __init__(self) -> None:
+        self._hours = {}
+        self._lock = threading.Lock()
+
+    def reset(self) -> None:
+        """Forgets the hours held in memory, so the next record reads them from the bucket"""
+        with self._lock:
+            self._hours.clear()
+
+    @staticmethod
+    def manifest_key(key: str) -> str:
+        """The manifest covering the partition a batch key is in"""
+        partition = key.removeprefix(FILE_PATH).rsplit("/", 1)[0]
+        return f"{MANIFEST_PATH}{partition}/manifest.json"
+
+    @staticmethod
+    def _load(client, manifest_key: str) -> list[dict]:
+        """Reads the batches already listed for an hour, e.g. by a previous run"""
+        try:
+            response = client.get_object(Bucket=BUCKET_NAME, Key=manifest_key)
+        except ClientError as error:
+            if error.response.get("Error", {}).get("Code") in ("NoSuchKey", "404"):
+                return []
+            raise
+        return json.loads(response["Body"].read())["batches"]
+
+    def record(self, client, key: str, posts: int, size_bytes: int) -> None:
+        """
+        Adds a freshly uploaded batch to its hour's manifest and points latest
+        at it. A failure is only logged, readers fall back to listing the partition.
+        """
+        manifest_key = self.manifest_key(key)
+        entry = {"key": key, "posts": posts, "bytes": size_bytes,
+                 "sealed_at": datetime.now(timezone.utc).isoformat()}
+        try:
+            with self._lock:
+                batches = self._hours.get(manifest_key)
+                if batches is None:
+                    batches = self._hours[manifest_key] = self._load(client, manifest_key)
+                    while len(self._hours) > MANIFEST_HOURS_KEPT:
+                        self._hours.pop(next(iter(self._hours)))
+                batches.append(entry)
+                client.put_object(
+                    Bucket=BUCKET_NAME, Key=manifest_key,
+                    Body=json.dumps({"batches": batches}),
+                    ContentType="application/json")
+                client.put_object(
+                    Bucket=BUCKET_NAME, Key=LATEST_MANIFEST,
+                    Body=json.dumps({**entry, "manifest": manifest_key}),
+                    ContentType="application/json")
+        except Exception as error:
+            logging.error(f"Error occurred updating the manifest for {key}: {error}")
+
+
+MANIFEST = BatchManifest()
+
+
+class MemoryBatch:
+    """
+    A batch of encoded NDJSON lines held in one growing buffer and uploaded
+    in one go when sealed, so sealing is a copy rather than a re-serialisation
+    """
+
+    def __init__(self, output_format: str = OUTPUT_FORMAT) -> None:
+        self.output_format = output_format
+        self.started = datetime.now(timezone.utc)
+        self.count = 0
+        self._buffer = bytearray()
+
+    def __len__(self) -> int:
+        return self.count
+
+    @property
+    def size_bytes(self) -> int:
+        """Size of the encoded lines in the batch"""
+        return len(self._buffer)
+
+    def append(self, line: bytes) -> None:
+        """Adds an encoded message line to the batch"""
+        self._buffer += line
+        self.count += 1
+
+    def seal(self) -> Callable:
+        """Returns the upload job for the finished batch"""
+        return partial(S3Loader.load_to_s3, bytes(self._buffer), self.output_format, self.started)
+
+
+class MultipartBatch:
+    """
+    A batch streamed to S3 with a multipart upload while messages arrive.
+    Messages are compressed as they are appended and every PART_SIZE of
+    output is handed to submit as a part upload job, so memory stays flat
+    whatever the window length. Each part is a complete gzip member or
+    zstd frame, so the finished object is still a valid compressed NDJSON file.
+    If any part or the completing job is lost the upload is aborted rather
+    than completed, as a batch missing parts would still decode.
+    """
+
+    def __init__(self, submit: Callable[[Callable], bool],
+                 output_format: str = STREAM_FORMAT, part_size: int = PART_SIZE) -> None:
+        if output_format not in (NDJSON_GZIP, NDJSON_ZSTD):
+            raise ValueError(
+                f"Streaming uploads need a compressed NDJSON format, not {output_format}")
+        self.submit = submit
+        self.output_format = output_format
+        self.part_size = part_size
+        self.key = S3Loader.make_key(output_format)
+        self.count = 0
+        self.size_bytes = 0
+        self.stored_bytes = 0
+        self._compressor = self._new_compressor()
+        self._buffer = bytearray()
+        self._part_number = 0
+        self._parts = {}
+        self._lock = threading.Lock()
+        self._client = None
+        self._upload_id = None
+        self._aborted = False
+
+    def __len__(self) -> int:
+        return self.count
+
+    def _new_compressor(self):
+        if self.output_format == NDJSON_GZIP:
+            return zlib.compressobj(wbits=31)
+        return zstandard.ZstdCompressor().compressobj()
+
+    def _finish_member(self) -> None:
+        """Closes the current gzip member or zstd frame and starts a new one"""
+        self._buffer += self._compressor.flush()
+        self._compressor = self._new_compressor()
+
+    def append(self, line: bytes) -> None:
+        """Compresses an encoded message line into the batch, submitting a part when one is full"""
+        self.count += 1
+        self.size_bytes += len(line)
+        self._buffer += self._compressor.compress(line)
+        if len(self._buffer) >= self.part_size:
+            self._finish_member()
+            self._submit_part()
+
+    def _submit_part(self) -> None:
+        self._part_number += 1
+        data = bytes(self._buffer)
+        self._buffer = bytearray()
+        self.stored_bytes += len(data)
+        self.submit(partial(self._upload_part, self._part_number, data))
+
+    def _start_upload(self) -> None:
+        """Creates the multipart upload, runs on the uploader thread"""
+        if self._aborted:
+            raise RuntimeError(f"The upload of {self.key} was aborted")
+        if self._upload_id is None:
+            self._client = S3Loader.get_client()
+            response = self._client.create_multipart_upload(
+                Bucket=BUCKET_NAME, Key=self.key, **OUTPUT_FORMATS[self.output_format])
+            self._upload_id = response["UploadId"]
+
+    def _upload_part(self, part_number: int, data: bytes) -> None:
+        """Uploads one part, runs on the uploader thread"""
+        with self._lock:
+            self._start_upload()
+            upload_id = self._upload_id
+        response = self._client.upload_part(
+            Bucket=BUCKET_NAME, Key=self.key, UploadId=upload_id,
+            PartNumber=part_number, Body=data)
+        METRICS.observe("upload_bytes", len(data), SIZE_BUCKETS)
+        with self._lock:
+            self._parts[part_number] = response["ETag"]
+
+    def abort(self) -> None:
+        """
+        Aborts the multipart upload so S3 drops the parts already stored, and
+        stops any parts still queued from starting it again
+        """
+        with self._lock:
+            self._aborted = True
+            upload_id, self._upload_id = self._upload_id, None
+        if upload_id is not None:
+            self._client.abort_multipart_upload(
+                Bucket=BUCKET_NAME, Key=self.key, UploadId=upload_id)
+            logging.error("Aborted the upload of %s", self.key)
+
+    def _complete(self, part_count: int) -> str:
+        """Completes the multipart upload, runs on the uploader thread"""
+        missing = part_count - len(self._parts)
+        if missing or self._aborted:
+            self.abort()
+            raise RuntimeError(f"{missing} parts of {self.key} were not uploaded")
+
+        self._client.complete_multipart_upload(
+            Bucket=BUCKET_NAME, Key=self.key, UploadId=self._upload_id,
+            MultipartUpload={"Parts": [
+                {"PartNumber": number, "ETag": etag}
+                for number, etag in sorted(self._parts.items())]})
+        logging.info("%s uploaded to %s in %s parts",
+                     self.key, BUCKET_NAME, len(self._parts))
+        MANIFEST.record(self._client, self.key, self.count, self.stored_bytes)
+        return self.key
+
+    def seal(self) -> Callable:
+        """Submits the final part and returns the job completing the upload"""
+        self._finish_member()
+        self._submit_part()
+        return partial(self._complete, self._part_number)
+
+
 if __name__ == "__main__":
     message = Message({
         'text': 'I love donald trump and cooking and photography',
@@ -0,0 +1,196 @@
+"""
+In-memory ingest metrics for the firehose extractor, served over HTTP in the
+Prometheus text format (/metrics) and as json (/metrics.json), so the hot
+path only bumps counters instead of writing a log line per post.
+"""
+import os
+import json
+import time
+import logging
+import threading
+from bisect import bisect_left
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+logging.basicConfig(
+    filename="pipeline.log",
+    filemode="a",
+    level=logging.INFO,
+    format="%(asctime)s - %(levelname)s - %(message)s"
+)
+
+METRICS_HOST = os.getenv("METRICS_HOST", "127.0.0.1")
+METRICS_PORT = int(os.getenv("METRICS_PORT", "9108"))  # 0 disables the endpoint
+
+LATENCY_BUCKETS = (0.0001, 0.00025, 0.0005, 0.001, 0.0025, 0.005, 0.01,
+                   0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60)  # seconds
+SIZE_BUCKETS = tuple(1024 * 4 ** power for power in range(10))  # 1 KiB to 256 MiB
+COUNT_BUCKETS = (10, 100, 1000, 5000, 10000, 25000, 50000, 100000, 250000)
+
+DESCRIPTIONS = {
+    "firehose_frames_total": "Frames read from the firehose",
+    "firehose_commits_total": "Commit frames read from the firehose",
+    "firehose_posts_total": "Posts created in commits",
+    "firehose_english_posts_total": "English posts added to a batch",
+    "firehose_english_ratio": "Share of posts that were English",
+    "firehose_decode_seconds": "Time spent decoding one frame",
+    "batch_posts": "Posts in a sealed batch",
+    "batch_bytes": "Encoded bytes in a sealed batch",
+    "upload_seconds": "Time spent running one upload job",
+    "upload_bytes": "Bytes sent to S3 by one request",
+    "upload_queue_depth": "Upload jobs waiting for the uploader thread",
+}
+
+
+class Histogram:
+    """Cumulative bucket counts, sum and count of observed values"""
+
+    def __init__(self, buckets: tuple) -> None:
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)  # the last slot is +Inf
+        self.sum = 0.0
+        self.count = 0
+
+    def observe(self, value: float) -> None:
+        """Adds a value to the first bucket it fits in"""
+        self.counts[bisect_left(self.buckets, value)] += 1
+        self.sum += value
+        self.count += 1
+
+    def cumulative(self) -> list[tuple[str, int]]:
+        """Bucket upper bounds paired with the number of values at or below them"""
+        total = 0
+        pairs = []
+        for bound, count in zip([*self.buckets, "+Inf"], self.counts):
+            total += count
+            pairs.append((str(bound), total))
+        return pairs
+
+
+class Metrics:
+    """Thread-safe registry of counters, gauges and histograms"""
+
+    def __init__(self) -> None:
+        self._lock = threading.Lock()
+        self.started = time.time()
+        self.counters = {}
+        self.gauges = {}
+        self.histograms = {}
+
+    def increment(self, name: str, amount: int = 1) -> None:
+        """Adds to a counter"""
+        with self._lock:
+            self.counters[name] = self.counters.get(name, 0) + amount
+
+    def set_gauge(self, name: str, value: float) -> None:
+        """Sets a gauge to its current value"""
+        with self._lock:
+            self.gauges[name] = value
+
+    def observe(self, name: str, value: float, buckets: tuple = LATENCY_BUCKETS) -> None:
+        """Records a value in a histogram, created with the given buckets on first use"""
+        with self._lock:
+            histogram = self.histograms.get(name)
+            if histogram is None:
+                histogram = self.histograms[name] = Histogram(buckets)
+            histogram.observe(value)
+
+    def reset(self) -> None:
+        """Clears every metric, used between benchmark runs and tests"""
+        with self._lock:
+            self.started = time.time()
+            self.counters.clear()
+            self.gauges.clear()
+            self.histograms.clear()
+
+    def _derived(self) -> dict:
+        """English ratio and per-second rates since the metrics were started"""
+        elapsed = time.time() - self.started
+        posts = self.counters.get("firehose_posts_total", 0)
+        derived = {
+            "firehose_english_ratio": round(
+                self.counters.get("firehose_english_posts_total", 0) / posts, 4)
+            if posts else 0.0
+        }
+        for name in ("frames", "commits", "posts", "english_posts"):
+            count = self.counters.get(f"firehose_{name}_total", 0)
+            derived[f"firehose_{name}_per_second"] = round(count / elapsed, 1) if elapsed else 0.0
+        return derived
+
+    def snapshot(self) -> dict:
+        """Every metric as plain json, with histograms reduced to count, sum and mean"""
+        with self._lock:
+            return {
+                "uptime_seconds": round(time.time() - self.started, 1),
+                **self.counters,
+                **self.gauges,
+                **self._derived(),
+                **{
+                    name: {"count": histogram.count, "sum": round(histogram.sum, 6),
+                           "mean": round(histogram.sum / histogram.count, 6)
+                           if histogram.count else 0.0}
+                    for name, histogram in self.histograms.items()
+                },
+            }
+
+    def render(self) -> str:
+        """Every metric in the Prometheus text exposition format"""
+        lines = []
+
+        def header(name: str, kind: str) -> None:
+            if name in DESCRIPTIONS:
+                lines.append(f"# HELP {name} {DESCRIPTIONS[name]}")
+            lines.append(f"# TYPE {name} {kind}")
+
+        with self._lock:
+            for name, value in sorted(self.counters.items()):
+                header(name, "counter")
+                lines.append(f"{name} {value}")
+            gauges = {**self.gauges,
+                      "firehose_english_ratio": self._derived()["firehose_english_ratio"]}
+            for name, value in sorted(gauges.items()):
+                header(name, "gauge")
+                lines.append(f"{name} {value}")
+            for name, histogram in sorted(self.histograms.items()):
+                header(name, "histogram")
+                for bound, count in histogram.cumulative():
+                    lines.append(f'{name}_bucket{{le="{bound}"}} {count}')
+                lines.append(f"{name}_sum {histogram.sum}")
+                lines.append(f"{name}_count {histogram.count}")
+        return "\n".join(lines) + "\n"
+
+
+METRICS = Metrics()
+
+
+class MetricsHandler(BaseHTTPRequestHandler):
+    """Serves METRICS at /metrics and /metrics.json"""
+
+    def do_GET(self) -> None:  # pylint: disable=C0103
+        """Answers a scrape"""
+        if self.path == "/metrics":
+            body = METRICS.render().encode("utf-8")
+            content_type = "text/plain; version=0.0.4"
+        elif self.path == "/metrics.json":
+            body = json.dumps(METRICS.snapshot()).encode("utf-8")
+            content_type = "application/json"
+        else:
+            self.send_error(404)
+            return
+        self.send_response(200)
+        self.send_header("Content-Type", content_type)
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args) -> None:  # pylint: disable=W0622
+        """Keeps scrapes out of pipeline.log"""
+
+
+def serve_metrics(host: str = METRICS_HOST, port: int = METRICS_PORT) -> ThreadingHTTPServer | None:
+    """Starts the metrics endpoint on a daemon thread, unless port is 0"""
+    if not port:
+        return None
+    server = ThreadingHTTPServer((host, port), MetricsHandler)
+    threading.Thread(target=server.serve_forever, name="metrics", daemon=True).start()
+    logging.info("Serving metrics on http://%s:%s/metrics", host, server.server_port)
+    return server
@@ -0,0 +1,271 @@
+"""
+Record-and-replay harness for the firehose consumer, so the ingest path can be
+benchmarked without the live network.
+
+Record raw frames from the live firehose:
+    python3 replay.py record frames.bin --frames 20000
+Generate a synthetic corpus instead:
+    python3 replay.py synthesize frames.bin --frames 20000
+Replay a corpus into BlueSkyFirehose.extract_message at 1x, Nx or max speed,
+uploading batches to a local directory instead of S3:
+    python3 replay.py replay frames.bin --speed max --output replay_output
+"""
+import io
+import os
+import sys
+import json
+import time
+import uuid
+import random
+import struct
+import hashlib
+import argparse
+import threading
+import libipld
+from websockets.sync.client import connect
+from atproto import firehose_models
+from extract import BlueSkyFirehose, POST_COLLECTION
+from botocore.exceptions import ClientError
+from load_s3 import S3Loader, MANIFEST, MANIFEST_PATH
+from uploader import BatchUploader, BLOCK
+from checkpoint import CursorCheckpoint
+from metrics import METRICS
+
+FIREHOSE_URI = "wss://bsky.network/xrpc/com.atproto.sync.subscribeRepos"
+FRAME_HEADER = struct.Struct(">dI")  # received timestamp, frame length
+
+SYNTHETIC_RATE = 1000  # frames per second of recorded time
+SYNTHETIC_KINDS = {POST_COLLECTION: 1, "app.bsky.feed.like": 6,
+                   "app.bsky.graph.follow": 2, "app.bsky.feed.repost": 1}
+SYNTHETIC_LANGS = ("en", "ja", "pt", "de")
+
+
+def write_frame(file, frame: bytes, received_at: float) -> None:
+    """Appends one raw frame to an open corpus file"""
+    file.write(FRAME_HEADER.pack(received_at, len(frame)))
+    file.write(frame)
+
+
+def read_frames(path: str):
+    """Yields (received_at, raw frame) pairs from a corpus file"""
+    with open(path, "rb") as file:
+        while header := file.read(FRAME_HEADER.size):
+            received_at, length = FRAME_HEADER.unpack(header)
+            yield received_at, file.read(length)
+
+
+def record(path: str, frame_count: int) -> None:
+    """Records raw frames from the live firehose into a corpus file"""
+    with connect(FIREHOSE_URI, max_size=None) as websocket, open(path, "wb") as file:
+        for _ in range(frame_count):
+            write_frame(file, websocket.recv(), time.time())
+    print(f"Recorded {frame_count} frames to {path}")
+
+
+def _varint(number: int) -> bytes:
+    output = bytearray()
+    while True:
+        byte = number & 0x7f
+        number >>= 7
+        if not number:
+            output.append(byte)
+            return bytes(output)
+        output.append(byte | 0x80)
+
+
+def _car(records: list[dict]) -> tuple[bytes, list[str]]:
+    """Encodes records as a CAR file, returning it with the records' CIDs"""
+    blocks = [libipld.encode_dag_cbor(item) for item in records]
+    cids = [bytes([0x01, 0x71, 0x12, 0x20]) + hashlib.sha256(block).digest()
+            for block in blocks]
+    header = libipld.encode_dag_cbor(
+        {"version": 1, "roots": [libipld.encode_cid(cids[0])]})
+    car = _varint(len(header)) + header
+    for cid, block in zip(cids, blocks):
+        car += _varint(len(cid) + len(block)) + cid + block
+    return car, [libipld.encode_cid(cid) for cid in cids]
+
+
+def synthetic_frame(seq: int, rng: random.Random) -> bytes:
+    """
+    Builds a commit frame creating one record, with the mix of collections
+    and languages roughly as seen on the live firehose
+    """
+    collection = rng.choices(list(SYNTHETIC_KINDS), list(SYNTHETIC_KINDS.values()))[0]
+    created_at = "2025-08-04T12:23:52.000Z"
+    if collection == POST_COLLECTION:
+        new_record = {"$type": collection, "text": f"post {seq} about football",
+                      "langs": [rng.choice(SYNTHETIC_LANGS)], "createdAt": created_at}
+    else:
+        new_record = {"$type": collection, "createdAt": created_at,
+                      "subject": "at://did:plc:abc/app.bsky.feed.post/3l"}
+    blocks, cids = _car([new_record] + [{"node": "x" * 200, "n": n} for n in range(8)])
+    body = {"seq": seq, "rebase": False, "tooBig": False, "repo": "did:plc:abc",
+            "commit": cids[1], "rev": "3l", "since": None, "blocks": blocks,
+            "ops": [{"action": "create", "path": f"{collection}/3l{seq}", "cid": cids[0]}],
+            "blobs": [], "time": created_at}
+    return libipld.encode_dag_cbor({"op": 1, "t": "#commit"}) + libipld.encode_dag_cbor(body)
+
+
+def synthesize(path: str, frame_count: int, rate: float = SYNTHETIC_RATE,
+               seed: int = 0) -> None:
+    """Writes a reproducible synthetic corpus received at rate frames per second"""
+    rng = random.Random(seed)
+    started = time.time()
+    with open(path, "wb") as file:
+        for seq in range(frame_count):
+            write_frame(file, synthetic_frame(seq, rng), started + seq / rate)
+
+
+class LocalS3Client:  # pylint: disable=C0103
+    """
+    Stand-in for the boto3 S3 client that writes objects under a local
+    directory, counting every object but the manifests as uploaded
+    """
+
+    def __init__(self, directory: str) -> None:
+        self.directory = directory
+        self.objects = 0
+        self.bytes = 0
+        self._uploads = {}
+        self._lock = threading.Lock()
+
+    def _write(self, bucket: str, key: str, body: bytes | str) -> None:
+        if isinstance(body, str):
+            body = body.encode("utf-8")
+        path = os.path.join(self.directory, bucket, key)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        with open(path, "wb") as file:
+            file.write(body)
+        if not key.startswith(MANIFEST_PATH):
+            with self._lock:
+                self.objects += 1
+                self.bytes += len(body)
+
+    def get_object(self, Bucket: str, Key: str, **_) -> dict:
+        """Reads a whole object, raising NoSuchKey like S3 if it does not exist"""
+        try:
+            with open(os.path.join(self.directory, Bucket, Key), "rb") as file:
+                return {"Body": io.BytesIO(file.read())}
+        except FileNotFoundError as error:
+            raise ClientError({"Error": {"Code": "NoSuchKey"}}, "GetObject") from error
+
+    def put_object(self, Bucket: str, Key: str, Body: bytes | str, **_) -> dict:
+        """Writes a whole object"""
+        self._write(Bucket, Key, Body)
+        return {}
+
+    def create_multipart_upload(self, **_) -> dict:
+        """Starts collecting the parts of an object"""
+        upload_id = uuid.uuid4().hex
+        with self._lock:
+            self._uploads[upload_id] = {}
+        return {"UploadId": upload_id}
+
+    def upload_part(self, UploadId: str, PartNumber: int, Body: bytes, **_) -> dict:
+        """Holds one part until the upload is completed"""
+        with self._lock:
+            self._uploads[UploadId][PartNumber] = Body
+        return {"ETag": f'"{PartNumber}"'}
+
+    def complete_multipart_upload(self, Bucket: str, Key: str, UploadId: str, **_) -> dict:
+        """Writes the parts out as one object"""
+        with self._lock:
+            parts = self._uploads.pop(UploadId)
+        self._write(Bucket, Key, b"".join(parts[number] for number in sorted(parts)))
+        return {}
+
+    def abort_multipart_upload(self, UploadId: str, **_) -> dict:
+        """Discards the parts of an upload"""
+        with self._lock:
+            self._uploads.pop(UploadId, None)
+        return {}
+
+
+def replay(path: str, speed: float | None = None, output: str = "replay_output") -> dict:
+    """
+    Feeds a corpus into a fresh BlueSkyFirehose, spaced as recorded and sped
+    up by speed, or as fast as possible if speed is None. Batches are uploaded
+    to LocalS3Client in the output directory. Returns throughput figures.
+    """
+    os.makedirs(output, exist_ok=True)
+    client = LocalS3Client(output)
+    METRICS.reset()
+    MANIFEST.reset()  # hours cached by an earlier replay belong to its output
+
+    with S3Loader.using_client(client):
+        firehose = BlueSkyFirehose(
+            uploader=BatchUploader(policy=BLOCK),  # a replay should not shed batches
+            checkpoint=CursorCheckpoint(os.path.join(output, "firehose_cursor.json")),
+            spool_directory=None)
+        firehose.uploader.start()
+
+        frames = 0
+        max_lag = 0.0
+        first_received = None
+        time1 = time.perf_counter()
+        for received_at, raw_frame in read_frames(path):
+            if first_received is None:
+                first_received = received_at
+            if speed:
+                due = (received_at - first_received) / speed
+                lag = time.perf_counter() - time1 - due
+                if lag < 0:
+                    time.sleep(-lag)
+                max_lag = max(max_lag, lag)
+            firehose.extract_message(firehose_models.Frame.from_bytes(raw_frame))
+            frames += 1
+        time2 = time.perf_counter()
+
+        firehose.seal_batch()
+        firehose.uploader.stop()
+
+    seconds = time2 - time1
+    posts = METRICS.snapshot().get("firehose_english_posts_total", 0)
+    return {
+        "frames": frames,
+        "posts": posts,
+        "seconds": round(seconds, 3),
+        "frames_per_second": round(frames / seconds, 1) if seconds else 0.0,
+        "posts_per_second": round(posts / seconds, 1) if seconds else 0.0,
+        "max_lag_seconds": round(max_lag, 3),
+        "objects_uploaded": client.objects,
+        "bytes_uploaded": client.bytes,
+        "upload_failures": firehose.uploader.stats()["failed"],
+    }
+
+
+def parse_speed(value: str) -> float | None:
+    """'max' replays as fast as possible, otherwise a multiple of recorded speed"""
+    return None if value == "max" else float(value.removesuffix("x"))
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    subparsers = parser.add_subparsers(dest="command", required=True)
+    record_parser = subparsers.add_parser("record")
+    record_parser.add_argument("path")
+    record_parser.add_argument("--frames", type=int, default=20000)
+    synthesize_parser = subparsers.add_parser("synthesize")
+    synthesize_parser.add_argument("path")
+    synthesize_parser.add_argument("--frames", type=int, default=20000)
+    synthesize_parser.add_argument("--rate", type=float, default=SYNTHETIC_RATE)
+    synthesize_parser.add_argument("--seed", type=int, default=0)
+    replay_parser = subparsers.add_parser("replay")
+    replay_parser.add_argument("path")
+    replay_parser.add_argument("--speed", type=parse_speed, default=None,
+                               help="1, 10, 10x or max (default)")
+    replay_parser.add_argument("--output", default="replay_output")
+    replay_parser.add_argument("--min-frames-per-second", type=float, default=0,
+                               help="exit with status 1 below this throughput")
+    args = parser.parse_args(sys.argv[1:])
+
+    if args.command == "record":
+        record(args.path, args.frames)
+    elif args.command == "synthesize":
+        synthesize(args.path, args.frames, args.rate, args.seed)
+    else:
+        report = replay(args.path, args.speed, args.output)
+        print(json.dumps(report))
+        if report["frames_per_second"] < args.min_frames_per_second:
+            sys.exit(1)
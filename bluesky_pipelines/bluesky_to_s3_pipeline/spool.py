@@ -0,0 +1,131 @@
+"""
+Durable on-disk spool for the firehose extractor. Posts are appended to the
+current segment file, segments are sealed on rotation and a sealed segment is
+only deleted once it has been uploaded, so a crash loses at most the writes
+since the last fsync instead of the whole batch.
+"""
+import os
+import time
+import uuid
+import logging
+from datetime import datetime, timezone
+from functools import partial
+from collections.abc import Callable
+from load_s3 import S3Loader, OUTPUT_FORMAT
+
+logging.basicConfig(
+    filename="pipeline.log",
+    filemode="a",
+    level=logging.INFO,
+    format="%(asctime)s - %(levelname)s - %(message)s"
+)
+
+SPOOL_DIRECTORY = os.getenv("SPOOL_DIRECTORY")  # unset keeps batches in memory
+FSYNC_INTERVAL = float(os.getenv("FSYNC_INTERVAL", "1"))  # seconds, 0 syncs every post
+WRITE_BUFFER_SIZE = 1024 * 1024  # bytes
+
+OPEN_SUFFIX = ".open"
+SEALED_SUFFIX = ".sealed"
+
+
+class Segment:
+    """One append-only segment file of newline-delimited message jsons"""
+
+    def __init__(self, path: str, spool: "SegmentSpool") -> None:
+        self.path = path
+        self.spool = spool
+        self.count = 0
+        self.size_bytes = 0
+        self._file = open(path, "ab", buffering=spool.buffer_size)  # pylint: disable=R1732
+        self._last_sync = time.monotonic()
+
+    def __len__(self) -> int:
+        return self.count
+
+    def _sync(self) -> None:
+        self._file.flush()
+        os.fsync(self._file.fileno())
+        self._last_sync = time.monotonic()
+
+    def append(self, line: bytes) -> None:
+        """Writes an encoded message line to the segment, syncing every fsync_interval"""
+        self._file.write(line)
+        self.count += 1
+        self.size_bytes += len(line)
+        if time.monotonic() - self._last_sync >= self.spool.fsync_interval:
+            self._sync()
+
+    def seal(self) -> Callable:
+        """Syncs and closes the segment, returning the job that ships it"""
+        self._sync()
+        self._file.close()
+        sealed_path = self.path.removesuffix(OPEN_SUFFIX) + SEALED_SUFFIX
+        os.replace(self.path, sealed_path)
+        return partial(self.spool.ship, sealed_path)
+
+
+class SegmentSpool:
+    """Directory of open and sealed segments waiting to be shipped to S3"""
+
+    def __init__(self, directory: str = SPOOL_DIRECTORY,
+                 fsync_interval: float = FSYNC_INTERVAL,
+                 buffer_size: int = WRITE_BUFFER_SIZE,
+                 output_format: str = OUTPUT_FORMAT) -> None:
+        self.directory = directory
+        self.fsync_interval = fsync_interval
+        self.buffer_size = buffer_size
+        self.output_format = output_format
+        os.makedirs(directory, exist_ok=True)
+
+    def new_segment(self) -> Segment:
+        """Opens a new segment, named so that segments sort in creation order"""
+        name = f"{time.time_ns()}-{uuid.uuid4().hex}{OPEN_SUFFIX}"
+        return Segment(os.path.join(self.directory, name), self)
+
+    @staticmethod
+    def read_segment(path: str) -> bytes:
+        """Reads a segment's NDJSON lines back, dropping a final line torn by a crash"""
+        with open(path, "rb") as file:
+            data = file.read()
+        if data and not data.endswith(b"\n"):
+            logging.warning("Skipping torn line in segment %s", path)
+            data = data[:data.rfind(b"\n") + 1]
+        return data
+
+    @staticmethod
+    def segment_started(path: str) -> datetime:
+        """When a segment was opened, from the nanosecond timestamp its name starts with"""
+        nanoseconds = int(os.path.basename(path).split("-", 1)[0])
+        return datetime.fromtimestamp(nanoseconds / 1e9, timezone.utc)
+
+    def ship(self, path: str) -> str | None:
+        """
+        Uploads a sealed segment under the hour it was opened in, and deletes
+        it once S3 has accepted it
+        """
+        data = self.read_segment(path)
+        filename = (S3Loader.load_to_s3(data, self.output_format, self.segment_started(path))
+                    if data else None)
+        os.remove(path)
+        logging.info("Shipped segment %s with %s posts", path, data.count(b"\n"))
+        return filename
+
+    def recover(self) -> list[Callable]:
+        """
+        Seals segments left open by a previous run and returns ship jobs
+        for every unshipped segment, oldest first
+        """
+        names = sorted(os.listdir(self.directory))
+        jobs = []
+        for name in names:
+            path = os.path.join(self.directory, name)
+            if name.endswith(OPEN_SUFFIX):
+                sealed_path = path.removesuffix(OPEN_SUFFIX) + SEALED_SUFFIX
+                os.replace(path, sealed_path)
+                path = sealed_path
+            elif not name.endswith(SEALED_SUFFIX):
+                continue
+            jobs.append(partial(self.ship, path))
+        if jobs:
+            logging.info("Replaying %s unshipped segments", len(jobs))
+        return jobs
@@ -0,0 +1,35 @@
+# pylint: skip-file
+import json
+from checkpoint import CursorCheckpoint
+
+
+class TestCursorCheckpoint:
+
+    def test_missing_checkpoint_loads_as_none(self, tmp_path):
+        checkpoint = CursorCheckpoint(str(tmp_path / "cursor.json"))
+
+        assert checkpoint.seq is None
+
+    def test_saved_seq_is_loaded_by_a_new_checkpoint(self, tmp_path):
+        path = str(tmp_path / "cursor.json")
+        CursorCheckpoint(path).save(1234)
+
+        assert CursorCheckpoint(path).seq == 1234
+        assert not (tmp_path / "cursor.json.tmp").exists()
+
+    def test_checkpoint_never_moves_backwards(self, tmp_path):
+        path = tmp_path / "cursor.json"
+        checkpoint = CursorCheckpoint(str(path))
+
+        checkpoint.save(20)
+        checkpoint.save(10)
+        checkpoint.save(None)
+
+        assert json.loads(path.read_text()) == {"seq": 20}
+
+    def test_unreadable_checkpoint_is_ignored(self, tmp_path, caplog):
+        path = tmp_path / "cursor.json"
+        path.write_text("{not json")
+
+        assert CursorCheckpoint(str(path)).seq is None
+        assert "Ignoring unreadable checkpoint" in caplog.text
@@ -0,0 +1,136 @@
+# pylint: skip-file
+import os
+import json
+from unittest.mock import MagicMock, call, patch
+from atproto import models
+from contextlib import contextmanager
+from itertools import islice
+from decoder_pool import DecoderPool, decode_frame, read_raw_frames
+from extract import BlueSkyFirehose
+from checkpoint import CursorCheckpoint
+from metrics import METRICS
+
+
+def fake_decoder(raw_frame):
+    """Stands in for decode_frame inside the worker processes"""
+    number = int(raw_frame)
+    posts = [f'{{"text":"post {number}"}}\n'.encode()]
+    return os.getpid(), 0.001, number, 1, posts if number % 2 == 0 else []
+
+
+class TestDecodeFrame:
+
+    def test_returns_compact_english_posts(self):
+        raw_post = {"text": "I love football", "langs": ["en"], "$type": "app.bsky.feed.post",
+                    "createdAt": "2025-08-04T12:23:52", "reply": {"root": {}}}
+
+        commit = MagicMock(spec=models.ComAtprotoSyncSubscribeRepos.Commit)
+
+        with patch("decoder_pool.firehose_models.Frame.from_bytes") as mock_from_bytes, \
+                patch("decoder_pool.parse_subscribe_repos_message", return_value=commit), \
+                patch("decoder_pool.BlueSkyFirehose.get_post_ops", return_value=[MagicMock()]), \
+                patch("decoder_pool.BlueSkyFirehose.get_english_posts", return_value=[raw_post]):
+            mock_from_bytes.return_value.is_message = True
+            pid, seconds, seq, post_count, posts = decode_frame(b"raw")
+
+        assert pid == os.getpid()
+        assert seconds >= 0
+        assert post_count == 1
+        assert [json.loads(post) for post in posts] == [
+            {"text": "I love football", "langs": ["en"],
+             "$type": "app.bsky.feed.post", "createdAt": "2025-08-04T12:23:52"}]
+
+    def test_undecodable_frame_returns_no_posts(self, caplog):
+        pid, _, seq, post_count, posts = decode_frame(b"not a frame")
+
+        assert seq is None
+        assert post_count is None
+        assert posts == []
+        assert "Error occurred during frame decoding" in caplog.text
+
+
+class TestDecoderPool:
+
+    def test_posts_reach_message_handling_in_stream_order(self):
+        firehose = MagicMock(last_seq=None)
+        pool = DecoderPool(firehose, workers=2, chunk_size=3,
+                           frames_in_flight=4, decoder=fake_decoder)
+
+        pool.run(str(number).encode() for number in range(20))
+
+        texts = [json.loads(call.args[0])["text"]
+                 for call in firehose.handle_encoded.call_args_list]
+        assert texts == [f"post {number}" for number in range(0, 20, 2)]
+
+    def test_counts_frames_and_posts_per_worker(self):
+        pool = DecoderPool(MagicMock(last_seq=None), workers=2, chunk_size=2,
+                           decoder=fake_decoder)
+
+        pool.run(str(number).encode() for number in range(10))
+
+        stats = pool.stats()
+        assert os.getpid() not in stats
+        assert sum(worker["frames"] for worker in stats.values()) == 10
+        assert sum(worker["posts"] for worker in stats.values()) == 5
+        assert all(worker["frames_per_second"] > 0 for worker in stats.values())
+
+    def test_feeds_ingest_metrics(self):
+        METRICS.reset()
+        pool = DecoderPool(MagicMock(last_seq=None), workers=2, decoder=fake_decoder)
+
+        pool.run(str(number).encode() for number in range(10))
+
+        snapshot = METRICS.snapshot()
+        assert snapshot["firehose_frames_total"] == 10
+        assert snapshot["firehose_posts_total"] == 10
+        assert snapshot["firehose_english_ratio"] == 0.5
+        assert snapshot["firehose_decode_seconds"]["count"] == 10
+
+    def test_start_runs_uploader_around_decoding(self):
+        firehose = MagicMock(last_seq=None)
+        pool = DecoderPool(firehose, workers=1, decoder=fake_decoder)
+
+        pool.start(iter([b"0"]))
+
+        firehose.uploader.start.assert_called_once()
+        firehose.uploader.stop.assert_called_once()
+        firehose.handle_encoded.assert_called_once()
+
+    def test_frames_already_collected_are_skipped_after_reconnect(self):
+        firehose = MagicMock(last_seq=4)
+        pool = DecoderPool(firehose, workers=1, decoder=fake_decoder)
+
+        pool.run(str(number).encode() for number in (2, 4, 6))
+
+        assert firehose.handle_encoded.call_args_list == [call(b'{"text":"post 6"}\n')]
+        firehose.track_seq.assert_called_once_with(6)
+
+
+class TestReadRawFrames:
+
+    def test_gap_reported_after_every_reconnect(self, tmp_path, caplog):
+        firehose = BlueSkyFirehose(
+            uploader=MagicMock(), checkpoint=CursorCheckpoint(str(tmp_path / "cursor.json")))
+        connections = iter([[b"1", b"2"], [b"5", b"6"]])  # the relay lost 3 and 4
+        urls = []
+
+        @contextmanager
+        def fake_connect(url, **_):
+            urls.append(url)
+            frames = next(connections)
+
+            def websocket():
+                yield from frames
+                raise OSError("connection reset")
+
+            yield websocket()
+
+        with patch("decoder_pool.connect", fake_connect), patch("decoder_pool.time.sleep"):
+            frames = read_raw_frames(firehose.resume_cursor, "wss://relay",
+                                     on_connect=firehose.expect_resume)
+            for raw_frame in islice(frames, 4):
+                firehose.track_seq(int(raw_frame))
+
+        assert urls == ["wss://relay", "wss://relay?cursor=2"]
+        assert firehose.unrecovered_events == 2
+        assert "2 events could not be recovered" in caplog.text
@@ -1,5 +1,11 @@
 # pylint: skip-file
+import os
+import pytest
 from extract import BlueSkyFirehose
+from load_s3 import MultipartBatch
+from spool import SegmentSpool
+from checkpoint import CursorCheckpoint
+from metrics import METRICS
 import logging
 from unittest.mock import MagicMock, patch
 from atproto import models
@@ -9,9 +15,11 @@ def make_mock_commit(post_text: list[str], lang: str):
     """Function that helps make a mock Bluesky commit"""
     mock_commit = MagicMock(spec=models.ComAtprotoSyncSubscribeRepos.Commit)
     mock_commit.blocks = "test"
+    mock_commit.seq = 1
 
     mock_commit.ops = [
-        MagicMock(action="create", cid="fake_cid")
+        MagicMock(action="create", cid="fake_cid",
+                  path="app.bsky.feed.post/3luzluujzah2m")
     ]
 
     mock_raw = {"$type": "app.bsky.feed.post",
@@ -26,7 +34,8 @@ def test_extract_message_logs_when_valid_message(caplog):
 
     with patch("extract.parse_subscribe_repos_message") as mock_parse_sub, \
             patch("extract.CAR") as mock_car_func, \
-            patch("extract.S3Loader.load_to_s3") as mock_s3_loader:
+            patch("extract.LOG_SAMPLE_RATE", 1.0), \
+            patch("load_s3.S3Loader.load_to_s3") as mock_s3_loader:
 
         mock_commit, mock_raw = make_mock_commit(post_text, "en")
         mock_parse_sub.return_value = mock_commit
@@ -59,3 +68,224 @@ def test_extract_message_logs_when_skipping_invalid_message(caplog):
             firehose.extract_message("fake_message")
 
         assert "English message found" not in caplog.records
+
+
+def test_extract_message_counts_posts_without_logging_by_default(caplog):
+    METRICS.reset()
+    firehose = BlueSkyFirehose()
+
+    with patch("extract.parse_subscribe_repos_message") as mock_parse_sub, \
+            patch("extract.CAR") as mock_car_func:
+
+        mock_commit, mock_raw = make_mock_commit("I love football", "en")
+        mock_parse_sub.return_value = mock_commit
+        mock_car_func.from_bytes.return_value.blocks.get.return_value = mock_raw
+
+        with caplog.at_level(logging.INFO):
+            firehose.extract_message("fake_message")
+
+    assert not any("English message found" in record.message for record in caplog.records)
+    snapshot = METRICS.snapshot()
+    assert snapshot["firehose_frames_total"] == 1
+    assert snapshot["firehose_commits_total"] == 1
+    assert snapshot["firehose_english_posts_total"] == 1
+    assert snapshot["firehose_english_ratio"] == 1.0
+    assert snapshot["firehose_decode_seconds"]["count"] == 1
+
+
+@pytest.mark.parametrize("action, path", [
+    ("create", "app.bsky.feed.like/3luzluujzah2m"),
+    ("create", "app.bsky.graph.follow/3luzluujzah2m"),
+    ("create", "app.bsky.feed.repost/3luzluujzah2m"),
+    ("delete", "app.bsky.feed.post/3luzluujzah2m"),
+    ("update", "app.bsky.actor.profile/self"),
+])
+def test_extract_message_skips_decoding_non_post_commits(action, path):
+    firehose = BlueSkyFirehose()
+
+    with patch("extract.parse_subscribe_repos_message") as mock_parse_sub, \
+            patch("extract.CAR") as mock_car_func:
+
+        mock_commit, _ = make_mock_commit("I love football", "en")
+        mock_commit.ops = [MagicMock(action=action, cid="fake_cid", path=path)]
+        mock_parse_sub.return_value = mock_commit
+
+        firehose.extract_message("fake_message")
+
+        mock_car_func.from_bytes.assert_not_called()
+
+
+def test_get_post_ops_only_returns_post_creates():
+    post = MagicMock(action="create", cid="cid1",
+                     path="app.bsky.feed.post/abc")
+    like = MagicMock(action="create", cid="cid2",
+                     path="app.bsky.feed.like/abc")
+    postgate = MagicMock(action="create", cid="cid3",
+                         path="app.bsky.feed.postgate/abc")
+    commit = MagicMock(ops=[post, like, postgate])
+
+    assert BlueSkyFirehose.get_post_ops(commit) == [post]
+
+
+def test_message_handling_queues_batch_without_uploading():
+    firehose = BlueSkyFirehose(uploader=MagicMock())
+    firehose.time_period_start = 0
+    message = MagicMock(encoded=b'{"text":"hello"}\n')
+
+    with patch("load_s3.S3Loader.load_to_s3") as mock_s3_loader:
+        assert firehose.message_handling(message) is True
+
+    mock_s3_loader.assert_not_called()
+    firehose.uploader.submit.assert_called_once()
+    assert len(firehose.batch) == 0
+
+
+def test_message_handling_keeps_batch_within_time_period():
+    firehose = BlueSkyFirehose(uploader=MagicMock())
+    message = MagicMock(encoded=b'{"text":"hello"}\n')
+
+    assert firehose.message_handling(message) is False
+
+    firehose.uploader.submit.assert_not_called()
+    assert len(firehose.batch) == 1
+
+
+def test_message_handling_rotates_batch_on_size():
+    firehose = BlueSkyFirehose(uploader=MagicMock())
+    message = MagicMock(encoded=b'{"text":"hello"}\n')
+
+    with patch("extract.MAX_BATCH_BYTES", 25):
+        results = [firehose.message_handling(message) for _ in range(3)]
+
+    assert results == [False, True, False]
+    firehose.uploader.submit.assert_called_once()
+    assert firehose.batch.size_bytes == len(b'{"text":"hello"}\n')
+
+
+def test_new_batch_streams_when_enabled():
+    firehose = BlueSkyFirehose(uploader=MagicMock())
+
+    with patch("extract.STREAM_UPLOADS", True):
+        batch = firehose.new_batch()
+
+    assert isinstance(batch, MultipartBatch)
+    assert batch.submit == firehose.uploader.submit
+
+
+def test_unshipped_segments_are_replayed_on_start(tmp_path):
+    previous_run = SegmentSpool(str(tmp_path))
+    segment = previous_run.new_segment()
+    segment.append(b'{"text":"hello"}\n')
+
+    firehose = BlueSkyFirehose(uploader=MagicMock(), spool=SegmentSpool(str(tmp_path)))
+    firehose.message_handling(MagicMock(encoded=b'{"text":"new"}\n'))
+    firehose.replay_spool()
+
+    firehose.uploader.submit.assert_called_once()
+    assert firehose.batch.path != segment.path
+    assert len(os.listdir(tmp_path)) == 2
+
+
+def test_client_resumes_from_saved_checkpoint(tmp_path):
+    checkpoint = CursorCheckpoint(str(tmp_path / "cursor.json"))
+    checkpoint.save(500)
+
+    with patch("extract.FirehoseSubscribeReposClient") as mock_client:
+        firehose = BlueSkyFirehose(uploader=MagicMock(), checkpoint=checkpoint)
+
+    mock_client.assert_called_once_with({"cursor": 500})
+    assert firehose.resume_cursor() == 500
+
+
+def test_track_seq_reports_unrecoverable_gap(tmp_path, caplog):
+    firehose = BlueSkyFirehose(
+        uploader=MagicMock(), checkpoint=CursorCheckpoint(str(tmp_path / "cursor.json")))
+    firehose.resumed_from = 100
+
+    firehose.track_seq(90)  # frame already in flight before the reconnect
+    firehose.track_seq(150)
+    firehose.track_seq(151)
+
+    assert firehose.unrecovered_events == 49
+    assert firehose.last_seq == 151
+    assert "49 events could not be recovered" in caplog.text
+
+
+def test_checkpoint_only_advances_after_upload(tmp_path):
+    checkpoint = CursorCheckpoint(str(tmp_path / "cursor.json"))
+    jobs = []
+    firehose = BlueSkyFirehose(
+        uploader=MagicMock(submit=lambda job, **_: jobs.append(job)), checkpoint=checkpoint)
+    firehose.batch = MagicMock()
+    firehose.last_seq = 42
+
+    firehose.seal_batch()
+    assert checkpoint.seq is None
+
+    jobs[0]()
+    assert checkpoint.seq == 42
+
+
+def test_start_reconnects_from_last_seq_with_backoff(tmp_path):
+    firehose = BlueSkyFirehose(
+        uploader=MagicMock(), checkpoint=CursorCheckpoint(str(tmp_path / "cursor.json")))
+    failing_client = MagicMock()
+    failing_client.start.side_effect = ConnectionError("dropped")
+    firehose.client = failing_client
+    firehose.last_seq = 77
+
+    with patch("extract.time.sleep") as mock_sleep, \
+            patch.object(BlueSkyFirehose, "make_client") as mock_make_client:
+        mock_make_client.return_value.start.return_value = None
+        firehose.start()
+
+    mock_sleep.assert_called_once()
+    mock_make_client.assert_called_once_with(77)
+    firehose.uploader.stop.assert_called_once()
+
+
+def test_reconnect_delay_grows_and_is_capped():
+    delays = [BlueSkyFirehose.reconnect_delay(attempt) for attempt in (1, 4, 20)]
+
+    assert 1 <= delays[0] <= 2
+    assert 8 <= delays[1] <= 16
+    assert delays[2] <= 300
+
+
+def test_client_cursor_updated_every_interval_of_commits(tmp_path):
+    firehose = BlueSkyFirehose(
+        uploader=MagicMock(), checkpoint=CursorCheckpoint(str(tmp_path / "cursor.json")))
+    firehose.client = MagicMock()
+    commits = []
+    for seq in (2, 4, 7, 11, 13, 17):  # sequence numbers are not consecutive
+        commit, _ = make_mock_commit([], "en")
+        commit.seq = seq
+        commit.ops = []
+        commits.append(commit)
+
+    with patch("extract.parse_subscribe_repos_message", side_effect=commits), \
+            patch("extract.CURSOR_UPDATE_INTERVAL", 3):
+        for _ in commits:
+            firehose.extract_message("fake_message")
+
+    assert [call.args[0] for call in firehose.client.update_params.call_args_list] == [
+        {"cursor": 7}, {"cursor": 17}]
+
+
+def test_commits_replayed_after_client_reconnect_are_skipped(tmp_path):
+    firehose = BlueSkyFirehose(
+        uploader=MagicMock(), checkpoint=CursorCheckpoint(str(tmp_path / "cursor.json")))
+    commits = []
+    for seq in (10, 11, 10, 11):  # the client rewound to its last cursor update
+        commit, raw = make_mock_commit(f"post {seq}", "en")
+        commit.seq = seq
+        commits.append(commit)
+
+    with patch("extract.parse_subscribe_repos_message", side_effect=commits), \
+            patch("extract.CAR") as mock_car_func:
+        mock_car_func.from_bytes.return_value.blocks.get.return_value = raw
+        for _ in commits:
+            firehose.extract_message("fake_message")
+
+    assert len(firehose.batch) == 2
+    assert firehose.last_seq == 11
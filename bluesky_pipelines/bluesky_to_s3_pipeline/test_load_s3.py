@@ -1,12 +1,17 @@
 # pylint: skip-file
 
+import os
 import pytest
 import regex as re
-from load_s3 import S3Loader, BUCKET_NAME, FILE_PATH
-from datetime import datetime
+from load_s3 import (S3Loader, BatchManifest, MemoryBatch, MultipartBatch,
+                     BUCKET_NAME, FILE_PATH, LATEST_MANIFEST)
+from botocore.exceptions import ClientError
+from datetime import datetime, timezone
 from unittest.mock import patch, MagicMock
 import logging
 import json
+import gzip
+import zstandard
 
 class TestS3Loader:
 
@@ -42,8 +47,15 @@ class TestS3Loader:
 
     @patch("load_s3.S3Loader.random_string", return_value="abcd")
     @patch("load_s3.S3Loader.format_date", return_value="04-08-2025T15-45-26")
+    def test_make_key_partitions_by_utc_hour(self, mock_format_date, mock_random_string):
+        key = S3Loader.make_key("ndjson.gz", datetime(2025, 8, 4, 9, 5, tzinfo=timezone.utc))
+
+        assert key == f"{FILE_PATH}2025/08/04/09/abcd--04-08-2025T15-45-26.ndjson.gz"
+
+    @patch("load_s3.MANIFEST")
+    @patch("load_s3.S3Loader.make_key", return_value=f"{FILE_PATH}2025/08/04/15/abcd--04-08-2025T15-45-26.json")
     @patch("load_s3.boto3.Session")
-    def test_load_to_s3_uploads_file_and_logs(self, mock_session, mock_format_date, mock_random_string, caplog):
+    def test_load_to_s3_uploads_file_and_logs(self, mock_session, mock_make_key, mock_manifest, caplog):
         test_data = [{"msg": "hello"}]
         expected_filename = "abcd--04-08-2025T15-45-26.json"
         fake_client = MagicMock()
@@ -56,9 +68,235 @@ class TestS3Loader:
 
         fake_client.put_object.assert_called_once_with(
             Bucket=BUCKET_NAME,
-            Key=f"{FILE_PATH}{expected_filename}",
+            Key=f"{FILE_PATH}2025/08/04/15/{expected_filename}",
             Body=json.dumps(test_data),
             ContentType="application/json"
         )
+        mock_manifest.record.assert_called_once_with(
+            fake_client, f"{FILE_PATH}2025/08/04/15/{expected_filename}", 1,
+            len(json.dumps(test_data)))
+
+        assert f"{expected_filename} uploaded to {BUCKET_NAME}" in caplog.text
+
+    @pytest.mark.parametrize("output_format, decompress", [
+        ("ndjson.gz", gzip.decompress),
+        ("ndjson.zst", lambda body: zstandard.ZstdDecompressor().decompress(body)),
+    ])
+    def test_encode_compressed_ndjson(self, output_format, decompress):
+        test_data = [{"msg": "hello"}, {"msg": "world"}]
+
+        body = S3Loader.encode(test_data, output_format)
+
+        lines = decompress(body).decode("utf-8").splitlines()
+        assert [json.loads(line) for line in lines] == test_data
+
+    @pytest.mark.parametrize("output_format, decode", [
+        ("json", json.loads),
+        ("ndjson.gz", lambda body: [json.loads(line)
+                                    for line in gzip.decompress(body).splitlines()]),
+    ])
+    def test_encode_ndjson_buffer(self, output_format, decode):
+        buffer = b'{"msg":"hello\\nthere"}\n{"msg":"world"}\n'
+
+        body = S3Loader.encode(buffer, output_format)
+
+        assert decode(body) == [{"msg": "hello\nthere"}, {"msg": "world"}]
+
+    def test_encode_unknown_format_raises_error(self):
+        with pytest.raises(ValueError):
+            S3Loader.encode([{"msg": "hello"}], "csv")
+
+    @patch("load_s3.S3Loader.random_string", return_value="abcd")
+    @patch("load_s3.S3Loader.format_date", return_value="04-08-2025T15-45-26")
+    @patch("load_s3.boto3.Session")
+    def test_load_to_s3_uploads_compressed_ndjson(self, mock_session, mock_format_date, mock_random_string):
+        fake_client = MagicMock()
+        mock_session.return_value.client.return_value = fake_client
+
+        filename = S3Loader.load_to_s3([{"msg": "hello"}], "ndjson.gz")
+
+        assert filename == "abcd--04-08-2025T15-45-26.ndjson.gz"
+        kwargs = fake_client.put_object.call_args.kwargs
+        assert kwargs["ContentType"] == "application/x-ndjson"
+        assert kwargs["ContentEncoding"] == "gzip"
+        assert gzip.decompress(kwargs["Body"]) == b'{"msg": "hello"}\n'
+
+
+def no_such_key(**kwargs):
+    raise ClientError({"Error": {"Code": "NoSuchKey"}}, "GetObject")
+
+
+class TestBatchManifest:
+
+    def written(self, client, key):
+        bodies = [call.kwargs["Body"] for call in client.put_object.call_args_list
+                  if call.kwargs["Key"] == key]
+        return json.loads(bodies[-1])
+
+    def test_record_lists_batches_per_hour_and_points_latest_at_newest(self):
+        client = MagicMock()
+        client.get_object.side_effect = no_such_key
+        manifest = BatchManifest()
+
+        manifest.record(client, f"{FILE_PATH}2025/08/04/15/a.json", 10, 100)
+        manifest.record(client, f"{FILE_PATH}2025/08/04/15/b.json", 20, 200)
+
+        hour = self.written(client, "bluesky/manifests/2025/08/04/15/manifest.json")
+        assert [batch["key"] for batch in hour["batches"]] == [
+            f"{FILE_PATH}2025/08/04/15/a.json", f"{FILE_PATH}2025/08/04/15/b.json"]
+        assert hour["batches"][1]["posts"] == 20
+        latest = self.written(client, LATEST_MANIFEST)
+        assert latest["key"] == f"{FILE_PATH}2025/08/04/15/b.json"
+        assert latest["manifest"] == "bluesky/manifests/2025/08/04/15/manifest.json"
+        client.get_object.assert_called_once()
+
+    def test_record_appends_to_manifest_from_previous_run(self):
+        client = MagicMock()
+        client.get_object.return_value = {"Body": MagicMock(read=MagicMock(
+            return_value=b'{"batches": [{"key": "old"}]}'))}
+
+        BatchManifest().record(client, f"{FILE_PATH}2025/08/04/15/new.json", 1, 1)
+
+        hour = self.written(client, "bluesky/manifests/2025/08/04/15/manifest.json")
+        assert [batch["key"] for batch in hour["batches"]] == [
+            "old", f"{FILE_PATH}2025/08/04/15/new.json"]
+
+    def test_record_failure_is_only_logged(self, caplog):
+        client = MagicMock()
+        client.get_object.side_effect = ClientError({"Error": {"Code": "AccessDenied"}}, "GetObject")
+
+        BatchManifest().record(client, f"{FILE_PATH}2025/08/04/15/a.json", 1, 1)
+
+        client.put_object.assert_not_called()
+        assert "Error occurred updating the manifest" in caplog.text
+
+
+class TestMemoryBatch:
+
+    def test_append_tracks_size_and_seal_uploads_buffer(self):
+        batch = MemoryBatch(output_format="json")
+        batch.append(b'{"msg":"hello"}\n')
+        batch.append(b'{"msg":"world"}\n')
+
+        assert len(batch) == 2
+        assert batch.size_bytes == 2 * len(b'{"msg":"hello"}\n')
+
+        with patch("load_s3.S3Loader.load_to_s3") as mock_load:
+            batch.seal()()
+
+        mock_load.assert_called_once_with(
+            b'{"msg":"hello"}\n{"msg":"world"}\n', "json", batch.started)
+
+    @patch("load_s3.MANIFEST")
+    @patch("load_s3.boto3.Session")
+    def test_batch_started_before_the_hour_keeps_its_partition(self, mock_session, mock_manifest):
+        batch = MemoryBatch(output_format="json")
+        batch.started = datetime(2025, 8, 4, 23, 59, tzinfo=timezone.utc)
+        batch.append(b'{"msg":"hello"}\n')
+
+        batch.seal()()
+
+        key = mock_session.return_value.client.return_value.put_object.call_args.kwargs["Key"]
+        assert key.startswith(f"{FILE_PATH}2025/08/04/23/")
+
+
+class TestMultipartBatch:
+
+    @pytest.fixture
+    def fake_client(self):
+        client = MagicMock()
+        client.create_multipart_upload.return_value = {"UploadId": "upload-1"}
+        client.upload_part.side_effect = lambda **kwargs: {
+            "ETag": f"etag-{kwargs['PartNumber']}"}
+        return client
+
+    def test_rejects_legacy_json_format(self):
+        with pytest.raises(ValueError):
+            MultipartBatch(MagicMock(), output_format="json")
+
+    @pytest.mark.parametrize("output_format, decompress", [
+        ("ndjson.gz", gzip.decompress),
+        ("ndjson.zst", lambda body: zstandard.ZstdDecompressor().stream_reader(
+            body, read_across_frames=True).read()),
+    ])
+    def test_parts_are_streamed_and_completed(self, fake_client, output_format, decompress):
+        jobs = []
+        batch = MultipartBatch(jobs.append, output_format=output_format, part_size=64 * 1024)
+        items = [{"msg": f"hello {number}", "padding": os.urandom(100).hex()}
+                 for number in range(6000)]
+
+        lines = [f"{json.dumps(item)}\n".encode() for item in items]
+        for line in lines:
+            batch.append(line)
+        part_jobs = len(jobs)
+        jobs.append(batch.seal())
+
+        assert part_jobs > 1
+        assert batch.size_bytes == sum(len(line) for line in lines)
+
+        with patch("load_s3.S3Loader.get_client", return_value=fake_client):
+            for job in jobs:
+                job()
+
+        fake_client.create_multipart_upload.assert_called_once()
+        bodies = [call.kwargs["Body"] for call in fake_client.upload_part.call_args_list]
+        lines = decompress(b"".join(bodies)).decode("utf-8").splitlines()
+        assert [json.loads(line) for line in lines] == items
+
+        parts = fake_client.complete_multipart_upload.call_args.kwargs["MultipartUpload"]["Parts"]
+        assert [part["PartNumber"] for part in parts] == list(range(1, part_jobs + 2))
+
+    def test_complete_aborts_when_no_parts_uploaded(self, fake_client):
+        jobs = []
+        batch = MultipartBatch(jobs.append, output_format="ndjson.gz")
+        batch.append(b'{"msg":"hello"}\n')
+        complete = batch.seal()
+        fake_client.upload_part.side_effect = RuntimeError("S3 down")
+
+        with patch("load_s3.S3Loader.get_client", return_value=fake_client):
+            with pytest.raises(RuntimeError):
+                jobs[0]()
+            with pytest.raises(RuntimeError):
+                complete()
+
+        fake_client.abort_multipart_upload.assert_called_once()
+        fake_client.complete_multipart_upload.assert_not_called()
+
+    def test_missing_part_aborts_instead_of_completing(self, fake_client):
+        jobs = []
+        batch = MultipartBatch(jobs.append, output_format="ndjson.gz", part_size=1024)
+        for number in range(2000):
+            batch.append(f'{{"msg":"hello {number}","padding":"{os.urandom(100).hex()}"}}\n'.encode())
+        complete = batch.seal()
+        assert len(jobs) > 2
+
+        with patch("load_s3.S3Loader.get_client", return_value=fake_client), \
+                patch("load_s3.MANIFEST") as mock_manifest:
+            for job in jobs[1:]:  # the first part was shed by the uploader
+                job()
+            with pytest.raises(RuntimeError, match="1 parts"):
+                complete()
+
+        fake_client.abort_multipart_upload.assert_called_once()
+        fake_client.complete_multipart_upload.assert_not_called()
+        mock_manifest.record.assert_not_called()
+
+    def test_abort_stops_queued_parts(self, fake_client):
+        jobs = []
+        batch = MultipartBatch(jobs.append, output_format="ndjson.gz", part_size=1024)
+        for number in range(2000):
+            batch.append(f'{{"msg":"hello {number}","padding":"{os.urandom(100).hex()}"}}\n'.encode())
+        complete = batch.seal()
+        assert len(jobs) > 2
+
+        with patch("load_s3.S3Loader.get_client", return_value=fake_client):
+            jobs[0]()
+            batch.abort()  # the completing job was shed
+            with pytest.raises(RuntimeError, match="aborted"):
+                jobs[1]()
+            with pytest.raises(RuntimeError):
+                complete()
 
-        assert f"{expected_filename} uploaded to {BUCKET_NAME}" in caplog.text
\ No newline at end of file
+        fake_client.abort_multipart_upload.assert_called_once()
+        assert fake_client.upload_part.call_count == 1
+        fake_client.complete_multipart_upload.assert_not_called()
@@ -0,0 +1,83 @@
+# pylint: skip-file
+import json
+import socket
+import urllib.request
+import pytest
+from metrics import Histogram, Metrics, METRICS, serve_metrics
+
+
+def free_port():
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+class TestHistogram:
+
+    def test_values_land_in_cumulative_buckets(self):
+        histogram = Histogram((1, 5, 10))
+        for value in (0.5, 1, 3, 7, 50):
+            histogram.observe(value)
+
+        assert histogram.cumulative() == [("1", 2), ("5", 3), ("10", 4), ("+Inf", 5)]
+        assert histogram.count == 5
+        assert histogram.sum == 61.5
+
+
+class TestMetrics:
+
+    def test_snapshot_derives_english_ratio_and_rates(self):
+        metrics = Metrics()
+        metrics.increment("firehose_posts_total", 4)
+        metrics.increment("firehose_english_posts_total")
+        metrics.set_gauge("upload_queue_depth", 2)
+        metrics.observe("upload_seconds", 0.5)
+
+        snapshot = metrics.snapshot()
+
+        assert snapshot["firehose_english_ratio"] == 0.25
+        assert snapshot["upload_queue_depth"] == 2
+        assert snapshot["upload_seconds"] == {"count": 1, "sum": 0.5, "mean": 0.5}
+        assert snapshot["firehose_posts_per_second"] > 0
+
+    def test_render_uses_prometheus_text_format(self):
+        metrics = Metrics()
+        metrics.increment("firehose_frames_total", 3)
+        metrics.observe("batch_posts", 7, (10, 100))
+
+        text = metrics.render()
+
+        assert "# TYPE firehose_frames_total counter\nfirehose_frames_total 3" in text
+        assert 'batch_posts_bucket{le="10"} 1' in text
+        assert 'batch_posts_bucket{le="+Inf"} 1' in text
+        assert "batch_posts_count 1" in text
+        assert "firehose_english_ratio 0.0" in text
+
+    def test_reset_clears_every_metric(self):
+        metrics = Metrics()
+        metrics.increment("firehose_frames_total")
+        metrics.reset()
+
+        assert "firehose_frames_total" not in metrics.snapshot()
+
+
+class TestServeMetrics:
+
+    def test_port_zero_disables_the_endpoint(self):
+        assert serve_metrics(port=0) is None
+
+    def test_serves_text_and_json(self):
+        METRICS.reset()
+        METRICS.increment("firehose_frames_total", 2)
+        server = serve_metrics(port=free_port())
+        url = f"http://127.0.0.1:{server.server_port}"
+        try:
+            with urllib.request.urlopen(f"{url}/metrics") as response:
+                assert "firehose_frames_total 2" in response.read().decode()
+            with urllib.request.urlopen(f"{url}/metrics.json") as response:
+                assert json.load(response)["firehose_frames_total"] == 2
+            with pytest.raises(urllib.error.HTTPError):
+                urllib.request.urlopen(f"{url}/other")
+        finally:
+            server.shutdown()
+            server.server_close()
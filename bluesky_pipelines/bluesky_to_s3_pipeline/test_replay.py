@@ -0,0 +1,103 @@
+# pylint: skip-file
+import os
+import json
+import random
+import pytest
+from load_s3 import S3Loader, BUCKET_NAME, MANIFEST_PATH
+from replay import (LocalS3Client, parse_speed, read_frames, replay,
+                    synthesize, synthetic_frame, write_frame)
+
+MIN_FRAMES_PER_SECOND = 500  # far below a healthy run, catches gross regressions
+
+
+@pytest.fixture
+def corpus(tmp_path):
+    path = tmp_path / "frames.bin"
+    synthesize(str(path), 400, rate=2000)
+    return str(path)
+
+
+def uploaded_posts(directory):
+    posts = []
+    for root, _, names in os.walk(directory):
+        for name in names:
+            if name.endswith(".json") and "raw_posts" in root:
+                with open(os.path.join(root, name), encoding="utf-8") as file:
+                    posts.extend(json.load(file))
+    return posts
+
+
+def test_corpus_round_trips_frames_and_timestamps(tmp_path):
+    path = tmp_path / "frames.bin"
+    with open(path, "wb") as file:
+        write_frame(file, b"first", 1.5)
+        write_frame(file, b"second", 2.5)
+
+    assert list(read_frames(str(path))) == [(1.5, b"first"), (2.5, b"second")]
+
+
+def test_synthetic_frames_are_reproducible():
+    assert synthetic_frame(7, random.Random(1)) == synthetic_frame(7, random.Random(1))
+
+
+def test_replay_at_max_speed_uploads_every_english_post(corpus, tmp_path):
+    output = tmp_path / "output"
+
+    report = replay(corpus, speed=None, output=str(output))
+
+    posts = uploaded_posts(output)
+    assert report["frames"] == 400
+    assert report["posts"] == len(posts) > 0
+    assert all(post["langs"] == ["en"] for post in posts)
+    assert report["objects_uploaded"] == 1
+    assert report["upload_failures"] == 0
+    assert report["frames_per_second"] > MIN_FRAMES_PER_SECOND
+
+
+def test_replay_keeps_recorded_spacing_at_given_speed(corpus, tmp_path):
+    # 400 frames at 2000/sec span 0.2 seconds of recorded time
+    report = replay(corpus, speed=2, output=str(tmp_path / "output"))
+
+    assert report["seconds"] >= 0.09
+    assert report["frames"] == 400
+
+
+def test_local_client_assembles_multipart_uploads(tmp_path):
+    client = LocalS3Client(str(tmp_path))
+    upload_id = client.create_multipart_upload(Bucket="bucket", Key="a/b.gz")["UploadId"]
+    client.upload_part(Bucket="bucket", Key="a/b.gz", UploadId=upload_id,
+                       PartNumber=2, Body=b"world")
+    client.upload_part(Bucket="bucket", Key="a/b.gz", UploadId=upload_id,
+                       PartNumber=1, Body=b"hello ")
+    client.complete_multipart_upload(Bucket="bucket", Key="a/b.gz", UploadId=upload_id)
+
+    assert (tmp_path / "bucket" / "a" / "b.gz").read_bytes() == b"hello world"
+    assert client.objects == 1
+
+
+@pytest.mark.parametrize("value, speed", [("max", None), ("1", 1.0), ("10x", 10.0)])
+def test_parse_speed(value, speed):
+    assert parse_speed(value) == speed
+
+
+def test_replays_in_one_process_keep_their_manifests_apart(corpus, tmp_path):
+    outputs = [tmp_path / "first", tmp_path / "second"]
+
+    for output in outputs:
+        replay(corpus, speed=None, output=str(output))
+
+    for output in outputs:
+        batches = [os.path.relpath(os.path.join(root, name), output / BUCKET_NAME)
+                   for root, _, names in os.walk(output) if "raw_posts" in root
+                   for name in names]
+        manifests = list((output / BUCKET_NAME / MANIFEST_PATH).glob("*/*/*/*/manifest.json"))
+        listed = [batch["key"] for manifest in manifests
+                  for batch in json.loads(manifest.read_text())["batches"]]
+        assert listed == batches
+        assert len(listed) == 1
+
+
+def test_replay_restores_the_s3_client(corpus, tmp_path):
+    replay(corpus, speed=None, output=str(tmp_path / "output"))
+
+    assert S3Loader._client is None
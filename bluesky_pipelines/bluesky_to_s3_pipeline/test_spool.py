@@ -0,0 +1,88 @@
+# pylint: skip-file
+import os
+import json
+from datetime import datetime, timedelta, timezone
+from unittest.mock import patch
+from spool import SegmentSpool
+
+
+def segment_names(directory):
+    return sorted(os.listdir(directory))
+
+
+class TestSegmentSpool:
+
+    def test_append_writes_ndjson_to_open_segment(self, tmp_path):
+        spool = SegmentSpool(str(tmp_path), fsync_interval=0)
+        segment = spool.new_segment()
+
+        segment.append(b'{"text":"hello"}\n')
+        segment.append(b'{"text":"world"}\n')
+
+        assert len(segment) == 2
+        assert segment.size_bytes == 2 * len(b'{"text":"hello"}\n')
+        with open(segment.path, "rb") as file:
+            assert [json.loads(line) for line in file] == [
+                {"text": "hello"}, {"text": "world"}]
+
+    def test_writes_are_buffered_between_fsyncs(self, tmp_path):
+        spool = SegmentSpool(str(tmp_path), fsync_interval=3600)
+        segment = spool.new_segment()
+
+        with patch("spool.os.fsync") as mock_fsync:
+            segment.append(b'{"text":"hello"}\n')
+
+        mock_fsync.assert_not_called()
+        assert os.path.getsize(segment.path) == 0
+
+    def test_ship_uploads_and_deletes_sealed_segment(self, tmp_path):
+        spool = SegmentSpool(str(tmp_path), output_format="ndjson.gz")
+        segment = spool.new_segment()
+        segment.append(b'{"text":"hello"}\n')
+        ship = segment.seal()
+
+        assert segment_names(tmp_path)[0].endswith(".sealed")
+
+        with patch("spool.S3Loader.load_to_s3", return_value="file.ndjson.gz") as mock_load:
+            assert ship() == "file.ndjson.gz"
+
+        started = mock_load.call_args.args[2]
+        mock_load.assert_called_once_with(b'{"text":"hello"}\n', "ndjson.gz", started)
+        assert abs(datetime.now(timezone.utc) - started) < timedelta(minutes=1)
+        assert segment_names(tmp_path) == []
+
+    def test_failed_ship_keeps_segment(self, tmp_path):
+        spool = SegmentSpool(str(tmp_path))
+        segment = spool.new_segment()
+        segment.append(b'{"text":"hello"}\n')
+        ship = segment.seal()
+
+        with patch("spool.S3Loader.load_to_s3", side_effect=RuntimeError("S3 down")):
+            try:
+                ship()
+            except RuntimeError:
+                pass
+
+        assert len(segment_names(tmp_path)) == 1
+
+    def test_recover_replays_open_and_sealed_segments_in_order(self, tmp_path):
+        spool = SegmentSpool(str(tmp_path), fsync_interval=0)
+        first = spool.new_segment()
+        first.append(b'{"text":"first"}\n')
+        first.seal()
+        second = spool.new_segment()
+        second.append(b'{"text":"second"}\n')
+        with open(second.path, "ab") as file:
+            file.write(b'{"text": "tor')  # crash mid-write
+
+        restarted = SegmentSpool(str(tmp_path))
+        jobs = restarted.recover()
+
+        assert all(name.endswith(".sealed") for name in segment_names(tmp_path))
+        with patch("spool.S3Loader.load_to_s3") as mock_load:
+            for job in jobs:
+                job()
+
+        assert [call.args[0] for call in mock_load.call_args_list] == [
+            b'{"text":"first"}\n', b'{"text":"second"}\n']
+        assert segment_names(tmp_path) == []
@@ -0,0 +1,103 @@
+# pylint: skip-file
+
+import threading
+import pytest
+from unittest.mock import MagicMock
+from uploader import BatchUploader, UploaderError, BLOCK, DROP_OLDEST, DROP_NEWEST
+
+
+class TestBatchUploader:
+
+    def test_unknown_policy_raises_error(self):
+        with pytest.raises(UploaderError):
+            BatchUploader(policy="panic")
+
+    def test_jobs_run_on_background_thread(self):
+        uploader = BatchUploader()
+        thread_names = []
+        job = MagicMock(side_effect=lambda: thread_names.append(
+            threading.current_thread().name))
+
+        uploader.start()
+        assert uploader.submit(job)
+        uploader.stop(timeout=5)
+
+        job.assert_called_once()
+        assert thread_names == ["s3-uploader"]
+        assert uploader.stats()["uploaded"] == 1
+
+    def test_failed_job_is_counted_and_worker_survives(self):
+        uploader = BatchUploader()
+        good_job = MagicMock()
+
+        uploader.start()
+        uploader.submit(MagicMock(side_effect=RuntimeError("S3 down")))
+        uploader.submit(good_job)
+        uploader.stop(timeout=5)
+
+        good_job.assert_called_once()
+        assert uploader.stats()["failed"] == 1
+        assert uploader.stats()["uploaded"] == 1
+
+    def test_drop_newest_sheds_new_job_when_full(self):
+        uploader = BatchUploader(max_queue_size=1, policy=DROP_NEWEST)
+        first, second = MagicMock(), MagicMock()
+
+        assert uploader.submit(first)
+        assert not uploader.submit(second)
+
+        stats = uploader.stats()
+        assert stats["dropped"] == 1
+        assert stats["queue_depth"] == 1
+
+        uploader.start()
+        uploader.stop(timeout=5)
+        first.assert_called_once()
+        second.assert_not_called()
+
+    def test_drop_oldest_keeps_new_job_when_full(self):
+        uploader = BatchUploader(max_queue_size=1, policy=DROP_OLDEST)
+        first, second = MagicMock(), MagicMock()
+
+        assert uploader.submit(first)
+        assert uploader.submit(second)
+
+        uploader.start()
+        uploader.stop(timeout=5)
+        first.assert_not_called()
+        second.assert_called_once()
+        assert uploader.stats()["dropped"] == 1
+
+    @pytest.mark.parametrize("policy", [DROP_NEWEST, DROP_OLDEST])
+    def test_on_drop_called_for_shed_job(self, policy):
+        uploader = BatchUploader(max_queue_size=1, policy=policy)
+        dropped = []
+
+        uploader.submit(MagicMock(), on_drop=lambda: dropped.append("first"))
+        uploader.submit(MagicMock(), on_drop=lambda: dropped.append("second"))
+
+        assert dropped == ["second" if policy == DROP_NEWEST else "first"]
+
+    def test_block_policy_gives_up_after_timeout(self):
+        uploader = BatchUploader(
+            max_queue_size=1, policy=BLOCK, block_timeout=0.01)
+
+        assert uploader.submit(MagicMock())
+        assert not uploader.submit(MagicMock())
+        assert uploader.stats()["dropped"] == 1
+
+    def test_max_queue_depth_is_tracked(self):
+        uploader = BatchUploader(max_queue_size=3)
+
+        for _ in range(3):
+            uploader.submit(MagicMock())
+
+        assert uploader.stats()["max_queue_depth"] == 3
+
+    def test_default_policy_never_blocks_when_full(self):
+        uploader = BatchUploader(max_queue_size=1)
+
+        assert uploader.policy == DROP_OLDEST
+        assert uploader.submit(MagicMock())
+        assert uploader.submit(MagicMock())
+        assert uploader.stats()["dropped"] == 1
@@ -0,0 +1,177 @@
+"""Background uploader that takes sealed batches off the firehose thread."""
+import os
+import time
+import queue
+import logging
+import threading
+from collections.abc import Callable
+from metrics import METRICS
+
+logging.basicConfig(
+    filename="pipeline.log",
+    filemode="a",
+    level=logging.INFO,
+    format="%(asctime)s - %(levelname)s - %(message)s"
+)
+
+BLOCK = "block"
+DROP_OLDEST = "drop_oldest"
+DROP_NEWEST = "drop_newest"
+POLICIES = (BLOCK, DROP_OLDEST, DROP_NEWEST)
+
+UPLOAD_QUEUE_SIZE = int(os.getenv("UPLOAD_QUEUE_SIZE", "3"))  # sealed batches waiting for upload
+UPLOAD_POLICY = os.getenv("UPLOAD_POLICY", DROP_OLDEST)  # the default never stalls the firehose
+BLOCK_TIMEOUT = float(os.getenv("BLOCK_TIMEOUT", "5"))  # seconds the firehose may wait on a full queue
+
+
+class UploaderError(Exception):
+    """Error for when configuring or using the BatchUploader"""
+
+
+class BatchUploader:
+    """
+    Runs upload jobs on a dedicated thread, fed through a bounded queue.
+
+    When the queue is full the policy decides what happens:
+    - block: wait up to block_timeout for space, then drop the new job
+    - drop_oldest: discard the oldest waiting job to make room
+    - drop_newest: discard the new job straight away
+
+    A job submitted with on_drop has it called, on the submitting thread,
+    if the job is shed, so it can clean up work it left unfinished.
+    """
+
+    def __init__(self, max_queue_size: int = UPLOAD_QUEUE_SIZE,
+                 policy: str = UPLOAD_POLICY, block_timeout: float = BLOCK_TIMEOUT) -> None:
+        if policy not in POLICIES:
+            raise UploaderError(f"Unknown load-shedding policy: {policy}")
+        if max_queue_size < 1:
+            raise UploaderError("Queue size must be at least 1")
+
+        self.policy = policy
+        self.block_timeout = block_timeout
+        self._queue = queue.Queue(maxsize=max_queue_size)
+        self._lock = threading.Lock()
+        self._thread = None
+        self.counters = {
+            "submitted": 0,
+            "uploaded": 0,
+            "failed": 0,
+            "dropped": 0,
+            "max_queue_depth": 0,
+        }
+
+    @property
+    def queue_depth(self) -> int:
+        """Number of jobs currently waiting for upload"""
+        return self._queue.qsize()
+
+    def stats(self) -> dict:
+        """Snapshot of the uploader counters including the current queue depth"""
+        with self._lock:
+            snapshot = dict(self.counters)
+        snapshot["queue_depth"] = self.queue_depth
+        return snapshot
+
+    def _count(self, name: str, amount: int = 1) -> None:
+        with self._lock:
+            self.counters[name] += amount
+
+    @staticmethod
+    def _dropped(entry: tuple[Callable, Callable | None]) -> None:
+        """Runs the on_drop callback of a shed job, if it has one"""
+        on_drop = entry[1]
+        if on_drop is None:
+            return
+        try:
+            on_drop()
+        except Exception as error:
+            logging.error(f"Error occurred cleaning up a dropped upload: {error}")
+
+    def _enqueue(self, entry: tuple[Callable, Callable | None]) -> bool:
+        """Puts a job on the queue according to the load-shedding policy"""
+        if self.policy == BLOCK:
+            try:
+                self._queue.put(entry, timeout=self.block_timeout)
+                return True
+            except queue.Full:
+                return False
+
+        if self.policy == DROP_OLDEST:
+            while True:
+                try:
+                    self._queue.put_nowait(entry)
+                    return True
+                except queue.Full:
+                    try:
+                        oldest = self._queue.get_nowait()
+                        self._queue.task_done()
+                        self._count("dropped")
+                        logging.warning("Upload queue full, dropped oldest batch")
+                        self._dropped(oldest)
+                    except queue.Empty:
+                        continue
+
+        try:
+            self._queue.put_nowait(entry)
+            return True
+        except queue.Full:
+            return False
+
+    def submit(self, job: Callable, on_drop: Callable | None = None) -> bool:
+        """
+        Hands a zero-argument upload job to the uploader thread.
+        Returns False if the job was shed because the queue was full.
+        """
+        self._count("submitted")
+        entry = (job, on_drop)
+        accepted = self._enqueue(entry)
+        if not accepted:
+            self._count("dropped")
+            logging.warning("Upload queue full, dropped newest batch")
+            self._dropped(entry)
+            return False
+
+        with self._lock:
+            self.counters["max_queue_depth"] = max(
+                self.counters["max_queue_depth"], self.queue_depth)
+        METRICS.set_gauge("upload_queue_depth", self.queue_depth)
+        return True
+
+    def _run(self) -> None:
+        """Worker loop, uploads jobs until a None sentinel is received"""
+        while True:
+            entry = self._queue.get()
+            try:
+                if entry is None:
+                    return
+                job = entry[0]
+                time1 = time.time()
+                job()
+                self._count("uploaded")
+                METRICS.observe("upload_seconds", time.time()-time1)
+                logging.info(
+                    "Upload finished in %s seconds, %s batches waiting",
+                    round(time.time()-time1, 2), self.queue_depth)
+            except Exception as error:
+                self._count("failed")
+                logging.error(f"Error occurred during upload: {error}")
+            finally:
+                self._queue.task_done()
+                METRICS.set_gauge("upload_queue_depth", self.queue_depth)
+
+    def start(self) -> None:
+        """Starts the uploader thread if it is not already running"""
+        if self._thread is not None and self._thread.is_alive():
+            return
+        self._thread = threading.Thread(
+            target=self._run, name="s3-uploader", daemon=True)
+        self._thread.start()
+
+    def stop(self, timeout: float | None = None) -> None:
+        """Waits for queued jobs to finish then stops the uploader thread"""
+        if self._thread is None:
+            return
+        self._queue.put(None)
+        self._thread.join(timeout)
+        self._thread = None
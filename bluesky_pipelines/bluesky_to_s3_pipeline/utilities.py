@@ -9,6 +9,8 @@ class MessageError(Exception):
 class Message:
     """message recieved from API"""
 
+    __slots__ = ("text", "langs", "type", "_timestamp", "_timestamp_string")
+
     def __init__(self, message_dict: dict):
         self._validation(message_dict)
 
@@ -17,7 +19,6 @@ class Message:
         self.type = message_dict.get("$type")
         self._timestamp = None
         self._timestamp_string = message_dict.get("createdAt")
-        self._json = None
 
     def _validation(self, message_dict: dict):
         required_fields = [
@@ -43,12 +44,15 @@ class Message:
 
     @property
     def json(self) -> dict:
-        if self._json is None:
-            self._json = {
-                "text": self.text,
-                "langs": self.langs,
-                "$type": self.type,
-                "createdAt": self._timestamp_string
-            }
-
-        return self._json
+        """The fields kept from the raw message, built on demand"""
+        return {
+            "text": self.text,
+            "langs": self.langs,
+            "$type": self.type,
+            "createdAt": self._timestamp_string
+        }
+
+    @property
+    def encoded(self) -> bytes:
+        """The message json as one compact NDJSON line, ready to append to a batch"""
+        return json.dumps(self.json, separators=(",", ":")).encode("utf-8") + b"\n"
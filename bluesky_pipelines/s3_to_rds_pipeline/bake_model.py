@@ -0,0 +1,66 @@
+"""
+Bakes the sentiment model into the Lambda image at build time: downloads the
+model and tokenizer once and saves them as safetensors to SENTIMENT_MODEL_PATH,
+so a cold start memory-maps the weights from local disk with no hub lookups.
+For the onnx backend the model is also exported to SENTIMENT_ONNX_DIR.
+
+    python3 bake_model.py --backend onnx
+"""
+import os
+import sys
+import hashlib
+import logging
+import argparse
+from transformers import pipeline
+from transform import TRANSFORMER_MODEL, SENTIMENT_MODEL_PATH
+from sentiment_backends import (BACKENDS, PYTORCH, ONNX, ONNX_MODEL_DIR, WEIGHTS_DIGEST_FILE,
+                                export_onnx, model_source)
+
+logging.basicConfig(
+    level=logging.INFO,
+    format="%(asctime)s - %(levelname)s - %(message)s"
+)
+
+WEIGHTS_FILE = "model.safetensors"
+
+
+def save(sentiment_pipeline, directory: str) -> str:
+    """Saves a text-classification pipeline's model as safetensors and its
+    tokenizer to directory, with a digest of the weights, returning the
+    weights' path."""
+    os.makedirs(directory, exist_ok=True)
+    sentiment_pipeline.model.save_pretrained(directory, safe_serialization=True)
+    sentiment_pipeline.tokenizer.save_pretrained(directory)
+    weights = os.path.join(directory, WEIGHTS_FILE)
+    if not os.path.exists(weights):
+        raise FileNotFoundError(f"No safetensors weights were saved to {directory}")
+    with open(weights, "rb") as file:
+        digest = hashlib.file_digest(file, "sha256").hexdigest()
+    with open(os.path.join(directory, WEIGHTS_DIGEST_FILE), "w", encoding="utf-8") as file:
+        file.write(digest)
+    logging.info("Saved the sentiment model to %s.", directory)
+    return weights
+
+
+def bake(model: str = TRANSFORMER_MODEL, directory: str = SENTIMENT_MODEL_PATH,
+         backend: str = PYTORCH, onnx_dir: str = ONNX_MODEL_DIR) -> None:
+    """Downloads model and saves it to directory, exporting it to onnx_dir too
+    for the onnx backend."""
+    if not directory:
+        raise ValueError("No directory to bake the model into, set SENTIMENT_MODEL_PATH")
+    reference = pipeline(model=model)
+    save(reference, directory)
+    if backend == ONNX:
+        # recorded as made from the baked copy, which is what the image loads
+        export_onnx(reference, onnx_dir, model_source(directory))
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--model", default=TRANSFORMER_MODEL)
+    parser.add_argument("--directory", default=SENTIMENT_MODEL_PATH)
+    parser.add_argument("--backend", default=PYTORCH, choices=BACKENDS)
+    parser.add_argument("--onnx-dir", default=ONNX_MODEL_DIR)
+    args = parser.parse_args(sys.argv[1:])
+
+    bake(args.model, args.directory, args.backend, args.onnx_dir)
@@ -0,0 +1,89 @@
+"""Ledger of raw batches already loaded into the RDS, so every batch is
+processed exactly once even when ETL runs fail or overlap."""
+
+import logging
+from collections.abc import Callable, Iterable
+import pandas as pd
+import sqlalchemy
+
+logging.basicConfig(
+    level=logging.INFO,
+    format="%(asctime)s - %(levelname)s - %(message)s"
+)
+
+
+class BatchLedger:
+    """Reads and writes the processed_batch table."""
+
+    def __init__(self, engine: sqlalchemy.engine.Engine, schema: str = "bluesky"):
+        self.engine = engine
+        self.schema = schema
+
+    def processed_keys(self, keys: list[str]) -> set[str]:
+        """Returns which of the given batch keys have already been loaded."""
+        if not keys:
+            return set()
+        with self.engine.connect() as conn:
+            result = conn.execute(
+                sqlalchemy.text(
+                    f"SELECT batch_key FROM {self.schema}.processed_batch "
+                    "WHERE batch_key = ANY(:keys)"),
+                {"keys": list(keys)})
+            return {row[0] for row in result}
+
+    def pending_keys(self, keys: list[str]) -> list[str]:
+        """Returns the batch keys not loaded yet, keeping their order."""
+        processed = self.processed_keys(keys)
+        return [key for key in keys if key not in processed]
+
+    def load_batch(self, key: str, df: pd.DataFrame, message_count: int) -> bool:
+        """Claims a batch and appends its mentions in one transaction. Returns
+        False, loading nothing, if another run has already claimed the batch."""
+        with self.engine.begin() as conn:
+            claimed = conn.execute(
+                sqlalchemy.text(
+                    f"INSERT INTO {self.schema}.processed_batch "
+                    "(batch_key, message_count, mention_count) "
+                    "VALUES (:key, :message_count, :mention_count) "
+                    "ON CONFLICT (batch_key) DO NOTHING RETURNING batch_key"),
+                {"key": key, "message_count": message_count,
+                 "mention_count": len(df)}).first()
+            if claimed is None:
+                logging.warning("Batch %s was already loaded, skipping.", key)
+                return False
+            if not df.empty:
+                df.to_sql("mention", con=conn, if_exists="append",
+                          index=False, schema=self.schema)
+        return True
+
+    def load_batch_stream(self, key: str, frames: Iterable[pd.DataFrame],
+                          message_count: Callable[[], int]) -> int | None:
+        """Claims a batch, then appends its mentions a frame at a time as frames
+        yields them, all in one transaction, so the batch is still loaded all
+        or nothing and exactly once. message_count is asked for once frames
+        is exhausted. Returns the number of mentions loaded, or None, loading
+        nothing and leaving frames unread, if another run has claimed the batch."""
+        with self.engine.begin() as conn:
+            claimed = conn.execute(
+                sqlalchemy.text(
+                    f"INSERT INTO {self.schema}.processed_batch "
+                    "(batch_key, message_count, mention_count) "
+                    "VALUES (:key, 0, 0) "
+                    "ON CONFLICT (batch_key) DO NOTHING RETURNING batch_key"),
+                {"key": key}).first()
+            if claimed is None:
+                logging.warning("Batch %s was already loaded, skipping.", key)
+                return None
+            mentions = 0
+            for df in frames:
+                if not df.empty:
+                    df.to_sql("mention", con=conn, if_exists="append",
+                              index=False, schema=self.schema)
+                    mentions += len(df)
+            conn.execute(
+                sqlalchemy.text(
+                    f"UPDATE {self.schema}.processed_batch "
+                    "SET message_count = :message_count, mention_count = :mention_count "
+                    "WHERE batch_key = :key"),
+                {"key": key, "message_count": message_count(), "mention_count": mentions})
+        return mentions
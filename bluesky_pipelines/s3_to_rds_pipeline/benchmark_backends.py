@@ -0,0 +1,104 @@
+"""
+Throughput, memory and parity of the sentiment backends: full precision PyTorch,
+int8 dynamically quantised PyTorch and ONNX Runtime. Each backend is loaded and
+run in a fresh process, so its peak RSS is its own.
+
+    python3 benchmark_backends.py --posts 1000 --batch-size 32
+Without access to the HuggingFace hub, compare on a randomly initialised model
+of bertweet's shape (throughput, memory and score drift hold, but every text
+gets the same label, so label agreement says nothing):
+    python3 benchmark_backends.py --random-weights
+"""
+import sys
+import json
+import time
+import argparse
+import tempfile
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor
+from transform import MessageTransformer, TRANSFORMER_MODEL, SENTIMENT_BATCH_SIZE
+from sentiment_backends import (BACKENDS, PYTORCH, QUANTIZED, ONNX, quantize, export_onnx,
+                                onnx_pipeline, OnnxSentimentPipeline, parity)
+from benchmark_sentiment import fixture_batch, random_weights_pipeline
+
+
+def memory_mb(field: str) -> float:
+    """A memory figure of this process from /proc/self/status: VmRSS now, or
+    VmHWM, the peak since it started (unlike ru_maxrss, not inherited over exec)"""
+    with open("/proc/self/status", encoding="utf-8") as status:
+        for line in status:
+            if line.startswith(f"{field}:"):
+                return round(int(line.split()[1]) / 1024, 1)
+    return 0.0
+
+
+def load(backend: str, model: str, texts: list[str], onnx_dir: str, random_weights: bool):
+    """The backend's pipeline, of the hub model or of the seeded random one"""
+    if not random_weights:
+        return onnx_pipeline(model, onnx_dir) if backend == ONNX \
+            else MessageTransformer({}, model, backend=backend).sentiment_pipeline
+    if backend == ONNX:
+        return OnnxSentimentPipeline(onnx_dir)
+    reference = random_weights_pipeline(texts)
+    return quantize(reference) if backend == QUANTIZED else reference
+
+
+def run_backend(backend: str, model: str, texts: list[str], batch_size: int,
+                onnx_dir: str, random_weights: bool) -> dict:
+    """Loads and runs one backend, timing both, in the calling process"""
+    time1 = time.perf_counter()
+    transformer = MessageTransformer({}, model, backend=backend)
+    transformer._sentiment_pipeline = load(  # pylint: disable=W0212
+        backend, model, texts, onnx_dir, random_weights)
+    time2 = time.perf_counter()
+    loaded_rss = memory_mb("VmRSS")
+    transformer._score_batches(texts[:batch_size], batch_size)  # pylint: disable=W0212
+    time3 = time.perf_counter()
+    sentiments = transformer._score_batches(texts, batch_size)  # pylint: disable=W0212
+    time4 = time.perf_counter()
+    return {
+        "backend": backend,
+        "load_seconds": round(time2 - time1, 2),
+        "warm_up_seconds": round(time3 - time2, 2),
+        "messages_per_second": round(len(texts) / (time4 - time3), 1),
+        "loaded_rss_mb": loaded_rss,
+        "peak_rss_mb": memory_mb("VmHWM"),
+        "sentiments": sentiments,
+    }
+
+
+def compare_backends(backends: list[str], model: str, texts: list[str], batch_size: int,
+                     random_weights: bool = False) -> list[dict]:
+    """Runs every backend in its own process, with parity against PyTorch"""
+    onnx_dir = tempfile.mkdtemp(prefix="sentiment_onnx_")
+    if ONNX in backends and random_weights:
+        export_onnx(random_weights_pipeline(texts), onnx_dir)
+    results = []
+    for backend in backends:
+        with ProcessPoolExecutor(1, mp_context=multiprocessing.get_context("spawn")) as pool:
+            results.append(pool.submit(run_backend, backend, model, texts, batch_size,
+                                       onnx_dir, random_weights).result())
+
+    reference = next((result["sentiments"] for result in results
+                      if result["backend"] == PYTORCH), None)
+    for result in results:
+        sentiments = result.pop("sentiments")
+        if reference is not None:
+            result.update(parity(reference, sentiments))
+    return results
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--posts", type=int, default=1000)
+    parser.add_argument("--batch-size", type=int, default=SENTIMENT_BATCH_SIZE)
+    parser.add_argument("--backends", default=",".join(BACKENDS))
+    parser.add_argument("--model", default=TRANSFORMER_MODEL)
+    parser.add_argument("--random-weights", action="store_true",
+                        help="use an untrained model of bertweet's shape")
+    args = parser.parse_args(sys.argv[1:])
+
+    for line in compare_backends(args.backends.split(","), args.model,
+                                 fixture_batch(args.posts), args.batch_size,
+                                 args.random_weights):
+        print(json.dumps(line))
@@ -0,0 +1,93 @@
+"""
+Cold start breakdown of the sentiment model baked into the image: each run is
+a fresh interpreter timing the import of torch and transformers, the tokenizer
+load, the weight load and the first inference, with the RSS after loading.
+
+    python3 benchmark_cold_start.py --directory "${SENTIMENT_MODEL_PATH}" --runs 5
+Without access to the HuggingFace hub, bake a randomly initialised model of
+bertweet's shape first:
+    python3 benchmark_cold_start.py --random-weights
+"""
+import os
+import sys
+import json
+import time
+import argparse
+import tempfile
+import statistics
+import subprocess
+
+STAGES = ("import_seconds", "tokenizer_seconds", "weights_seconds", "pipeline_seconds",
+          "first_inference_seconds", "total_seconds")
+
+
+def cold_start(directory: str) -> dict:
+    """Loads the model in directory stage by stage, in what must be a fresh
+    interpreter for the import time to mean anything."""
+    time1 = time.perf_counter()
+    # pylint: disable=C0415
+    import torch  # pylint: disable=W0611
+    from transformers import AutoTokenizer, AutoModelForSequenceClassification, pipeline
+    from sentiment_backends import LOCAL_MODEL_KWARGS
+    from benchmark_backends import memory_mb
+    time2 = time.perf_counter()
+    tokenizer = AutoTokenizer.from_pretrained(directory)
+    time3 = time.perf_counter()
+    model = AutoModelForSequenceClassification.from_pretrained(directory, **LOCAL_MODEL_KWARGS)
+    time4 = time.perf_counter()
+    sentiment_pipeline = pipeline("text-classification", model=model, tokenizer=tokenizer)
+    time5 = time.perf_counter()
+    loaded_rss = memory_mb("VmRSS")
+    sentiment_pipeline("is anyone else watching the football right now?")
+    time6 = time.perf_counter()
+    return {
+        "import_seconds": round(time2 - time1, 3),
+        "tokenizer_seconds": round(time3 - time2, 3),
+        "weights_seconds": round(time4 - time3, 3),
+        "pipeline_seconds": round(time5 - time4, 3),
+        "first_inference_seconds": round(time6 - time5, 3),
+        "total_seconds": round(time6 - time1, 3),
+        "loaded_rss_mb": loaded_rss,
+    }
+
+
+def run(directory: str, runs: int) -> dict:
+    """Median of each stage over runs fresh interpreters, offline like the Lambda"""
+    env = {**os.environ, "HF_HUB_OFFLINE": "1", "TRANSFORMERS_OFFLINE": "1"}
+    samples = []
+    for _ in range(runs):
+        child = subprocess.run(
+            [sys.executable, os.path.abspath(__file__), "--child", directory],
+            capture_output=True, text=True, check=True, env=env,
+            cwd=os.path.dirname(os.path.abspath(__file__)))
+        samples.append(json.loads(child.stdout.strip().splitlines()[-1]))
+    return {
+        "directory": directory,
+        "runs": runs,
+        "weights_mb": round(os.path.getsize(os.path.join(directory, "model.safetensors")) / 2**20, 1),
+        **{stage: statistics.median(sample[stage] for sample in samples)
+           for stage in (*STAGES, "loaded_rss_mb")},
+    }
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--directory", default=os.environ.get("SENTIMENT_MODEL_PATH", ""))
+    parser.add_argument("--runs", type=int, default=3)
+    parser.add_argument("--random-weights", action="store_true",
+                        help="bake an untrained model of bertweet's shape to a temporary directory")
+    parser.add_argument("--child", help=argparse.SUPPRESS)
+    args = parser.parse_args(sys.argv[1:])
+
+    if args.child:
+        print(json.dumps(cold_start(args.child)))
+        sys.exit(0)
+    if args.random_weights:
+        # pylint: disable=C0415
+        from bake_model import save
+        from benchmark_sentiment import load_corpus, random_weights_pipeline
+        args.directory = tempfile.mkdtemp(prefix="sentiment_model_")
+        save(random_weights_pipeline([row["text"] for row in load_corpus()]), args.directory)
+    if not args.directory:
+        parser.error("no baked model, pass --directory or --random-weights")
+    print(json.dumps(run(args.directory, args.runs), indent=2))
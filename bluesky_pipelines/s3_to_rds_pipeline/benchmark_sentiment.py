@@ -0,0 +1,140 @@
+"""
+Throughput comparison of scoring sentiment one message per forward pass
+against batched inference, on a reproducible fixture batch of posts.
+
+    python3 benchmark_sentiment.py --posts 2000 --batch-sizes 8,32,64
+Without access to the HuggingFace hub, use a randomly initialised model of
+the same shape as bertweet (the timings hold, the labels are meaningless):
+    python3 benchmark_sentiment.py --random-weights
+"""
+import os
+import sys
+import json
+import time
+import random
+import argparse
+from transform import MessageTransformer, TRANSFORMER_MODEL, MAX_TOKENS, SENTIMENT_BATCH_SIZE
+from sentiment_cache import SentimentCache
+
+CORPUS_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), "sentiment_corpus.jsonl")
+FIXTURE_TOPICS = ("football", "trump", "cricket", "england", "taylor swift", "bitcoin")
+FIXTURE_PHRASES = (
+    "honestly can't believe what happened with {topic} today",
+    "is anyone else watching {topic} right now?",
+    "{topic} is the best thing to happen this year, no notes",
+    "I'm so tired of hearing about {topic} on every single feed",
+    "hot take: {topic} is overrated and everyone knows it",
+    "my dad just texted me about {topic} lol",
+    "the {topic} thread from earlier was wild, read the replies",
+    "not sure how I feel about {topic} but here we are",
+)
+FIXTURE_FILLER = ("anyway", "back to work", "what a week", "🙃", "#blessed",
+                  "more on this later", "thoughts?", "sigh", "🔥🔥🔥", "ok goodnight")
+
+
+def load_corpus(path: str = CORPUS_PATH) -> list[dict]:
+    """The hand labelled posts, each a dict of text and label"""
+    with open(path, encoding="utf-8") as file:
+        return [json.loads(line) for line in file]
+
+
+def fixture_batch(posts: int, seed: int = 0) -> list[str]:
+    """Reproducible post texts mentioning topics, from a few words to past
+    the model's maximum length, like a raw batch after matching."""
+    rng = random.Random(seed)
+    texts = []
+    for _ in range(posts):
+        sentences = [rng.choice(FIXTURE_PHRASES).format(topic=rng.choice(FIXTURE_TOPICS))]
+        sentences += rng.choices(FIXTURE_FILLER + FIXTURE_PHRASES[:3],
+                                 k=min(int(rng.expovariate(1 / 3)), 40))
+        texts.append(". ".join(sentence.format(topic=rng.choice(FIXTURE_TOPICS))
+                               for sentence in sentences))
+    return texts
+
+
+def random_weights_pipeline(texts: list[str], layers: int = 12, hidden: int = 768,
+                            seed: int = 0):
+    """A text-classification pipeline with bertweet's architecture (or a smaller
+    one) and random weights, and a word-level tokenizer trained on texts.
+    The same seed and texts give the same model."""
+    # pylint: disable=C0415
+    import torch
+    from tokenizers import Tokenizer, models, pre_tokenizers, processors, trainers
+    from transformers import (PreTrainedTokenizerFast, RobertaConfig,
+                              RobertaForSequenceClassification, pipeline)
+
+    tokenizer = Tokenizer(models.WordLevel(unk_token="<unk>"))
+    tokenizer.pre_tokenizer = pre_tokenizers.Whitespace()
+    tokenizer.train_from_iterator(
+        texts, trainers.WordLevelTrainer(special_tokens=["<s>", "<pad>", "</s>", "<unk>"]))
+    tokenizer.post_processor = processors.TemplateProcessing(
+        single="<s> $A </s>", special_tokens=[("<s>", 0), ("</s>", 2)])
+    labels = {0: "NEG", 1: "NEU", 2: "POS"}
+    config = RobertaConfig(vocab_size=64001, max_position_embeddings=MAX_TOKENS + 2,
+                           num_hidden_layers=layers, hidden_size=hidden,
+                           num_attention_heads=max(hidden // 64, 1), intermediate_size=hidden * 4,
+                           type_vocab_size=1, pad_token_id=1, num_labels=3, id2label=labels,
+                           label2id={label: index for index, label in labels.items()})
+    torch.manual_seed(seed)
+    return pipeline(
+        "text-classification",
+        model=RobertaForSequenceClassification(config).eval(),
+        tokenizer=PreTrainedTokenizerFast(
+            tokenizer_object=tokenizer, model_max_length=MAX_TOKENS, bos_token="<s>",
+            eos_token="</s>", pad_token="<pad>", unk_token="<unk>"))
+
+
+def compare(transformer: MessageTransformer, texts: list[str],
+            batch_sizes: list[int]) -> dict:
+    """Messages per second scored one per forward pass (batch size 1) and at
+    each batch size, with the speedup over one at a time. The cache is
+    bypassed, so every run scores every text."""
+    transformer.get_sentiments(texts[:8])  # loads the model and warms it up
+    seconds = {}
+    for batch_size in [1, *batch_sizes]:
+        time1 = time.perf_counter()
+        transformer._score_batches(texts, batch_size)  # pylint: disable=W0212
+        seconds[batch_size] = time.perf_counter() - time1
+    return {
+        f"batch_{batch_size}": {"seconds": round(taken, 2),
+                                "messages_per_second": round(len(texts) / taken, 1),
+                                "speedup": round(seconds[1] / taken, 2)}
+        for batch_size, taken in seconds.items()
+    }
+
+
+def cache_savings(transformer: MessageTransformer, texts: list[str],
+                  chunk_size: int = 250) -> dict:
+    """Hit ratio and time of scoring texts chunk by chunk through a fresh
+    cache, as the ETL does within a run, against scoring every text"""
+    time1 = time.perf_counter()
+    for start in range(0, len(texts), chunk_size):
+        transformer._score_batches(texts[start:start + chunk_size],  # pylint: disable=W0212
+                                   SENTIMENT_BATCH_SIZE)
+    time2 = time.perf_counter()
+    transformer.cache = SentimentCache()
+    for start in range(0, len(texts), chunk_size):
+        transformer.get_sentiments(texts[start:start + chunk_size], SENTIMENT_BATCH_SIZE)
+    time3 = time.perf_counter()
+    return {**transformer.cache.stats(),
+            "seconds_uncached": round(time2 - time1, 2),
+            "seconds_cached": round(time3 - time2, 2)}
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--posts", type=int, default=2000)
+    parser.add_argument("--batch-sizes", default="8,32,64")
+    parser.add_argument("--model", default=TRANSFORMER_MODEL)
+    parser.add_argument("--random-weights", action="store_true",
+                        help="use an untrained model of bertweet's shape")
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args(sys.argv[1:])
+
+    fixture = fixture_batch(args.posts, args.seed)
+    sentiment_transformer = MessageTransformer({}, sentiment_model=args.model)
+    if args.random_weights:
+        sentiment_transformer._sentiment_pipeline = random_weights_pipeline(fixture)  # pylint: disable=W0212
+    report = compare(sentiment_transformer, fixture,
+                     [int(size) for size in args.batch_sizes.split(",")])
+    report["cache"] = cache_savings(sentiment_transformer, fixture)
+    print(json.dumps(report, indent=2))
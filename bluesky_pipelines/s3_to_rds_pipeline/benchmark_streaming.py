@@ -0,0 +1,84 @@
+"""
+Wall time and peak Python memory of one raw batch through the ETL: transformed
+whole and then loaded, its stages run in turn a chunk at a time, and its
+stages overlapped through bounded queues. Downloading and loading are
+simulated with a wait per chunk, scoring runs a small random-weights model.
+
+    python3 benchmark_streaming.py --posts 8000 --read-ms 300 --load-ms 300
+"""
+import sys
+import json
+import time
+import logging
+import argparse
+import tracemalloc
+from transform import MessageTransformer
+from sentiment_cache import SentimentCache
+from extract_from_s3 import Converter
+from benchmark_transform import fixture_messages
+from benchmark_sentiment import FIXTURE_TOPICS, random_weights_pipeline
+
+
+def slow_source(items: list[dict], chunk_size: int, read_seconds: float):
+    """Yields items, waiting read_seconds before each chunk_size of them, like a download"""
+    for index, item in enumerate(items):
+        if index % chunk_size == 0:
+            time.sleep(read_seconds)
+        yield item
+
+
+def whole_batch(items: list[dict], transformer: MessageTransformer, chunk_size: int,
+                read_seconds: float, load_seconds: float) -> int:
+    """Transforms the whole batch into one DataFrame, then loads it"""
+    df = Converter.transform_messages_into_dataframe(
+        slow_source(items, chunk_size, read_seconds), transformer, chunk_size)
+    time.sleep(load_seconds * -(-len(items) // chunk_size))
+    return len(df)
+
+
+def streamed(items: list[dict], transformer: MessageTransformer, chunk_size: int,
+             read_seconds: float, load_seconds: float, queue_size: int) -> int:
+    """Loads a frame per chunk as the stream yields it"""
+    mentions = 0
+    for df in Converter.stream_mentions(slow_source(items, chunk_size, read_seconds),
+                                        transformer, chunk_size, queue_size=queue_size):
+        time.sleep(load_seconds)
+        mentions += len(df)
+    return mentions
+
+
+def measure(run, *args) -> dict:
+    """Seconds of one run, and the peak Python memory of another, traced, run"""
+    time1 = time.perf_counter()
+    mentions = run(*args)
+    seconds = time.perf_counter() - time1
+    tracemalloc.start()
+    run(*args)
+    peak = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+    return {"seconds": round(seconds, 2), "peak_python_mb": round(peak / 2**20, 1),
+            "mentions": mentions}
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--posts", type=int, default=8000)
+    parser.add_argument("--chunk-size", type=int, default=1024)
+    parser.add_argument("--read-ms", type=float, default=300)
+    parser.add_argument("--load-ms", type=float, default=300)
+    parser.add_argument("--queue-size", type=int, default=2)
+    args = parser.parse_args(sys.argv[1:])
+
+    logging.disable(logging.INFO)  # the per chunk logging would swamp the report
+    fixture = fixture_messages(args.posts)
+    transformer = MessageTransformer({topic: index for index, topic in enumerate(FIXTURE_TOPICS)},
+                                     cache=SentimentCache(0))
+    transformer._sentiment_pipeline = random_weights_pipeline(  # pylint: disable=W0212
+        [item["text"] for item in fixture], layers=2, hidden=128)
+    timing = (args.chunk_size, args.read_ms / 1e3, args.load_ms / 1e3)
+    report = {
+        "whole_batch": measure(whole_batch, fixture, transformer, *timing),
+        "chunks_in_turn": measure(streamed, fixture, transformer, *timing, 0),
+        "overlapped": measure(streamed, fixture, transformer, *timing, args.queue_size),
+    }
+    print(json.dumps(report, indent=2))
@@ -0,0 +1,181 @@
+"""
+Sentiment benchmark suite: model load time, messages per second, p50 and p99
+per-message latency, peak RSS and accuracy on the labelled corpus, for every
+backend and batch size, written as json to track regressions across
+transformers and torch upgrades.
+
+    python3 benchmark_suite.py --output benchmark_results.json
+Compare with an earlier run, exiting with status 1 on a regression:
+    python3 benchmark_suite.py --baseline benchmark_results.json --tolerance 0.15
+Without access to the HuggingFace hub, use a randomly initialised model of
+bertweet's shape (accuracy is then meaningless):
+    python3 benchmark_suite.py --random-weights
+"""
+import sys
+import json
+import math
+import time
+import platform
+import argparse
+import tempfile
+import itertools
+import multiprocessing
+from datetime import datetime, timezone
+from importlib import metadata
+from concurrent.futures import ProcessPoolExecutor
+from transform import MessageTransformer, TRANSFORMER_MODEL, SENTIMENT_BATCH_SIZE
+from sentiment_backends import BACKENDS, ONNX, export_onnx
+from benchmark_sentiment import load_corpus, random_weights_pipeline
+from benchmark_backends import load, memory_mb
+
+PACKAGES = ("torch", "transformers", "tokenizers", "onnxruntime", "numpy")
+BATCH_SIZES = (1, 8, SENTIMENT_BATCH_SIZE, 64)
+# a regression is a move past the tolerance in the worse direction of these
+HIGHER_IS_BETTER = {"messages_per_second": True, "p50_ms": False, "p99_ms": False,
+                    "peak_rss_mb": False, "load_seconds": False}
+ACCURACY_DROP = 0.02  # absolute, as accuracy is already a ratio
+
+
+def environment() -> dict:
+    """The versions and hardware a run depends on"""
+    versions = {}
+    for package in PACKAGES:
+        try:
+            versions[package] = metadata.version(package)
+        except metadata.PackageNotFoundError:
+            versions[package] = None
+    return {"python": platform.python_version(), "platform": platform.platform(),
+            "cpus": multiprocessing.cpu_count(), "packages": versions}
+
+
+def percentile(values: list[float], quantile: float) -> float:
+    """The nearest-rank percentile of values, quantile between 0 and 1"""
+    ordered = sorted(values)
+    return ordered[max(math.ceil(quantile * len(ordered)) - 1, 0)] if ordered else 0.0
+
+
+def measure(transformer: MessageTransformer, texts: list[str], batch_size: int) -> dict:
+    """Scores texts in length-sorted batches like the ETL, bypassing the cache.
+    A message's latency is the time of the forward pass that scored it."""
+    ordered = sorted(texts, key=len)
+    latencies = []
+    time1 = time.perf_counter()
+    for start in range(0, len(ordered), batch_size):
+        batch = ordered[start:start + batch_size]
+        batch_start = time.perf_counter()
+        transformer._score_batches(batch, batch_size)  # pylint: disable=W0212
+        latencies.extend([time.perf_counter() - batch_start] * len(batch))
+    seconds = time.perf_counter() - time1
+    return {
+        "messages_per_second": round(len(texts) / seconds, 1),
+        "p50_ms": round(percentile(latencies, 0.5) * 1e3, 1),
+        "p99_ms": round(percentile(latencies, 0.99) * 1e3, 1),
+    }
+
+
+def accuracy(transformer: MessageTransformer, corpus: list[dict]) -> float:
+    """Share of the labelled corpus given its label"""
+    sentiments = transformer._score_batches(  # pylint: disable=W0212
+        [row["text"] for row in corpus], SENTIMENT_BATCH_SIZE)
+    right = sum(1 for row, sentiment in zip(corpus, sentiments)
+                if sentiment and sentiment["label"] == row["label"])
+    return round(right / len(corpus), 4)
+
+
+def run_backend(backend: str, model: str, corpus: list[dict], posts: int,
+                batch_sizes: list[int], onnx_dir: str, random_weights: bool) -> list[dict]:
+    """Every batch size of one backend, in the calling process. Batch sizes run
+    smallest first, so each row's peak RSS covers it and the sizes before it."""
+    texts = [row["text"] for row in itertools.islice(itertools.cycle(corpus), posts)]
+    time1 = time.perf_counter()
+    transformer = MessageTransformer({}, model, backend=backend)
+    transformer._sentiment_pipeline = load(  # pylint: disable=W0212
+        backend, model, [row["text"] for row in corpus], onnx_dir, random_weights)
+    load_seconds = round(time.perf_counter() - time1, 2)
+    loaded_rss = memory_mb("VmRSS")
+    transformer._score_batches(texts[:8], 8)  # pylint: disable=W0212
+    corpus_accuracy = accuracy(transformer, corpus)
+
+    rows = []
+    for batch_size in sorted(batch_sizes):
+        rows.append({
+            "backend": backend,
+            "batch_size": batch_size,
+            "load_seconds": load_seconds,
+            **measure(transformer, texts, batch_size),
+            "loaded_rss_mb": loaded_rss,
+            "peak_rss_mb": memory_mb("VmHWM"),
+            "accuracy": corpus_accuracy,
+        })
+    return rows
+
+
+def run_suite(backends: list[str], batch_sizes: list[int], model: str = TRANSFORMER_MODEL,
+              posts: int = 1000, random_weights: bool = False) -> dict:
+    """Runs every backend in a fresh process, so load time and RSS are its own"""
+    corpus = load_corpus()
+    onnx_dir = tempfile.mkdtemp(prefix="sentiment_onnx_")
+    if ONNX in backends and random_weights:
+        export_onnx(random_weights_pipeline([row["text"] for row in corpus]), onnx_dir)
+    results = []
+    for backend in backends:
+        with ProcessPoolExecutor(1, mp_context=multiprocessing.get_context("spawn")) as pool:
+            results.extend(pool.submit(run_backend, backend, model, corpus, posts,
+                                       batch_sizes, onnx_dir, random_weights).result())
+    return {
+        "run_at": datetime.now(timezone.utc).isoformat(timespec="seconds"),
+        "environment": environment(),
+        "config": {"model": model, "random_weights": random_weights, "posts": posts,
+                   "corpus_size": len(corpus)},
+        "results": results,
+    }
+
+
+def regressions(current: dict, baseline: dict, tolerance: float) -> list[str]:
+    """Describes every backend and batch size that got worse than the baseline
+    by more than tolerance, a fraction of the baseline value"""
+    earlier = {(row["backend"], row["batch_size"]): row for row in baseline["results"]}
+    found = []
+    for row in current["results"]:
+        before = earlier.get((row["backend"], row["batch_size"]))
+        if before is None:
+            continue
+        name = f"{row['backend']} batch {row['batch_size']}"
+        for metric, higher_is_better in HIGHER_IS_BETTER.items():
+            change = (row[metric] - before[metric]) / before[metric] if before[metric] else 0.0
+            if (-change if higher_is_better else change) > tolerance:
+                found.append(f"{name}: {metric} {before[metric]} -> {row[metric]}")
+        if before["accuracy"] - row["accuracy"] > ACCURACY_DROP:
+            found.append(f"{name}: accuracy {before['accuracy']} -> {row['accuracy']}")
+    return found
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--backends", default=",".join(BACKENDS))
+    parser.add_argument("--batch-sizes", default=",".join(map(str, BATCH_SIZES)))
+    parser.add_argument("--posts", type=int, default=1000,
+                        help="texts scored per configuration, cycling the corpus")
+    parser.add_argument("--model", default=TRANSFORMER_MODEL)
+    parser.add_argument("--random-weights", action="store_true",
+                        help="use an untrained model of bertweet's shape")
+    parser.add_argument("--output", help="write the results to this json file")
+    parser.add_argument("--baseline", help="json results of an earlier run to compare with")
+    parser.add_argument("--tolerance", type=float, default=0.15)
+    args = parser.parse_args(sys.argv[1:])
+
+    report = run_suite(args.backends.split(","),
+                       sorted({int(size) for size in args.batch_sizes.split(",")}),
+                       args.model, args.posts, args.random_weights)
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as file:
+            json.dump(report, file, indent=2)
+    print(json.dumps(report, indent=2))
+
+    if args.baseline:
+        with open(args.baseline, encoding="utf-8") as file:
+            found = regressions(report, json.load(file), args.tolerance)
+        for regression in found:
+            print(f"REGRESSION {regression}", file=sys.stderr)
+        if found:
+            sys.exit(1)
@@ -0,0 +1,75 @@
+"""
+Benchmark of finding topics in posts with the Aho-Corasick TopicMatcher against
+the previous loop over every topic, at 10, 1k and 10k topics.
+
+    python3 benchmark_topics.py --posts 45000 --topics 10,1000,10000
+"""
+import sys
+import json
+import time
+import random
+import argparse
+from topic_matcher import TopicMatcher
+from benchmark_sentiment import FIXTURE_TOPICS, fixture_batch
+
+SYLLABLES = ("ka", "lo", "mi", "ne", "ru", "sa", "ti", "vo", "ze", "an", "or", "el")
+
+
+def topic_names(count: int, seed: int = 0) -> list[str]:
+    """The fixture's topics followed by made-up one and two word topics"""
+    rng = random.Random(seed)
+    names = list(FIXTURE_TOPICS[:count])
+    while len(names) < count:
+        words = ["".join(rng.choices(SYLLABLES, k=rng.randint(2, 4)))
+                 for _ in range(rng.choice((1, 1, 2)))]
+        names.append(" ".join(words))
+    return names
+
+
+def loop_find(topics: list[str], text: str) -> list[str]:
+    """The previous find_topics_in_text, lowering the text once per topic"""
+    return [topic for topic in topics if topic.lower() in text.lower()]
+
+
+def time_per_post(find, posts: list[str]) -> float:
+    """Microseconds per post"""
+    time1 = time.perf_counter()
+    for post in posts:
+        find(post)
+    return (time.perf_counter() - time1) / len(posts) * 1e6
+
+
+def run(posts: list[str], topic_count: int, loop_posts: int) -> dict:
+    """Build time and per-post cost of both matchers, the loop timed on the
+    first loop_posts posts and projected to all of them"""
+    topics = topic_names(topic_count)
+    time1 = time.perf_counter()
+    matcher = TopicMatcher(topics)
+    build = time.perf_counter() - time1
+    whole_words = TopicMatcher(topics, whole_words=True)
+
+    matcher_us = time_per_post(matcher.find, posts)
+    loop_us = time_per_post(lambda post: loop_find(topics, post), posts[:loop_posts])
+    return {
+        "topics": topic_count,
+        "build_ms": round(build * 1e3, 1),
+        "matcher_us_per_post": round(matcher_us, 2),
+        "whole_words_us_per_post": round(time_per_post(whole_words.find, posts), 2),
+        "loop_us_per_post": round(loop_us, 2),
+        "matcher_seconds": round(matcher_us * len(posts) / 1e6, 2),
+        "loop_seconds": round(loop_us * len(posts) / 1e6, 2),
+        "speedup": round(loop_us / matcher_us, 1),
+    }
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--posts", type=int, default=45000)
+    parser.add_argument("--topics", default="10,1000,10000")
+    parser.add_argument("--loop-posts", type=int, default=2000,
+                        help="posts the slow loop is timed on")
+    args = parser.parse_args(sys.argv[1:])
+
+    fixture = fixture_batch(args.posts)
+    for count in args.topics.split(","):
+        print(json.dumps(run(fixture, int(count), args.loop_posts)))
@@ -0,0 +1,125 @@
+"""
+Time to turn a batch of posts into the mention DataFrame, with the model
+replaced by a constant so only building the rows is timed: a one-row frame
+per mention joined with concat, as transform used to, a frame per chunk
+joined with concat, and every chunk appending to the same columns for one
+frame at the end. Also times validating the posts one Message at a time
+against as one MessageBatch.
+
+    python3 benchmark_transform.py --posts 45000
+"""
+import sys
+import json
+import time
+import logging
+import argparse
+from datetime import datetime
+import pandas as pd
+from transform import Message, MessageBatch, MessageTransformer
+from extract_from_s3 import Converter, TRANSFORM_CHUNK
+from benchmark_sentiment import fixture_batch, FIXTURE_TOPICS
+
+
+def fixture_messages(posts: int, seed: int = 0) -> list[dict]:
+    """Raw post dicts of the fixture batch, a second apart"""
+    return [{"text": text, "langs": ["en"], "$type": "app.bsky.feed.post",
+             "createdAt": f"2025-07-28T{index // 3600 % 24:02d}:{index // 60 % 60:02d}:"
+                          f"{index % 60:02d}.000Z"}
+            for index, text in enumerate(fixture_batch(posts, seed))]
+
+
+def constant_sentiment(texts, **_) -> list[dict] | dict:
+    """Stands in for the model, so the timings are of everything else"""
+    if isinstance(texts, str):
+        return [{"label": "NEU", "score": 0.5}]
+    return [{"label": "NEU", "score": 0.5} for _ in texts]
+
+
+def transformer() -> MessageTransformer:
+    """A transformer subscribed to the fixture topics, scoring with a constant"""
+    fresh = MessageTransformer({topic: index for index, topic in enumerate(FIXTURE_TOPICS)})
+    fresh._sentiment_pipeline = constant_sentiment  # pylint: disable=W0212
+    return fresh
+
+
+def one_row_frame(topic_id: int, sentiment: dict, timestamp: datetime) -> pd.DataFrame:
+    """The single-row DataFrame MessageTransformer.create_dataframe used to build per mention"""
+    logging.info("Creating DataFrame...")
+    return pd.DataFrame({
+        "topic_id": [topic_id],
+        "timestamp": [timestamp],
+        "sentiment_label": [sentiment.get("label")],
+        "sentiment_score": [sentiment.get("score")]
+    })
+
+
+def per_row(items: list[dict]) -> pd.DataFrame:
+    """A one-row frame per mention, joined with concat per message and again
+    for the batch, as transform used to"""
+    scorer = transformer()
+    frames = []
+    for item in items:
+        message = Message(item)
+        topics_found = scorer.find_topics_in_text(message.text)
+        if topics_found:
+            sentiment = scorer.get_sentiment(message.text)
+            frames.append(pd.concat(
+                [one_row_frame(FIXTURE_TOPICS.index(topic), sentiment, message.timestamp)
+                 for topic in topics_found], ignore_index=True))
+    return pd.concat(frames, ignore_index=True)
+
+
+def per_chunk(items: list[dict]) -> pd.DataFrame:
+    """A frame per chunk from transform_batch, joined with concat"""
+    scorer = transformer()
+    frames = [scorer.transform_batch([Message(item) for item in items[start:start + TRANSFORM_CHUNK]])
+              for start in range(0, len(items), TRANSFORM_CHUNK)]
+    return pd.concat([frame for frame in frames if not frame.empty], ignore_index=True)
+
+
+def columnar(items: list[dict]) -> pd.DataFrame:
+    """Every chunk appended to the same columns, one frame at the end"""
+    return Converter.transform_messages_into_dataframe(items, transformer())
+
+
+def validation(items: list[dict]) -> dict:
+    """Seconds to validate the posts and parse their timestamps with a Message
+    each, against all together as a MessageBatch"""
+    time1 = time.perf_counter()
+    one_at_a_time = [Message(item) for item in items]
+    timestamps = [message.timestamp for message in one_at_a_time]
+    time2 = time.perf_counter()
+    batch = MessageBatch.from_raw(items)
+    time3 = time.perf_counter()
+    assert batch.timestamps == timestamps
+    return {"per_message_seconds": round(time2 - time1, 3),
+            "batch_seconds": round(time3 - time2, 3),
+            "speedup": round((time2 - time1) / (time3 - time2), 2)}
+
+
+def compare(items: list[dict]) -> dict:
+    """Seconds each way takes, checking they all give the same rows"""
+    report = {}
+    expected = None
+    for build in (per_row, per_chunk, columnar):
+        time1 = time.perf_counter()
+        df = build(items)
+        seconds = time.perf_counter() - time1
+        if expected is None:
+            expected = df
+        pd.testing.assert_frame_equal(df, expected)
+        report[build.__name__] = {"seconds": round(seconds, 3), "mentions": len(df)}
+    for result in report.values():
+        result["speedup"] = round(report["per_row"]["seconds"] / result["seconds"], 2)
+    return report
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--posts", type=int, default=45000)
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args(sys.argv[1:])
+
+    logging.disable(logging.INFO)  # the per message logging would swamp the timings
+    fixture = fixture_messages(args.posts, args.seed)
+    print(json.dumps({**compare(fixture), "validation": validation(fixture)}, indent=2))
@@ -0,0 +1,85 @@
+"""
+Throughput of scoring in forked inference workers against scoring in one
+process, on the fixture batch, with the memory the workers add.
+
+    python3 benchmark_workers.py --workers 1,2,4,6 --posts 2000
+Without access to the HuggingFace hub, use a randomly initialised model of
+bertweet's shape:
+    python3 benchmark_workers.py --random-weights
+"""
+import os
+import sys
+import json
+import time
+import argparse
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor
+from transform import MessageTransformer, TRANSFORMER_MODEL, SENTIMENT_BATCH_SIZE
+from sharded_inference import worker_count, threads_per_worker
+from benchmark_sentiment import fixture_batch, random_weights_pipeline
+from benchmark_backends import memory_mb
+
+
+def children_private_mb(pid: int) -> float:
+    """Memory a process's children do not share with it or each other, so a
+    model shared copy-on-write is not counted once per worker"""
+    try:
+        with open(f"/proc/{pid}/task/{pid}/children", encoding="utf-8") as file:
+            children = file.read().split()
+    except OSError:
+        return 0.0
+    total = 0.0
+    for child in children:
+        with open(f"/proc/{child}/smaps_rollup", encoding="utf-8") as file:
+            for line in file:
+                if line.startswith(("Private_Clean:", "Private_Dirty:")):
+                    total += int(line.split()[1]) / 1024
+    return round(total, 1)
+
+
+def run_workers(workers: int, model: str, texts: list[str], random_weights: bool) -> dict:
+    """Loads the model and scores texts with workers workers, in the calling process"""
+    import torch  # pylint: disable=C0415
+
+    if worker_count(workers) > 1:
+        torch.set_num_threads(1)  # as start_workers does, before anything runs
+    transformer = MessageTransformer({}, model)
+    if random_weights:
+        transformer._sentiment_pipeline = random_weights_pipeline(texts)  # pylint: disable=W0212
+    transformer.start_workers(workers)
+    try:
+        transformer._score_batches(texts[:64], SENTIMENT_BATCH_SIZE)  # pylint: disable=W0212
+        time1 = time.perf_counter()
+        transformer._score_batches(texts, SENTIMENT_BATCH_SIZE)  # pylint: disable=W0212
+        seconds = time.perf_counter() - time1
+        workers_private = children_private_mb(os.getpid())
+    finally:
+        transformer.stop_workers()
+    return {
+        "workers": worker_count(workers),
+        "threads_per_worker": threads_per_worker(worker_count(workers))
+        if worker_count(workers) > 1 else torch.get_num_threads(),
+        "seconds": round(seconds, 2),
+        "messages_per_second": round(len(texts) / seconds, 1),
+        "parent_rss_mb": memory_mb("VmRSS"),
+        "workers_private_mb": workers_private,
+    }
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--workers", default="1,2,0", help="0 is one worker per core")
+    parser.add_argument("--posts", type=int, default=2000)
+    parser.add_argument("--model", default=TRANSFORMER_MODEL)
+    parser.add_argument("--random-weights", action="store_true",
+                        help="use an untrained model of bertweet's shape")
+    args = parser.parse_args(sys.argv[1:])
+
+    fixture = fixture_batch(args.posts)
+    report = []
+    for count in [int(workers) for workers in args.workers.split(",")]:
+        # a fresh process each, as torch cannot fork safely once it has run threaded
+        with ProcessPoolExecutor(1, mp_context=multiprocessing.get_context("spawn")) as pool:
+            report.append(pool.submit(run_workers, count, args.model, fixture,
+                                      args.random_weights).result())
+    print(json.dumps(report, indent=2))
@@ -0,0 +1,246 @@
+"""Compaction job merging the raw 10-minute batches into hourly or daily Parquet
+archive files, so backfills and re-scoring read a few columnar files instead of
+thousands of small JSON objects.
+
+Compact yesterday's batches in S3:
+    python3 compact_archive.py --granularity day
+Compact a local copy of the bucket:
+    python3 compact_archive.py --local ./bucket --start 2025-08-04 --end 2025-08-05
+"""
+
+import os
+import io
+import sys
+import json
+import shutil
+import argparse
+import tempfile
+import itertools
+import logging
+from datetime import datetime, timedelta, timezone
+from collections.abc import Iterator
+import pandas as pd
+import pyarrow as pa
+import pyarrow.dataset as ds
+import pyarrow.parquet as pq
+from botocore.exceptions import ClientError
+from extract_from_s3 import S3Connection, S3FileExtractor, Converter, BUCKET
+
+logging.basicConfig(
+    format="%(levelname)s | %(asctime)s | %(message)s", level=logging.INFO)
+
+ARCHIVE_PREFIX = "bluesky/archive/"
+HOUR = "hour"
+DAY = "day"
+ROW_GROUP_SIZE = 100_000  # rows, each group keeps min/max createdAt statistics
+
+ARCHIVE_SCHEMA = pa.schema([
+    ("createdAt", pa.timestamp("us", tz="UTC")),
+    ("text", pa.string()),
+    ("langs", pa.list_(pa.string())),
+    ("source_key", pa.dictionary(pa.int32(), pa.string())),
+    ("source_line", pa.int32()),
+])
+
+
+class LocalBucket:
+    """Stand-in for the boto3 S3 client, serving a bucket from a local directory
+    with the calls the compaction job makes."""
+
+    def __init__(self, directory: str) -> None:
+        self.directory = directory
+
+    def _path(self, bucket: str, key: str) -> str:
+        return os.path.join(self.directory, bucket, key)
+
+    def get_object(self, Bucket: str, Key: str) -> dict:  # pylint: disable=C0103
+        """Reads an object, raising NoSuchKey like S3 if it does not exist."""
+        try:
+            with open(self._path(Bucket, Key), "rb") as file:
+                return {"Body": io.BytesIO(file.read())}
+        except FileNotFoundError as e:
+            raise ClientError({"Error": {"Code": "NoSuchKey"}}, "GetObject") from e
+
+    def put_object(self, Bucket: str, Key: str, Body, **_) -> dict:  # pylint: disable=C0103
+        """Writes an object from bytes, a string or a file, creating its prefix directories."""
+        path = self._path(Bucket, Key)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        with open(path, "wb") as file:
+            if hasattr(Body, "read"):
+                shutil.copyfileobj(Body, file)
+            else:
+                file.write(Body.encode("utf-8") if isinstance(Body, str) else Body)
+        return {}
+
+    def list_objects_v2(self, Bucket: str, Prefix: str, **_) -> dict:  # pylint: disable=C0103
+        """Lists every object under a prefix in one page."""
+        root = self._path(Bucket, "")
+        contents = []
+        for directory, _, names in os.walk(self._path(Bucket, os.path.dirname(Prefix))):
+            for name in names:
+                path = os.path.join(directory, name)
+                key = os.path.relpath(path, root).replace(os.sep, "/")
+                if key.startswith(Prefix):
+                    contents.append({"Key": key, "LastModified": os.path.getmtime(path)})
+        return {"Contents": contents}
+
+
+def as_utc(moment: datetime) -> datetime:
+    """Treats a naive datetime as UTC."""
+    return moment.replace(tzinfo=timezone.utc) if moment.tzinfo is None else moment
+
+
+def period_start(moment: datetime, granularity: str) -> datetime:
+    """The start of the hour or day a moment falls in."""
+    moment = as_utc(moment).astimezone(timezone.utc).replace(minute=0, second=0, microsecond=0)
+    return moment.replace(hour=0) if granularity == DAY else moment
+
+
+def period_prefix(start: datetime, granularity: str) -> str:
+    """The archive prefix of a period, hive-partitioned so readers can prune by date."""
+    prefix = f"{ARCHIVE_PREFIX}granularity={granularity}/date={start:%Y-%m-%d}/"
+    return prefix if granularity == DAY else f"{prefix}hour={start:%H}/"
+
+
+def iter_periods(start: datetime, end: datetime, granularity: str) -> Iterator[datetime]:
+    """Yields the start of every period overlapping [start, end)."""
+    step = timedelta(days=1) if granularity == DAY else timedelta(hours=1)
+    period = period_start(start, granularity)
+    while period < end:
+        yield period
+        period += step
+
+
+class ArchiveCompactor:
+    """Compacts the raw batches of each period into one Parquet part per run,
+    recording which batches went into which part in the period's ledger.
+    A part is built an hour of batches at a time, each written out as its
+    own row groups before the next is read, so a day never sits in memory."""
+
+    def __init__(self, s3_client, bucket: str = BUCKET, granularity: str = HOUR) -> None:
+        if granularity not in (HOUR, DAY):
+            raise ValueError(f"Unknown granularity: {granularity}")
+        self.s3 = s3_client
+        self.bucket = bucket
+        self.granularity = granularity
+        self.extractor = S3FileExtractor(s3_client)
+
+    def source_keys(self, start: datetime) -> list[str]:
+        """The raw batch keys in every hourly partition of a period."""
+        hours = 24 if self.granularity == DAY else 1
+        keys = []
+        for hour in range(hours):
+            keys.extend(self.extractor.get_hour_keys(self.bucket, start + timedelta(hours=hour)))
+        return keys
+
+    def read_ledger(self, prefix: str) -> dict:
+        """The period's ledger, mapping each compacted raw batch key to its part."""
+        ledger = self.extractor.get_json(self.bucket, f"{prefix}_ledger.json")
+        return ledger or {"sources": {}}
+
+    def build_table(self, keys: list[str]) -> pa.Table:
+        """Reads raw batches, such as an hour's, into one table sorted by createdAt."""
+        columns = {"createdAt": [], "text": [], "langs": [], "source_key": [], "source_line": []}
+        for key in keys:
+            body = self.s3.get_object(Bucket=self.bucket, Key=key)["Body"]
+            for line, message in enumerate(Converter.iter_batch(body)):
+                columns["createdAt"].append(message.get("createdAt"))
+                columns["text"].append(message.get("text"))
+                columns["langs"].append(message.get("langs"))
+                columns["source_key"].append(key)
+                columns["source_line"].append(line)
+
+        columns["createdAt"] = pd.to_datetime(
+            pd.Series(columns["createdAt"], dtype="object"),
+            utc=True, errors="coerce", format="ISO8601")
+        table = pa.Table.from_pydict(columns, schema=ARCHIVE_SCHEMA)
+        return table.sort_by([("createdAt", "ascending")])
+
+    def compact_period(self, start: datetime) -> str | None:
+        """Writes a part holding the period's batches not yet in its ledger,
+        then records them. Returns the part key, or None if nothing was pending."""
+        prefix = period_prefix(start, self.granularity)
+        ledger = self.read_ledger(prefix)
+        pending = [key for key in self.source_keys(start) if key not in ledger["sources"]]
+        if not pending:
+            return None
+
+        # numbered after the parts already in the ledger, so a run retried after a crash
+        # overwrites its part, even if more batches arrived in between, rather than duplicating it
+        part_key = f"{prefix}part-{len(set(ledger['sources'].values())):05d}.parquet"
+        rows = 0
+        with tempfile.TemporaryFile() as part:
+            with pq.ParquetWriter(part, ARCHIVE_SCHEMA, compression="zstd") as writer:
+                for _, keys in itertools.groupby(pending, key=lambda key: key.rsplit("/", 1)[0]):
+                    table = self.build_table(list(keys))
+                    writer.write_table(table, row_group_size=ROW_GROUP_SIZE)
+                    rows += table.num_rows
+            part.seek(0)
+            self.s3.put_object(Bucket=self.bucket, Key=part_key, Body=part)
+
+        ledger["sources"].update({key: part_key for key in pending})
+        self.s3.put_object(Bucket=self.bucket, Key=f"{prefix}_ledger.json",
+                           Body=json.dumps(ledger), ContentType="application/json")
+        logging.info("Compacted %s batches (%s rows) into %s.",
+                     len(pending), rows, part_key)
+        return part_key
+
+    def compact(self, start: datetime, end: datetime) -> list[str]:
+        """Compacts every period overlapping [start, end), returning the parts written."""
+        parts = []
+        for period in iter_periods(start, end, self.granularity):
+            part_key = self.compact_period(period)
+            if part_key:
+                parts.append(part_key)
+        return parts
+
+
+def read_archive(path: str, columns: list[str] | None = None,
+                 start: datetime | None = None, end: datetime | None = None,
+                 granularity: str = HOUR) -> pa.Table:
+    """Reads compacted posts from an archive root (a local directory or an s3://
+    URI of ARCHIVE_PREFIX), only the given columns, with createdAt in [start, end).
+    Posts are partitioned by the hour their batch was started in, which can
+    fall on the day after they were created, so date partitions more than a day
+    outside the range are skipped and the time filter, pushed down to the
+    Parquet row group statistics, does the rest."""
+    partition_fields = [("date", pa.string())] + ([("hour", pa.string())]
+                                                  if granularity == HOUR else [])
+    dataset = ds.dataset(
+        f"{path.rstrip('/')}/granularity={granularity}", format="parquet",
+        partitioning=ds.partitioning(pa.schema(partition_fields), flavor="hive"),
+        schema=pa.schema(list(ARCHIVE_SCHEMA) + [pa.field(*field) for field in partition_fields]))
+
+    conditions = []
+    if start is not None:
+        start = as_utc(start)
+        conditions.append(ds.field("date") >= f"{start - timedelta(days=1):%Y-%m-%d}")
+        conditions.append(ds.field("createdAt") >= pa.scalar(start, ARCHIVE_SCHEMA.field("createdAt").type))
+    if end is not None:
+        end = as_utc(end)
+        conditions.append(ds.field("date") <= f"{end + timedelta(days=1):%Y-%m-%d}")
+        conditions.append(ds.field("createdAt") < pa.scalar(end, ARCHIVE_SCHEMA.field("createdAt").type))
+    condition = None
+    for item in conditions:
+        condition = item if condition is None else condition & item
+    return dataset.to_table(columns=columns or ARCHIVE_SCHEMA.names, filter=condition)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--granularity", choices=(HOUR, DAY), default=HOUR)
+    parser.add_argument("--start", type=datetime.fromisoformat,
+                        help="default: the start of the previous period")
+    parser.add_argument("--end", type=datetime.fromisoformat,
+                        help="default: the start of the current period")
+    parser.add_argument("--local", help="directory holding a local copy of the bucket")
+    args = parser.parse_args(sys.argv[1:])
+
+    current = period_start(datetime.now(timezone.utc), args.granularity)
+    previous = current - (timedelta(days=1) if args.granularity == DAY else timedelta(hours=1))
+    start_time = as_utc(args.start) if args.start else previous
+    end_time = as_utc(args.end) if args.end else current
+
+    client = LocalBucket(args.local) if args.local else S3Connection().get_s3_connection()
+    written = ArchiveCompactor(client, BUCKET, args.granularity).compact(start_time, end_time)
+    logging.info("Wrote %s archive parts.", len(written))
@@ -1,6 +1,8 @@
+import io
 import pytest
 import pandas as pd
 from unittest.mock import MagicMock
+from botocore.exceptions import ClientError
 
 @pytest.fixture
 def fake_s3_client():
@@ -13,9 +15,13 @@ def fake_s3_client():
         ]
     }
 
-    mock.get_object.return_value = {
-        "Body": MagicMock(read=MagicMock(return_value=b'[{"text":"hello","langs":["en"],"$type":"post","createdAt":"2025-08-04T12:23:52"}]'))
-    }
+    def get_object(Bucket, Key):
+        if Key.startswith("bluesky/manifests/"):
+            raise ClientError({"Error": {"Code": "NoSuchKey"}}, "GetObject")
+        return {"Body": io.BytesIO(mock.body)}
+
+    mock.body = b'[{"text":"hello","langs":["en"],"$type":"post","createdAt":"2025-08-04T12:23:52"}]'
+    mock.get_object.side_effect = get_object
     return mock
 
 @pytest.fixture
@@ -1,15 +1,106 @@
 """Script to run the ETL, automatically updating the RDS."""
 # pylint: disable=W0613
 
+from os import environ
 import logging
-from extract_from_s3 import S3Connection, DatabaseTopicExtractor, S3FileExtractor, Converter, BUCKET
+from datetime import datetime, timedelta, timezone
+from urllib.parse import unquote_plus
+from collections import Counter
+from contextlib import closing
+from concurrent.futures import ThreadPoolExecutor
+from extract_from_s3 import (S3Connection, DatabaseTopicExtractor, S3FileExtractor, Converter,
+                             BUCKET, PREFIX)
 from transform import MessageTransformer
 from load_to_rds import DBLoader
+from batch_ledger import BatchLedger
+from sentiment_cache import SentimentCache
+from sharded_inference import INFERENCE_WORKERS
 
 logging.basicConfig(format="%(levelname)s | %(asctime)s | %(message)s", level=logging.INFO)
 
+LOOKBACK_HOURS = int(environ.get("LOOKBACK_HOURS", "24"))  # hours of partitions checked
+CATCH_UP_CONCURRENCY = int(environ.get("CATCH_UP_CONCURRENCY", "4"))  # batches at once
+SENTIMENT_CACHE_PERSIST = environ.get("SENTIMENT_CACHE_PERSIST", "true").lower() == "true"
+
+# kept between warm invocations of the same Lambda container
+SENTIMENT_CACHE = SentimentCache()
+
+
+def get_event_keys(event: dict) -> list[str]:
+    """Returns the raw batch keys named by an S3 notification (Records) or an
+    EventBridge "Object Created" event, passed on by the step function."""
+    keys = [unquote_plus(record["s3"]["object"]["key"])
+            for record in event.get("Records", []) if "s3" in record]
+    detail_key = event.get("detail", {}).get("object", {}).get("key")
+    if detail_key:
+        keys.append(detail_key)
+    return [key for key in keys if key.startswith(PREFIX)]
+
+
+def process_batch(key: str, converter: Converter, transformer: MessageTransformer,
+                  ledger: BatchLedger, rejected: Counter | None = None) -> int:
+    """Extracts, transforms and loads one raw batch, returning the number of mentions loaded.
+    Messages are streamed from S3 a chunk at a time through matching and scoring into
+    the RDS, with every stage working on a different chunk at once, so the batch is
+    never held in memory. Invalid messages are skipped and counted by reason into rejected."""
+    logging.info("Processing batch %s.", key)
+    message_count = 0
+
+    def counted(messages):
+        nonlocal message_count
+        for message in messages:
+            message_count += 1
+            yield message
+
+    frames = converter.stream_mentions(
+        counted(converter.iter_file_messages(BUCKET, key)), transformer, rejected=rejected)
+    with closing(frames):  # stops the stages if loading fails or the batch was claimed
+        mentions = ledger.load_batch_stream(key, frames, lambda: message_count)
+    if mentions is None:
+        return 0
+    logging.info("Loaded %s mentions from %s.", mentions, key)
+    return mentions
+
+
+def process_pending(keys: list[str], converter: Converter, transformer: MessageTransformer,
+                    ledger: BatchLedger, concurrency: int = 1) -> dict:
+    """Processes every batch in keys not yet in the ledger, in order, or with up
+    to concurrency batches at once. A failed batch stays pending for the next run."""
+    pending = ledger.pending_keys(keys)
+    logging.info("%s of %s batches are pending.", len(pending), len(keys))
+
+    def run(key: str) -> tuple[str, int | None, Counter]:
+        rejected = Counter()
+        try:
+            return key, process_batch(key, converter, transformer, ledger, rejected), rejected
+        except Exception as e:
+            logging.error("Batch %s failed: %s", key, e, exc_info=True)
+            return key, None, rejected
+
+    if concurrency > 1 and len(pending) > 1:
+        _ = transformer.sentiment_pipeline  # load the model once, before the workers share it
+        with ThreadPoolExecutor(max_workers=concurrency) as executor:
+            outcomes = list(executor.map(run, pending))
+    else:
+        outcomes = [run(key) for key in pending]
+
+    failed = [key for key, mentions, _ in outcomes if mentions is None]
+    return {
+        "pending": len(pending),
+        "processed": len(pending) - len(failed),
+        "failed": failed,
+        "mentions": sum(mentions for _, mentions, _ in outcomes if mentions),
+        "rejected": dict(sum((rejected for _, mentions, rejected in outcomes
+                              if mentions is not None), Counter())),
+    }
+
+
 def lambda_handler(event=None, context=None) -> dict:
-    """AWS Lambda entry point for the ETL."""
+    """AWS Lambda entry point for the ETL. Processes the batches named in an S3 or
+    EventBridge event, or, if it names none, every pending batch from the last
+    LOOKBACK_HOURS. Pass {"catch_up": true} to work through a backlog in parallel,
+    optionally with "concurrency" and "lookback_hours"."""
+    event = event or {}
     try:
         s3_connection = S3Connection()
         s3_client = s3_connection.get_s3_connection()
@@ -18,25 +109,39 @@ def lambda_handler(event=None, context=None) -> dict:
         converter = Converter(s3_extractor)
 
         logging.info("Starting extraction process.")
-        data_dicts = converter.get_latest_file_as_dicts(BUCKET)
+        keys = [] if event.get("catch_up") else get_event_keys(event)
+        if keys:
+            logging.info("Processing %s batches named in the event.", len(keys))
+        else:
+            since = datetime.now(timezone.utc) - timedelta(
+                hours=event.get("lookback_hours", LOOKBACK_HOURS))
+            keys = s3_extractor.get_keys_since(BUCKET, since)
 
         loader = DBLoader()
+        engine = loader.get_sql_conn()
+        ledger = BatchLedger(engine, schema="bluesky")
         topics_dict = DatabaseTopicExtractor().get_topics_dict_from_rds(loader)
         logging.info("Extraction complete.")
 
+        logging.info("Starting transform and load of pending batches.")
+        cache = SENTIMENT_CACHE if SENTIMENT_CACHE_PERSIST else SentimentCache()
+        cache.reset_stats()
+        transformer = MessageTransformer(topics_dict=topics_dict, cache=cache)
+        concurrency = event.get("concurrency", CATCH_UP_CONCURRENCY) \
+            if event.get("catch_up") else 1
+        transformer.start_workers(INFERENCE_WORKERS)  # forked before any threads start
+        try:
+            results = process_pending(keys, converter, transformer, ledger, concurrency)
+        finally:
+            transformer.stop_workers()
+        results["sentiment_cache"] = cache.stats()
+        logging.info("Processing complete: %s", results)
 
-        logging.info("Starting transformation process.")
-        transformer = MessageTransformer(topics_dict=topics_dict)
-        df = converter.transform_messages_into_dataframe(data_dicts, transformer)
-        logging.info("Transformation complete.")
-
-        logging.info("Starting upload process.")
-        if df is not None and not df.empty:
-            logging.info("Uploading transformed DataFrame to RDS.")
-            engine = loader.get_sql_conn()
-            loader.upload_df_to_mention(df=df, engine=engine, schema="bluesky")
-            logging.info("Upload complete.")
-            return {"statusCode": 200, "body": "ETL completed successfully."}
+        if results["failed"]:
+            return {"statusCode": 500,
+                    "body": f"ETL failed for {len(results['failed'])} batches: {results}"}
+        if results["mentions"]:
+            return {"statusCode": 200, "body": f"ETL completed successfully: {results}"}
         logging.warning("No data to upload.")
         return {"statusCode": 204, "body": "No data to upload."}
 
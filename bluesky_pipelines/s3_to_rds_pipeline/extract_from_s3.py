@@ -3,19 +3,36 @@
 and convert it into a pandas DataFrame for transformation."""
 
 from os import environ
+import io
 import json
+import gzip
+import codecs
 import logging
+import itertools
+from collections import Counter
+from collections.abc import Iterable, Iterator
+from datetime import datetime, timedelta, timezone
 import boto3
+import zstandard
+from botocore.exceptions import ClientError
 from dotenv import load_dotenv
 import pandas as pd
-from transform import Message, MessageTransformer
+from transform import MessageBatch, MessageTransformer, MENTION_COLUMNS
 from load_to_rds import DBLoader
+from streaming import stream, STAGE_QUEUE_SIZE
 
 logging.basicConfig(
     format="%(levelname)s | %(asctime)s | %(message)s", level=logging.INFO)
 
 BUCKET = "c18-trend-getter-s3"
 PREFIX = "bluesky/raw_posts/"
+PARTITION_FORMAT = "%Y/%m/%d/%H/"
+MANIFEST_PREFIX = "bluesky/manifests/"
+LATEST_MANIFEST = f"{MANIFEST_PREFIX}latest.json"
+GZIP_MAGIC = b"\x1f\x8b"
+ZSTD_MAGIC = b"\x28\xb5\x2f\xfd"
+CHUNK_SIZE = 256 * 1024  # bytes read from a batch body at a time
+TRANSFORM_CHUNK = 1024  # messages matched and scored together
 
 
 class S3Connection():
@@ -60,11 +77,37 @@ class S3FileExtractor():
     def __init__(self, connection) -> None:
         self.s3 = connection
 
+    def get_json(self, bucket: str, key: str) -> dict | None:
+        """Downloads a small json object such as a manifest, or None if it does not exist."""
+        try:
+            response = self.s3.get_object(Bucket=bucket, Key=key)
+        except ClientError as e:
+            if e.response.get("Error", {}).get("Code") in ("NoSuchKey", "404"):
+                return None
+            raise
+        return json.loads(response["Body"].read())
+
+    def list_objects(self, bucket: str, prefix: str) -> list[dict]:
+        """Lists every object under a prefix, following continuation tokens."""
+        objects = []
+        kwargs = {"Bucket": bucket, "Prefix": prefix}
+        while True:
+            response = self.s3.list_objects_v2(**kwargs)
+            objects.extend(response.get("Contents") or [])
+            if not response.get("IsTruncated"):
+                return objects
+            kwargs["ContinuationToken"] = response["NextContinuationToken"]
+
     def get_latest_file_key(self, bucket: str) -> str:
-        """Returns the key of the most recently uploaded file in the bucket."""
+        """Returns the key of the most recently uploaded file in the bucket,
+        read from the latest manifest pointer, or by listing if there is none."""
         logging.info("Fetching latest file from S3.")
-        response = self.s3.list_objects_v2(Bucket=bucket, Prefix=PREFIX)
-        objects = response.get("Contents")
+        latest = self.get_json(bucket, LATEST_MANIFEST)
+        if latest is not None:
+            return latest["key"]
+
+        logging.warning("No manifest found, listing %s instead.", PREFIX)
+        objects = self.list_objects(bucket, PREFIX)
 
         if not objects:
             logging.error("No files found in S3 bucket.")
@@ -73,6 +116,54 @@ class S3FileExtractor():
         latest_object = max(objects, key=lambda x: x["LastModified"])
         return latest_object["Key"]
 
+    def get_hour_keys(self, bucket: str, hour: datetime) -> list[str]:
+        """Returns the batch keys in one hourly partition, oldest first, from its
+        manifest or, if the manifest is missing, by listing only that partition."""
+        partition = hour.strftime(PARTITION_FORMAT)
+        manifest = self.get_json(bucket, f"{MANIFEST_PREFIX}{partition}manifest.json")
+        if manifest is not None:
+            return [batch["key"] for batch in manifest["batches"]]
+        objects = self.list_objects(bucket, f"{PREFIX}{partition}")
+        return [item["Key"] for item in sorted(objects, key=lambda x: x["LastModified"])]
+
+    def get_keys_since(self, bucket: str, since: datetime,
+                       until: datetime | None = None) -> list[str]:
+        """Returns the batch keys in every hourly partition from since to until
+        (default now), oldest first, so the lookup grows with the window, not the history."""
+        until = until or datetime.now(timezone.utc)
+        hour = since.astimezone(timezone.utc).replace(minute=0, second=0, microsecond=0)
+        keys = []
+        while hour <= until:
+            keys.extend(self.get_hour_keys(bucket, hour))
+            hour += timedelta(hours=1)
+        return keys
+
+
+class PrefixedStream(io.RawIOBase):
+    """A read-only stream returning bytes already read from a stream, then the rest of it."""
+
+    def __init__(self, prefix: bytes, stream) -> None:
+        super().__init__()
+        self.prefix = prefix
+        self.stream = stream
+
+    def readable(self) -> bool:
+        return True
+
+    def read(self, size: int = -1) -> bytes:
+        if self.prefix:
+            if size is None or size < 0:
+                data, self.prefix = self.prefix + self.stream.read(), b""
+                return data
+            data, self.prefix = self.prefix[:size], self.prefix[size:]
+            return data
+        return self.stream.read() if size is None or size < 0 else self.stream.read(size)
+
+    def readinto(self, buffer) -> int:
+        data = self.read(len(buffer))
+        buffer[:len(data)] = data
+        return len(data)
+
 
 class Converter():
     """Class to convert extracted S3 file into a pandas Dataframe."""
@@ -84,27 +175,141 @@ class Converter():
     def get_latest_file_as_dicts(self, bucket: str) -> list[dict]:
         """Downloads the latest file from the S3 bucket and returns a list of python dicts."""
         key = self.s3_extractor.get_latest_file_key(bucket)
+        return self.get_file_as_dicts(bucket, key)
+
+    def get_file_as_dicts(self, bucket: str, key: str) -> list[dict]:
+        """Downloads one batch file from the S3 bucket and returns a list of python dicts."""
+        messages = list(self.iter_file_messages(bucket, key))
+        logging.info("JSON file successfully converted.")
+
+        return messages
+
+    def iter_file_messages(self, bucket: str, key: str,
+                           chunk_size: int = CHUNK_SIZE) -> Iterator[dict]:
+        """Streams one batch file from the S3 bucket, yielding its messages as
+        they are read so memory is bounded by chunk_size rather than the batch."""
         logging.info("Downloading file: %s", key)
         response = self.s3.get_object(Bucket=bucket, Key=key)
-        content = response["Body"].read().decode("utf-8")
-        logging.info("JSON file successfully converted.")
+        yield from self.iter_batch(response["Body"], chunk_size)
+
+    @staticmethod
+    def parse_batch(content: bytes) -> list[dict]:
+        """Parses a raw batch written either as a legacy JSON array or as
+        newline-delimited JSON, optionally gzip or zstd compressed."""
+        return list(Converter.iter_batch(io.BytesIO(content)))
+
+    @staticmethod
+    def iter_batch(stream, chunk_size: int = CHUNK_SIZE) -> Iterator[dict]:
+        """Yields the messages of a raw batch read from a file-like stream, in
+        any of the formats parse_batch accepts."""
+        head = stream.read(len(ZSTD_MAGIC))
+        stream = PrefixedStream(head, stream)
+        if head.startswith(GZIP_MAGIC):
+            stream = gzip.GzipFile(fileobj=stream, mode="rb")
+        elif head.startswith(ZSTD_MAGIC):
+            stream = zstandard.ZstdDecompressor().stream_reader(stream, read_across_frames=True)
+
+        decoder = codecs.getincrementaldecoder("utf-8")()
+        chunks = (decoder.decode(chunk) for chunk in iter(lambda: stream.read(chunk_size), b""))
+        text = ""
+        for chunk in chunks:
+            text = chunk.lstrip()
+            if text:
+                break
+        if text.startswith("["):
+            yield from Converter._iter_array(text[1:], chunks)
+        else:
+            yield from Converter._iter_lines(text, chunks)
 
-        return json.loads(content)
+    @staticmethod
+    def _iter_lines(text: str, chunks: Iterable[str]) -> Iterator[dict]:
+        """Yields one message per complete line of newline-delimited JSON."""
+        for chunk in itertools.chain([""], chunks):
+            text += chunk
+            *lines, text = text.split("\n")
+            for line in lines:
+                if line.strip():
+                    yield json.loads(line)
+        if text.strip():
+            yield json.loads(text)
+
+    @staticmethod
+    def _iter_array(text: str, chunks: Iterator[str]) -> Iterator[dict]:
+        """Yields the items of a JSON array one at a time, reading more of the
+        array whenever an item runs past the end of what has been read."""
+        decoder = json.JSONDecoder()
+        position = 0
+        while True:
+            while position < len(text) and text[position] in " \t\r\n,":
+                position += 1
+            if position < len(text) and text[position] == "]":
+                return
+            try:
+                if position == len(text):
+                    raise json.JSONDecodeError("Need more data", text, position)
+                item, position = decoder.raw_decode(text, position)
+            except json.JSONDecodeError:
+                more = next(chunks, None)
+                if more is None:
+                    raise
+                text = text[position:] + more
+                position = 0
+                continue
+            yield item
 
     @staticmethod
-    def transform_messages_into_dataframe(list_of_jsons: list[dict],
-                                          transformer: MessageTransformer) -> pd.DataFrame:
+    def transform_messages_into_dataframe(list_of_jsons: Iterable[dict],
+                                          transformer: MessageTransformer,
+                                          chunk_size: int = TRANSFORM_CHUNK,
+                                          rejected: Counter | None = None) -> pd.DataFrame:
         """Uses transform script on every json dictionary 
-        and puts it into a dataframe ready to be loaded to the RDS."""
-        transformed_list = []
-        for item in list_of_jsons:
-            message = Message(item)
-            transformed = transformer.transform(message)
-            if transformed is not None:
-                transformed_list.append(transformed)
-        df = pd.concat(transformed_list)
-        return df
+        and puts it into a dataframe ready to be loaded to the RDS.
+        Messages are collected chunk_size at a time, so they are validated
+        together and their sentiment is scored in batches, and every chunk's
+        rows are appended to the same columns, which become one DataFrame at
+        the end. Invalid messages are skipped and counted by reason into rejected."""
+        columns = {column: [] for column in MENTION_COLUMNS}
+        skipped = Counter()
+        items = iter(list_of_jsons)
+        while chunk := list(itertools.islice(items, chunk_size)):
+            batch = MessageBatch.from_raw(chunk)
+            skipped.update(batch.rejected)
+            transformer.transform_columns(batch, columns=columns)
+        if skipped:
+            logging.warning("Rejected %s messages: %s", skipped.total(), dict(skipped))
+        if rejected is not None:
+            rejected.update(skipped)
+        if not columns["topic_id"]:
+            return pd.DataFrame()
+        return pd.DataFrame(columns)
+
+    @staticmethod
+    def stream_mentions(list_of_jsons: Iterable[dict], transformer: MessageTransformer,
+                        chunk_size: int = TRANSFORM_CHUNK, rejected: Counter | None = None,
+                        queue_size: int = STAGE_QUEUE_SIZE) -> Iterator[pd.DataFrame]:
+        """Yields a DataFrame of mentions per chunk_size messages, ready to be
+        loaded while later chunks are still being read, matched and scored.
+        Reading, validating and matching, and scoring each run in their own
+        thread, at most queue_size chunks apart, so only a few chunks of the
+        batch are ever held in memory. Invalid messages are skipped and
+        counted by reason into rejected."""
+        skipped = Counter()
+        items = iter(list_of_jsons)
+        chunks = iter(lambda: list(itertools.islice(items, chunk_size)), [])
+
+        def match(chunk: list[dict]) -> list:
+            batch = MessageBatch.from_raw(chunk)
+            skipped.update(batch.rejected)
+            return transformer.match(batch)
+
+        def score(matched: list) -> pd.DataFrame:
+            return pd.DataFrame(transformer.score_matches(matched))
 
+        yield from stream(chunks, match, score, queue_size=queue_size)
+        if skipped:
+            logging.warning("Rejected %s messages: %s", skipped.total(), dict(skipped))
+        if rejected is not None:
+            rejected.update(skipped)
 
 if __name__ == "__main__":
     connection = S3Connection()
@@ -120,7 +325,11 @@ if __name__ == "__main__":
 
     messages_dict_list = converter.get_latest_file_as_dicts(BUCKET)
 
-    df = converter.transform_messages_into_dataframe(messages_dict_list, transformer)
+    transformer.start_workers()
+    try:
+        df = converter.transform_messages_into_dataframe(messages_dict_list, transformer)
+    finally:
+        transformer.stop_workers()
 
     if df is not None and not df.empty:
         engine = loader.get_sql_conn()
@@ -0,0 +1,166 @@
+"""Interchangeable sentiment backends for MessageTransformer: the full precision
+PyTorch pipeline, the same model with its linear layers dynamically quantised
+to int8, and the model exported to ONNX and run with ONNX Runtime. Each is a
+callable taking a text or a list of texts, like a transformers pipeline."""
+
+from os import environ, path, makedirs, listdir, stat, access, W_OK
+import json
+import logging
+import numpy as np
+from transformers import pipeline
+
+logging.basicConfig(
+    level=logging.INFO,
+    format="%(asctime)s - %(levelname)s - %(message)s"
+)
+
+PYTORCH = "pytorch"
+QUANTIZED = "quantized"
+ONNX = "onnx"
+BACKENDS = (PYTORCH, QUANTIZED, ONNX)
+
+SENTIMENT_BACKEND = environ.get("SENTIMENT_BACKEND", PYTORCH)
+ONNX_MODEL_DIR = environ.get("SENTIMENT_ONNX_DIR", "/tmp/sentiment_onnx")  # writable on Lambda
+ONNX_FILE = "model.onnx"
+ONNX_SOURCE_FILE = "source.json"  # the model an export was made from
+WEIGHTS_DIGEST_FILE = "weights.sha256"  # written next to baked weights by bake_model.py
+ONNX_OPSET = 17
+# weights loaded straight from the memory-mapped safetensors file rather than
+# into a randomly initialised model first
+LOCAL_MODEL_KWARGS = {"low_cpu_mem_usage": True}
+
+
+def local_pipeline(directory: str):
+    """The text-classification pipeline of a model and tokenizer saved in a
+    local directory by bake_model.py. A local path is never looked up on the
+    hub, and the image sets HF_HUB_OFFLINE so nothing else is either."""
+    return pipeline("text-classification", model=directory, tokenizer=directory,
+                    model_kwargs=LOCAL_MODEL_KWARGS)
+
+
+def quantize(reference):
+    """A copy of a text-classification pipeline with its linear layers
+    quantised to int8, with activations quantised on the fly."""
+    import torch  # pylint: disable=C0415
+
+    model = torch.ao.quantization.quantize_dynamic(
+        reference.model, {torch.nn.Linear}, dtype=torch.qint8)
+    return pipeline("text-classification", model=model, tokenizer=reference.tokenizer)
+
+
+def model_source(model: str) -> dict:
+    """What an export is made from: the model's name, or for a local directory
+    its path and the digest bake_model.py recorded of its weights, so weights
+    saved over it count as a different model. Without a digest the size of
+    each weights file stands in. Modification times are left out, as image
+    layers do not keep them exactly."""
+    if not path.isdir(model):
+        return {"model": model}
+    directory = path.abspath(model)
+    try:
+        with open(path.join(directory, WEIGHTS_DIGEST_FILE), encoding="utf-8") as file:
+            return {"model": directory, "weights_sha256": file.read().strip()}
+    except OSError:
+        pass
+    return {"model": directory, "weights": {
+        name: stat(path.join(directory, name)).st_size
+        for name in sorted(listdir(directory)) if name.endswith((".safetensors", ".bin"))}}
+
+
+def export_source(directory: str = ONNX_MODEL_DIR) -> dict | None:
+    """The source recorded with the export in directory, or None if it holds
+    no export or one that did not record its source."""
+    if not path.exists(path.join(directory, ONNX_FILE)):
+        return None
+    try:
+        with open(path.join(directory, ONNX_SOURCE_FILE), encoding="utf-8") as file:
+            return json.load(file)
+    except (OSError, ValueError):
+        return None
+
+
+def export_onnx(reference, directory: str = ONNX_MODEL_DIR, source: dict | None = None) -> str:
+    """Exports a text-classification pipeline's model to ONNX, with its
+    tokenizer and config alongside, returning the model's path. The source
+    it was made from, see model_source, is recorded with it."""
+    import torch  # pylint: disable=C0415
+
+    makedirs(directory, exist_ok=True)
+    model_path = path.join(directory, ONNX_FILE)
+    example = reference.tokenizer(["an example post"], return_tensors="pt")
+    torch.onnx.export(
+        reference.model.eval(), (example["input_ids"], example["attention_mask"]), model_path,
+        input_names=["input_ids", "attention_mask"], output_names=["logits"],
+        dynamic_axes={"input_ids": {0: "batch", 1: "tokens"},
+                      "attention_mask": {0: "batch", 1: "tokens"}, "logits": {0: "batch"}},
+        opset_version=ONNX_OPSET, dynamo=False)
+    reference.tokenizer.save_pretrained(directory)
+    reference.model.config.save_pretrained(directory)
+    if source is not None:
+        with open(path.join(directory, ONNX_SOURCE_FILE), "w", encoding="utf-8") as file:
+            json.dump(source, file)
+    logging.info("Exported the sentiment model to %s.", model_path)
+    return model_path
+
+
+class OnnxSentimentPipeline:
+    """Scores texts with an exported model in an ONNX Runtime session,
+    returning the top label and score of each like a transformers pipeline."""
+
+    def __init__(self, directory: str = ONNX_MODEL_DIR, threads: int = 0):
+        import onnxruntime  # pylint: disable=C0415
+        from transformers import AutoConfig, AutoTokenizer  # pylint: disable=C0415
+
+        self.tokenizer = AutoTokenizer.from_pretrained(directory)
+        self.labels = AutoConfig.from_pretrained(directory).id2label
+        options = onnxruntime.SessionOptions()
+        options.graph_optimization_level = onnxruntime.GraphOptimizationLevel.ORT_ENABLE_ALL
+        options.intra_op_num_threads = threads  # 0 lets ONNX Runtime use every core
+        self.session = onnxruntime.InferenceSession(
+            path.join(directory, ONNX_FILE), options, providers=["CPUExecutionProvider"])
+
+    def __call__(self, inputs: str | list[str], batch_size: int | None = None,
+                 truncation: bool = True, max_length: int | None = None, **_) -> list:
+        texts = [inputs] if isinstance(inputs, str) else list(inputs)
+        batch_size = batch_size or len(texts) or 1
+        results = []
+        for start in range(0, len(texts), batch_size):
+            encoded = self.tokenizer(texts[start:start + batch_size], padding=True,
+                                     truncation=truncation, max_length=max_length,
+                                     return_tensors="np")
+            logits = self.session.run(["logits"], {
+                "input_ids": encoded["input_ids"].astype(np.int64),
+                "attention_mask": encoded["attention_mask"].astype(np.int64)})[0]
+            scores = np.exp(logits - logits.max(axis=1, keepdims=True))
+            scores /= scores.sum(axis=1, keepdims=True)
+            for row in scores:
+                best = int(row.argmax())
+                results.append({"label": self.labels[best], "score": float(row[best])})
+        return results
+
+
+def onnx_pipeline(model: str, directory: str = ONNX_MODEL_DIR) -> OnnxSentimentPipeline:
+    """The ONNX Runtime pipeline of a model, exporting it first unless the
+    directory already holds an export of the same model and weights. An
+    export that differs but cannot be replaced, as the directory is read-only,
+    is used as it is."""
+    source = model_source(model)
+    if export_source(directory) != source:
+        if path.exists(path.join(directory, ONNX_FILE)) and not access(directory, W_OK):
+            logging.warning("The ONNX export in %s was not made from %s, but the directory "
+                            "is read-only so it is used as it is.", directory, source["model"])
+        else:
+            export_onnx(pipeline(model=model), directory, source)
+    return OnnxSentimentPipeline(directory)
+
+
+def parity(reference: list[dict], candidate: list[dict]) -> dict:
+    """Share of texts a backend gives the reference's label, and how far its
+    scores drift from the reference's on those texts."""
+    drifts = [abs(ours["score"] - theirs["score"])
+              for ours, theirs in zip(reference, candidate) if ours["label"] == theirs["label"]]
+    return {
+        "label_agreement": round(len(drifts) / len(reference), 4) if reference else 1.0,
+        "mean_score_drift": round(sum(drifts) / len(drifts), 6) if drifts else 0.0,
+        "max_score_drift": round(max(drifts), 6) if drifts else 0.0,
+    }
@@ -0,0 +1,78 @@
+"""Bounded LRU cache of sentiment results keyed by a hash of the normalised
+text, so reposts, copy-pasted text and bot spam are only scored once."""
+
+from os import environ
+import hashlib
+import threading
+import unicodedata
+from collections import OrderedDict
+
+SENTIMENT_CACHE_SIZE = int(environ.get("SENTIMENT_CACHE_SIZE", "50000"))  # 0 disables caching
+
+
+def normalise(text: str) -> str:
+    """Folds Unicode compatibility forms and runs of whitespace, which do not
+    change what the model reads."""
+    return " ".join(unicodedata.normalize("NFKC", text).split())
+
+
+def text_key(text: str) -> bytes:
+    """A 16 byte digest of the normalised text, so keys stay small however
+    long the posts are."""
+    return hashlib.blake2b(normalise(text).encode("utf-8"), digest_size=16).digest()
+
+
+class SentimentCache:
+    """Thread-safe LRU cache of sentiment dicts, evicting the least recently
+    used once it holds max_size texts, with hit and miss counts."""
+
+    def __init__(self, max_size: int = SENTIMENT_CACHE_SIZE):
+        self.max_size = max_size
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def get(self, key: bytes) -> dict | None:
+        """Returns the cached sentiment of a text key, or None."""
+        with self._lock:
+            sentiment = self._entries.get(key)
+            if sentiment is None:
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return sentiment
+
+    def record_hits(self, count: int) -> None:
+        """Counts texts answered without a lookup, like a repeat of a text
+        scored in the same batch."""
+        with self._lock:
+            self.hits += count
+
+    def put(self, key: bytes, sentiment: dict) -> None:
+        """Caches the sentiment of a text key."""
+        if self.max_size <= 0:
+            return
+        with self._lock:
+            self._entries[key] = sentiment
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_size:
+                self._entries.popitem(last=False)
+
+    def reset_stats(self) -> None:
+        """Starts counting hits and misses afresh, keeping the cached entries."""
+        with self._lock:
+            self.hits = 0
+            self.misses = 0
+
+    def stats(self) -> dict:
+        """Hits, misses and hit ratio since the last reset, and the entries held."""
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {"hits": self.hits, "misses": self.misses,
+                    "hit_ratio": round(self.hits / lookups, 4) if lookups else 0.0,
+                    "size": len(self._entries)}
@@ -0,0 +1,135 @@
+"""Multi-core sentiment scoring: worker processes forked once the model is
+loaded, sharing its weights copy-on-write, each scoring a shard of every list
+of texts with its own share of the cores. Workers talk to the parent over
+pipes, as Lambda has no /dev/shm for multiprocessing pools and queues."""
+
+from os import environ, cpu_count
+import math
+import logging
+import threading
+import multiprocessing
+from collections.abc import Callable
+
+logging.basicConfig(
+    level=logging.INFO,
+    format="%(asctime)s - %(levelname)s - %(message)s"
+)
+
+INFERENCE_WORKERS = int(environ.get("INFERENCE_WORKERS", "1"))  # 0 forks one per core
+
+
+def worker_count(workers: int) -> int:
+    """The number of workers to fork, one per core for 0"""
+    return workers if workers > 0 else cpu_count() or 1
+
+
+def threads_per_worker(workers: int) -> int:
+    """Torch threads each worker gets, so together they use every core once"""
+    return max((cpu_count() or 1) // workers, 1)
+
+
+def _serve(score: Callable, connection, threads: int) -> None:
+    """Scores each list of texts sent down connection until it is sent None,
+    replying with (True, sentiments) or (False, the error)."""
+    import torch  # pylint: disable=C0415
+
+    torch.set_num_threads(threads)
+    while True:
+        try:
+            request = connection.recv()
+        except EOFError:
+            break
+        if request is None:
+            break
+        texts, batch_size = request
+        try:
+            connection.send((True, score(texts, batch_size)))
+        except Exception as e:  # pylint: disable=W0718
+            connection.send((False, f"{type(e).__name__}: {e}"))
+    connection.close()
+
+
+class ShardedScorer:
+    """Forks workers that each run score on a shard of the texts. Texts are
+    dealt out round robin by length, so every shard pads to similar lengths
+    and takes about as long, and the results come back in the original order.
+    The model must be loaded before the scorer is made, so the workers
+    inherit it rather than loading their own copy. Once a worker has died
+    every later call raises, until the scorer is replaced."""
+
+    def __init__(self, score: Callable[[list[str], int], list], workers: int = INFERENCE_WORKERS):
+        self.workers = worker_count(workers)
+        threads = threads_per_worker(self.workers)
+        context = multiprocessing.get_context("fork")
+        self._lock = threading.Lock()  # one list of texts in flight at a time
+        self._broken = False  # set once a worker dies, as its shards can no longer be scored
+        self._connections = []
+        self._processes = []
+        for _ in range(self.workers):
+            parent_end, child_end = context.Pipe()
+            process = context.Process(target=_serve, args=(score, child_end, threads),
+                                      daemon=True)
+            process.start()
+            child_end.close()
+            self._connections.append(parent_end)
+            self._processes.append(process)
+        logging.info("Forked %s inference workers with %s threads each.", self.workers, threads)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *_) -> None:
+        self.close()
+
+    def score(self, texts: list[str], batch_size: int) -> list:
+        """Scores texts across the workers, using only as many as there are
+        batches of texts, returning the results in the original order."""
+        if not texts:
+            return []
+        shards = min(self.workers, math.ceil(len(texts) / batch_size))
+        order = sorted(range(len(texts)), key=lambda index: len(texts[index]))
+        parts = [order[start::shards] for start in range(shards)]
+        sentiments = [None] * len(texts)
+        errors = []
+        with self._lock:
+            if self._broken:
+                raise RuntimeError("Inference workers failed earlier, so they are no longer used")
+            sent = []
+            for connection, part in zip(self._connections, parts):
+                try:
+                    connection.send(([texts[index] for index in part], batch_size))
+                except OSError as e:
+                    errors.append(f"the worker exited ({type(e).__name__})")
+                    self._broken = True
+                    break
+                sent.append((connection, part))
+            # a reply is read from every worker sent a shard before raising,
+            # so no pipe is left holding a reply the next call would take
+            for connection, part in sent:
+                try:
+                    succeeded, result = connection.recv()
+                except (EOFError, OSError):
+                    succeeded, result = False, "the worker exited"
+                    self._broken = True
+                if not succeeded:
+                    errors.append(result)
+                    continue
+                for index, sentiment in zip(part, result):
+                    sentiments[index] = sentiment
+        if errors:
+            raise RuntimeError(f"Inference workers failed: {'; '.join(errors)}")
+        return sentiments
+
+    def close(self) -> None:
+        """Stops the workers."""
+        for connection in self._connections:
+            try:
+                connection.send(None)
+            except OSError:
+                pass
+            connection.close()
+        for process in self._processes:
+            process.join(timeout=5)
+            if process.is_alive():
+                process.terminate()
+        self._connections, self._processes = [], []
@@ -0,0 +1,85 @@
+"""Runs the stages of the ETL over a stream of chunks at the same time, each
+in its own thread, joined by bounded queues. Downloading, matching, scoring
+and loading then overlap, so a batch takes about as long as its slowest stage,
+and at most queue_size chunks wait between any two stages."""
+
+from os import environ
+import queue
+import threading
+from collections.abc import Callable, Iterable, Iterator
+
+STAGE_QUEUE_SIZE = int(environ.get("STAGE_QUEUE_SIZE", "2"))  # 0 runs the stages in turn
+POLL_SECONDS = 0.1  # how often a blocked stage checks whether the stream was stopped
+
+_DONE = object()
+
+
+def stream(source: Iterable, *stages: Callable, queue_size: int = STAGE_QUEUE_SIZE) -> Iterator:
+    """Yields each item of source passed through every stage in order. Reading
+    source and each stage run in their own threads, up to queue_size items
+    ahead of the stage after them. An error in any thread stops the others and
+    is raised here, as is closing the stream early. With queue_size 0 it all
+    runs in the calling thread, one item at a time."""
+    if queue_size <= 0:
+        for item in source:
+            for stage in stages:
+                item = stage(item)
+            yield item
+        return
+
+    stop = threading.Event()
+    errors = []
+    queues = [queue.Queue(maxsize=queue_size) for _ in range(len(stages) + 1)]
+
+    def put(into: queue.Queue, item) -> bool:
+        while not stop.is_set():
+            try:
+                into.put(item, timeout=POLL_SECONDS)
+                return True
+            except queue.Full:
+                continue
+        return False
+
+    def get(out_of: queue.Queue):
+        while not stop.is_set():
+            try:
+                return out_of.get(timeout=POLL_SECONDS)
+            except queue.Empty:
+                continue
+        return _DONE
+
+    def read() -> None:
+        try:
+            for item in source:
+                if not put(queues[0], item):
+                    return
+            put(queues[0], _DONE)
+        except Exception as e:  # pylint: disable=W0718
+            errors.append(e)
+            stop.set()
+
+    def run(stage: Callable, inbox: queue.Queue, outbox: queue.Queue) -> None:
+        try:
+            while (item := get(inbox)) is not _DONE:
+                if not put(outbox, stage(item)):
+                    return
+            put(outbox, _DONE)
+        except Exception as e:  # pylint: disable=W0718
+            errors.append(e)
+            stop.set()
+
+    threads = [threading.Thread(target=read, daemon=True)]
+    threads += [threading.Thread(target=run, args=(stage, queues[index], queues[index + 1]),
+                                 daemon=True)
+                for index, stage in enumerate(stages)]
+    for thread in threads:
+        thread.start()
+    try:
+        while (item := get(queues[-1])) is not _DONE:
+            yield item
+    finally:
+        stop.set()
+        for thread in threads:
+            thread.join()
+    if errors:
+        raise errors[0]
@@ -0,0 +1,88 @@
+# pylint: skip-file
+import pandas as pd
+from unittest.mock import MagicMock, patch
+from batch_ledger import BatchLedger
+
+
+def make_engine(rows=(), claimed=True):
+    engine = MagicMock()
+    conn = MagicMock()
+    engine.connect.return_value.__enter__.return_value = conn
+    engine.begin.return_value.__enter__.return_value = conn
+    conn.execute.return_value = MagicMock(
+        __iter__=lambda self: iter(rows),
+        first=MagicMock(return_value=("key",) if claimed else None))
+    return engine, conn
+
+
+class TestBatchLedger:
+    """Tests checking BatchLedger class."""
+
+    def test_pending_keys_drops_processed_and_keeps_order(self):
+        """Test that processed keys are removed and the rest stay in order."""
+        engine, conn = make_engine(rows=[("b",)])
+
+        pending = BatchLedger(engine).pending_keys(["a", "b", "c"])
+
+        assert pending == ["a", "c"]
+        assert conn.execute.call_args.args[1] == {"keys": ["a", "b", "c"]}
+
+    def test_pending_keys_skips_query_without_keys(self):
+        """Test that no query is made for an empty key list."""
+        engine, conn = make_engine()
+
+        assert BatchLedger(engine).pending_keys([]) == []
+        conn.execute.assert_not_called()
+
+    def test_load_batch_claims_and_appends_in_one_transaction(self):
+        """Test that the mentions are written on the same connection as the claim."""
+        engine, conn = make_engine(claimed=True)
+        df = pd.DataFrame({"topic_id": [1]})
+
+        with patch.object(pd.DataFrame, "to_sql") as mock_to_sql:
+            assert BatchLedger(engine).load_batch("a", df, 10)
+
+        params = conn.execute.call_args.args[1]
+        assert params == {"key": "a", "message_count": 10, "mention_count": 1}
+        assert mock_to_sql.call_args.kwargs["con"] is conn
+
+    def test_load_batch_skips_batch_claimed_by_another_run(self, caplog):
+        """Test that nothing is appended when the batch is already in the ledger."""
+        engine, _ = make_engine(claimed=False)
+
+        with patch.object(pd.DataFrame, "to_sql") as mock_to_sql:
+            assert not BatchLedger(engine).load_batch("a", pd.DataFrame({"topic_id": [1]}), 10)
+
+        mock_to_sql.assert_not_called()
+        assert "already loaded" in caplog.text
+
+    def test_load_batch_stream_claims_then_appends_each_frame(self):
+        """Test that the claim, every frame and the final counts share one transaction."""
+        engine, conn = make_engine(claimed=True)
+        frames = [pd.DataFrame({"topic_id": [1, 2]}), pd.DataFrame({"topic_id": []}),
+                  pd.DataFrame({"topic_id": [3]})]
+
+        with patch.object(pd.DataFrame, "to_sql") as mock_to_sql:
+            mentions = BatchLedger(engine).load_batch_stream("a", iter(frames), lambda: 10)
+
+        assert mentions == 3
+        assert mock_to_sql.call_count == 2
+        assert all(call.kwargs["con"] is conn for call in mock_to_sql.call_args_list)
+        engine.begin.assert_called_once()
+        assert conn.execute.call_args_list[0].args[1] == {"key": "a"}
+        assert conn.execute.call_args_list[-1].args[1] == {
+            "key": "a", "message_count": 10, "mention_count": 3}
+
+    def test_load_batch_stream_skips_batch_claimed_by_another_run(self, caplog):
+        """Test that a claimed batch returns None without reading its frames."""
+        engine, _ = make_engine(claimed=False)
+        read = []
+
+        def frames():
+            read.append(True)
+            yield pd.DataFrame({"topic_id": [1]})
+
+        assert BatchLedger(engine).load_batch_stream("a", frames(), lambda: 10) is None
+        assert not read
+        assert "already loaded" in caplog.text
+
@@ -0,0 +1,109 @@
+""" Test file for the sentiment benchmark suite."""
+
+from unittest.mock import Mock, patch
+
+import pytest
+
+from benchmark_suite import percentile, measure, regressions, run_backend, environment
+
+
+def fake_pipeline(texts, **kwargs):
+    """Calls everything positive"""
+    return [{'label': 'POS', 'score': 0.9} for _ in texts]
+
+
+def result(backend='onnx', batch_size=32, **metrics):
+    """One row of suite results"""
+    row = {'backend': backend, 'batch_size': batch_size, 'messages_per_second': 100.0,
+           'p50_ms': 50.0, 'p99_ms': 80.0, 'peak_rss_mb': 1000.0, 'load_seconds': 2.0,
+           'accuracy': 0.8}
+    row.update(metrics)
+    return row
+
+
+class TestPercentile:
+    """Test cases for the percentile helper."""
+
+    @pytest.mark.parametrize("quantile, expected", [(0.5, 50), (0.99, 99), (1.0, 100), (0, 1)])
+    def test_nearest_rank(self, quantile, expected):
+        """Test nearest-rank percentiles of 1 to 100"""
+        assert percentile(list(range(100, 0, -1)), quantile) == expected
+
+    def test_empty(self):
+        """Test that no values give zero"""
+        assert percentile([], 0.5) == 0.0
+
+
+class TestMeasure:
+    """Test cases for measure."""
+
+    def test_batches_sorted_by_length_and_latency_per_message(self):
+        """Test that texts are scored in length-sorted batches and every message is timed"""
+        transformer = Mock()
+        texts = ["ccc", "a", "bb", "dddd", "e"]
+
+        figures = measure(transformer, texts, batch_size=2)
+
+        batches = [call.args[0] for call in transformer._score_batches.call_args_list]
+        assert batches == [["a", "e"], ["bb", "ccc"], ["dddd"]]
+        assert set(figures) == {'messages_per_second', 'p50_ms', 'p99_ms'}
+        assert figures['p99_ms'] >= figures['p50_ms'] >= 0
+
+
+class TestRunBackend:
+    """Test cases for run_backend."""
+
+    @patch('benchmark_suite.load')
+    def test_rows_for_every_batch_size(self, mock_load):
+        """Test that each batch size gets a row with every metric, smallest first"""
+        mock_load.return_value = fake_pipeline
+        corpus = [{'text': 'great', 'label': 'POS'}, {'text': 'awful', 'label': 'NEG'}]
+
+        rows = run_backend('pytorch', 'model', corpus, 10, [8, 1], '/tmp/onnx', False)
+
+        assert [row['batch_size'] for row in rows] == [1, 8]
+        assert all(row['accuracy'] == 0.5 for row in rows)
+        assert set(rows[0]) == {'backend', 'batch_size', 'load_seconds', 'messages_per_second',
+                                'p50_ms', 'p99_ms', 'loaded_rss_mb', 'peak_rss_mb', 'accuracy'}
+
+
+class TestRegressions:
+    """Test cases for comparing with a baseline."""
+
+    def test_no_regression_within_tolerance(self):
+        """Test that changes inside the tolerance pass"""
+        baseline = {'results': [result()]}
+        current = {'results': [result(messages_per_second=95.0, p99_ms=85.0)]}
+
+        assert regressions(current, baseline, 0.1) == []
+
+    def test_slower_and_bigger_are_regressions(self):
+        """Test that lower throughput, higher latency, memory and load time are flagged"""
+        baseline = {'results': [result()]}
+        current = {'results': [result(messages_per_second=50.0, p99_ms=200.0,
+                                      peak_rss_mb=2000.0, load_seconds=1.0)]}
+
+        found = regressions(current, baseline, 0.1)
+
+        assert len(found) == 3
+        assert any('messages_per_second' in line for line in found)
+        assert not any('load_seconds' in line for line in found)
+
+    def test_accuracy_drop(self):
+        """Test that a drop in accuracy past the allowance is flagged"""
+        baseline = {'results': [result()]}
+        current = {'results': [result(accuracy=0.7)]}
+
+        assert regressions(current, baseline, 0.1) == ['onnx batch 32: accuracy 0.8 -> 0.7']
+
+    def test_new_configurations_are_skipped(self):
+        """Test that configurations missing from the baseline are not compared"""
+        assert regressions({'results': [result(batch_size=128)]}, {'results': [result()]}, 0.1) == []
+
+
+def test_environment_records_versions():
+    """Test that the environment names the packages results depend on"""
+    found = environment()
+
+    assert found['packages']['torch']
+    assert found['cpus'] >= 1
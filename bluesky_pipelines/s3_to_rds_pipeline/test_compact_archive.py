@@ -0,0 +1,145 @@
+# pylint: skip-file
+import gzip
+import json
+import pytest
+import pyarrow.parquet as pq
+from datetime import datetime, timezone
+from compact_archive import (ArchiveCompactor, LocalBucket, ARCHIVE_PREFIX, DAY, HOUR,
+                             iter_periods, period_prefix, read_archive)
+
+BUCKET = "test-bucket"
+
+
+def post(text, created_at):
+    return {"text": text, "langs": ["en"], "$type": "app.bsky.feed.post", "createdAt": created_at}
+
+
+@pytest.fixture
+def bucket(tmp_path):
+    bucket = LocalBucket(str(tmp_path))
+    bucket.put_object(Bucket=BUCKET, Key="bluesky/raw_posts/2025/08/04/11/a.ndjson.gz",
+                      Body=gzip.compress(b"".join(json.dumps(item).encode() + b"\n" for item in [
+                          post("late", "2025-08-04T11:50:00.000Z"),
+                          post("early", "2025-08-04T11:05:00.000Z")])))
+    bucket.put_object(Bucket=BUCKET, Key="bluesky/raw_posts/2025/08/04/12/b.json",
+                      Body=json.dumps([post("noon", "2025-08-04T12:01:00Z"),
+                                       post("broken", "not a date")]))
+    return bucket
+
+
+def utc(*args):
+    return datetime(*args, tzinfo=timezone.utc)
+
+
+class TestPeriods:
+    """Tests checking period helpers."""
+
+    def test_iter_periods_covers_range(self):
+        """Test that every hour overlapping the range is covered."""
+        periods = list(iter_periods(utc(2025, 8, 4, 10, 30), utc(2025, 8, 4, 12), HOUR))
+        assert periods == [utc(2025, 8, 4, 10), utc(2025, 8, 4, 11)]
+
+    def test_period_prefix_is_hive_partitioned(self):
+        """Test that archive prefixes carry the date and hour partitions."""
+        assert period_prefix(utc(2025, 8, 4, 9), HOUR) == \
+            f"{ARCHIVE_PREFIX}granularity=hour/date=2025-08-04/hour=09/"
+        assert period_prefix(utc(2025, 8, 4), DAY) == \
+            f"{ARCHIVE_PREFIX}granularity=day/date=2025-08-04/"
+
+
+class TestArchiveCompactor:
+    """Tests checking ArchiveCompactor class."""
+
+    def test_compacts_day_into_one_sorted_part_with_provenance(self, bucket, tmp_path):
+        """Test that a day's batches become one part sorted by createdAt."""
+        compactor = ArchiveCompactor(bucket, BUCKET, DAY)
+
+        parts = compactor.compact(utc(2025, 8, 4), utc(2025, 8, 5))
+
+        assert len(parts) == 1
+        table = read_archive(str(tmp_path / BUCKET / ARCHIVE_PREFIX), granularity=DAY)
+        rows = table.to_pylist()
+        assert [row["text"] for row in rows] == ["early", "late", "noon", "broken"]
+        assert rows[0]["source_key"] == "bluesky/raw_posts/2025/08/04/11/a.ndjson.gz"
+        assert rows[0]["source_line"] == 1
+        assert rows[3]["createdAt"] is None
+
+    def test_day_is_written_an_hour_at_a_time(self, bucket, tmp_path):
+        """Test that each hour's batches become their own row group, rather than
+        the whole day being built in memory first."""
+        part_key = ArchiveCompactor(bucket, BUCKET, DAY).compact(utc(2025, 8, 4), utc(2025, 8, 5))[0]
+
+        part = pq.ParquetFile(tmp_path / BUCKET / part_key)
+
+        assert part.num_row_groups == 2
+        assert [part.metadata.row_group(index).num_rows for index in range(2)] == [2, 2]
+
+    def test_ledger_stops_batches_being_compacted_twice(self, bucket):
+        """Test that a second run only compacts batches that arrived since."""
+        compactor = ArchiveCompactor(bucket, BUCKET, HOUR)
+        assert len(compactor.compact(utc(2025, 8, 4, 11), utc(2025, 8, 4, 13))) == 2
+
+        assert compactor.compact(utc(2025, 8, 4, 11), utc(2025, 8, 4, 13)) == []
+
+        bucket.put_object(Bucket=BUCKET, Key="bluesky/raw_posts/2025/08/04/12/c.json",
+                          Body=json.dumps([post("new", "2025-08-04T12:59:00Z")]))
+        parts = compactor.compact(utc(2025, 8, 4, 11), utc(2025, 8, 4, 13))
+        assert len(parts) == 1
+        ledger = compactor.read_ledger(period_prefix(utc(2025, 8, 4, 12), HOUR))
+        assert ledger["sources"]["bluesky/raw_posts/2025/08/04/12/c.json"] == parts[0]
+
+    def test_retry_after_crash_overwrites_its_part(self, bucket, tmp_path):
+        """Test that a run retried after failing to write its ledger rewrites the
+        same part, even when another batch arrived in between."""
+        compactor = ArchiveCompactor(bucket, BUCKET, HOUR)
+        put_object = bucket.put_object
+
+        def crash_on_ledger(Bucket, Key, Body, **kwargs):
+            if Key.endswith("_ledger.json"):
+                raise OSError("connection reset")
+            return put_object(Bucket=Bucket, Key=Key, Body=Body, **kwargs)
+
+        bucket.put_object = crash_on_ledger
+        with pytest.raises(OSError):
+            compactor.compact(utc(2025, 8, 4, 12), utc(2025, 8, 4, 13))
+        bucket.put_object = put_object
+        bucket.put_object(Bucket=BUCKET, Key="bluesky/raw_posts/2025/08/04/12/c.json",
+                          Body=json.dumps([post("new", "2025-08-04T12:59:00Z")]))
+
+        compactor.compact(utc(2025, 8, 4, 12), utc(2025, 8, 4, 13))
+
+        partition = tmp_path / BUCKET / period_prefix(utc(2025, 8, 4, 12), HOUR)
+        assert len(list(partition.glob("*.parquet"))) == 1
+        table = read_archive(str(tmp_path / BUCKET / ARCHIVE_PREFIX))
+        assert sorted(table.column("text").to_pylist()) == ["broken", "new", "noon"]
+
+    def test_unknown_granularity_raises_error(self, bucket):
+        """Test that only hourly and daily archives are supported."""
+        with pytest.raises(ValueError):
+            ArchiveCompactor(bucket, BUCKET, "week")
+
+
+class TestReadArchive:
+    """Tests checking read_archive."""
+
+    def test_reads_only_requested_columns_and_time_range(self, bucket, tmp_path):
+        """Test that column projection and the createdAt filter are applied."""
+        ArchiveCompactor(bucket, BUCKET, HOUR).compact(utc(2025, 8, 4, 11), utc(2025, 8, 4, 13))
+
+        table = read_archive(str(tmp_path / BUCKET / ARCHIVE_PREFIX), ["text"],
+                             start=utc(2025, 8, 4, 11, 30), end=utc(2025, 8, 4, 12, 30))
+
+        assert table.column_names == ["text"]
+        assert table.column("text").to_pylist() == ["late", "noon"]
+
+    def test_post_batched_after_midnight_found_by_created_at(self, bucket, tmp_path):
+        """Test that a post created before midnight but in a batch started on the
+        next day is read back for a range ending at midnight."""
+        bucket.put_object(Bucket=BUCKET, Key="bluesky/raw_posts/2025/08/05/00/d.json",
+                          Body=json.dumps([post("midnight", "2025-08-04T23:58:00Z")]))
+        ArchiveCompactor(bucket, BUCKET, HOUR).compact(utc(2025, 8, 5), utc(2025, 8, 5, 1))
+
+        table = read_archive(str(tmp_path / BUCKET / ARCHIVE_PREFIX), ["text"],
+                             start=utc(2025, 8, 4, 23), end=utc(2025, 8, 5))
+
+        assert table.column("text").to_pylist() == ["midnight"]
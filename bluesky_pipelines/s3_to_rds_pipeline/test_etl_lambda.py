@@ -0,0 +1,212 @@
+# pylint: skip-file
+import threading
+import pandas as pd
+from unittest.mock import MagicMock, patch
+import pytest
+from etl_lambda import get_event_keys, lambda_handler, process_pending, SENTIMENT_CACHE
+
+KEY = "bluesky/raw_posts/2025/08/04/12/abcd--04-08-2025T12-10-00.ndjson.gz"
+
+
+def make_converter(fail_on=()):
+    converter = MagicMock()
+
+    def iter_file_messages(bucket, key):
+        if key in fail_on:
+            raise RuntimeError("broken batch")
+        yield {"text": key}
+
+    def stream_mentions(messages, transformer, rejected=None):
+        list(messages)
+        rejected.update({"not_english": 1})
+        yield pd.DataFrame({"topic_id": [1]})
+        yield pd.DataFrame({"topic_id": [2]})
+
+    converter.iter_file_messages.side_effect = iter_file_messages
+    converter.stream_mentions.side_effect = stream_mentions
+    return converter
+
+
+def make_ledger(processed=()):
+    ledger = MagicMock()
+    ledger.pending_keys.side_effect = lambda keys: [key for key in keys if key not in processed]
+    ledger.loaded = []
+
+    def load_batch_stream(key, frames, message_count):
+        mentions = sum(len(df) for df in frames)
+        ledger.loaded.append((key, message_count(), mentions))
+        return mentions
+
+    ledger.load_batch_stream.side_effect = load_batch_stream
+    return ledger
+
+
+class TestGetEventKeys:
+    """Tests checking get_event_keys."""
+
+    def test_reads_eventbridge_object_created_event(self):
+        """Test that the key is taken from an EventBridge event passed on by the step function."""
+        event = {"source": "aws.s3", "detail-type": "Object Created",
+                 "detail": {"bucket": {"name": "c18-trend-getter-s3"}, "object": {"key": KEY}}}
+
+        assert get_event_keys(event) == [KEY]
+
+    def test_reads_and_unquotes_s3_notification_records(self):
+        """Test that every record of an S3 notification is used, with keys url-decoded."""
+        event = {"Records": [
+            {"s3": {"object": {"key": KEY}}},
+            {"s3": {"object": {"key": "bluesky/raw_posts/2025/08/04/12/with+space.json"}}},
+        ]}
+
+        assert get_event_keys(event) == [KEY, "bluesky/raw_posts/2025/08/04/12/with space.json"]
+
+    @pytest.mark.parametrize("event", [
+        {},
+        {"detail": {"object": {"key": "bluesky/manifests/latest.json"}}},
+    ])
+    def test_ignores_events_without_raw_batches(self, event):
+        """Test that scheduled events and other prefixes name no batches."""
+        assert get_event_keys(event) == []
+
+
+class TestProcessPending:
+    """Tests checking process_pending."""
+
+    def test_processes_every_pending_batch_in_order(self):
+        """Test that all unprocessed batches are loaded, oldest first."""
+        ledger = make_ledger(processed={"b"})
+
+        results = process_pending(["a", "b", "c"], make_converter(), MagicMock(), ledger)
+
+        assert ledger.loaded == [("a", 1, 2), ("c", 1, 2)]
+        assert results == {"pending": 2, "processed": 2, "failed": [], "mentions": 4,
+                           "rejected": {"not_english": 2}}
+
+    def test_failed_batch_stays_pending_and_others_continue(self):
+        """Test that one broken batch does not stop the rest of the run."""
+        ledger = make_ledger()
+
+        results = process_pending(["a", "b", "c"], make_converter(fail_on={"b"}),
+                                  MagicMock(), ledger)
+
+        assert results["failed"] == ["b"]
+        assert results["processed"] == 2
+        assert [key for key, _, _ in ledger.loaded] == ["a", "c"]
+
+    def test_catch_up_runs_batches_concurrently_within_limit(self):
+        """Test that catch-up mode overlaps batches but never exceeds the concurrency limit."""
+        running = 0
+        peak = 0
+        lock = threading.Lock()
+        barrier = threading.Barrier(2, timeout=5)
+        converter = make_converter()
+
+        def iter_file_messages(bucket, key):
+            nonlocal running, peak
+            with lock:
+                running += 1
+                peak = max(peak, running)
+            barrier.wait()
+            with lock:
+                running -= 1
+            yield {"text": key}
+
+        converter.iter_file_messages.side_effect = iter_file_messages
+        keys = [str(number) for number in range(6)]
+
+        results = process_pending(keys, converter, MagicMock(), make_ledger(), concurrency=2)
+
+        assert peak == 2
+        assert results["processed"] == 6
+
+
+class TestLambdaHandler:
+    """Tests checking lambda_handler."""
+
+    @patch("etl_lambda.BatchLedger")
+    @patch("etl_lambda.DBLoader")
+    @patch("etl_lambda.DatabaseTopicExtractor")
+    @patch("etl_lambda.S3FileExtractor")
+    @patch("etl_lambda.S3Connection")
+    @patch("etl_lambda.process_pending")
+    def test_catch_up_event_sets_concurrency(self, mock_process, mock_connection, mock_extractor,
+                                             mock_topics, mock_loader, mock_ledger):
+        """Test that a catch-up event processes the backlog with its concurrency."""
+        mock_process.return_value = {"pending": 3, "processed": 3, "failed": [], "mentions": 5}
+
+        response = lambda_handler({"catch_up": True, "concurrency": 8})
+
+        assert response["statusCode"] == 200
+        assert mock_process.call_args.args[4] == 8
+
+    @patch("etl_lambda.BatchLedger")
+    @patch("etl_lambda.DBLoader")
+    @patch("etl_lambda.DatabaseTopicExtractor")
+    @patch("etl_lambda.S3FileExtractor")
+    @patch("etl_lambda.S3Connection")
+    @patch("etl_lambda.process_pending")
+    def test_failed_batches_fail_the_run(self, mock_process, mock_connection, mock_extractor,
+                                         mock_topics, mock_loader, mock_ledger):
+        """Test that a run with failed batches reports an error."""
+        mock_process.return_value = {"pending": 2, "processed": 1, "failed": ["b"], "mentions": 5}
+
+        response = lambda_handler({})
+
+        assert response["statusCode"] == 500
+        assert mock_process.call_args.args[4] == 1
+
+    @patch("etl_lambda.BatchLedger")
+    @patch("etl_lambda.DBLoader")
+    @patch("etl_lambda.DatabaseTopicExtractor")
+    @patch("etl_lambda.S3FileExtractor")
+    @patch("etl_lambda.S3Connection")
+    @patch("etl_lambda.process_pending")
+    def test_event_key_is_processed_without_listing(self, mock_process, mock_connection,
+                                                    mock_extractor, mock_topics, mock_loader,
+                                                    mock_ledger):
+        """Test that a batch named in the event is processed without a bucket lookup."""
+        mock_process.return_value = {"pending": 1, "processed": 1, "failed": [], "mentions": 2}
+
+        response = lambda_handler({"detail": {"object": {"key": KEY}}})
+
+        assert response["statusCode"] == 200
+        assert mock_process.call_args.args[0] == [KEY]
+        mock_extractor.return_value.get_keys_since.assert_not_called()
+
+    @patch("etl_lambda.BatchLedger")
+    @patch("etl_lambda.DBLoader")
+    @patch("etl_lambda.DatabaseTopicExtractor")
+    @patch("etl_lambda.S3FileExtractor")
+    @patch("etl_lambda.S3Connection")
+    @patch("etl_lambda.process_pending")
+    def test_event_without_keys_falls_back_to_lookup(self, mock_process, mock_connection,
+                                                     mock_extractor, mock_topics, mock_loader,
+                                                     mock_ledger):
+        """Test that an event naming no batch falls back to the manifest lookup."""
+        mock_extractor.return_value.get_keys_since.return_value = [KEY]
+        mock_process.return_value = {"pending": 0, "processed": 0, "failed": [], "mentions": 0}
+
+        response = lambda_handler({})
+
+        assert response["statusCode"] == 204
+        assert mock_process.call_args.args[0] == [KEY]
+
+    @patch("etl_lambda.BatchLedger")
+    @patch("etl_lambda.DBLoader")
+    @patch("etl_lambda.DatabaseTopicExtractor")
+    @patch("etl_lambda.S3FileExtractor")
+    @patch("etl_lambda.S3Connection")
+    @patch("etl_lambda.process_pending")
+    def test_sentiment_cache_kept_between_invocations(self, mock_process, mock_connection,
+                                                      mock_extractor, mock_topics, mock_loader,
+                                                      mock_ledger):
+        """Test that warm invocations share the sentiment cache and report its hit ratio."""
+        mock_process.return_value = {"pending": 1, "processed": 1, "failed": [], "mentions": 2}
+
+        lambda_handler({"detail": {"object": {"key": KEY}}})
+        first = mock_process.call_args.args[2]
+        response = lambda_handler({"detail": {"object": {"key": KEY}}})
+
+        assert first.cache is SENTIMENT_CACHE
+        assert mock_process.call_args.args[2].cache is SENTIMENT_CACHE
+        assert "'hit_ratio'" in response["body"]
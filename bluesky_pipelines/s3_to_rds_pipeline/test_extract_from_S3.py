@@ -1,6 +1,12 @@
 # pylint: skip-file
+import io
+import gzip
+import json
 import pytest
+import zstandard
 import pandas as pd
+from collections import Counter
+from datetime import datetime, timezone
 from unittest.mock import MagicMock, patch
 from extract_from_s3 import S3Connection, DatabaseTopicExtractor, S3FileExtractor, Converter
 
@@ -82,6 +88,50 @@ class TestS3FileExtractor:
         with pytest.raises(FileNotFoundError):
             extractor.get_latest_file_key("fake-bucket")
 
+    def test_get_latest_file_key_reads_manifest_pointer(self):
+        """Test that the latest key comes from one GET of the manifest pointer."""
+        client = MagicMock()
+        client.get_object.return_value = {"Body": MagicMock(read=MagicMock(
+            return_value=b'{"key": "bluesky/raw_posts/2025/08/04/12/a.json"}'))}
+
+        key = S3FileExtractor(client).get_latest_file_key("fake-bucket")
+
+        assert key == "bluesky/raw_posts/2025/08/04/12/a.json"
+        client.list_objects_v2.assert_not_called()
+
+    def test_listing_follows_continuation_tokens(self, fake_s3_client):
+        """Test that the fallback listing sees objects beyond the first page."""
+        fake_s3_client.list_objects_v2.side_effect = [
+            {"Contents": [{"Key": "old.json", "LastModified": 1}],
+             "IsTruncated": True, "NextContinuationToken": "next"},
+            {"Contents": [{"Key": "new.json", "LastModified": 2}]},
+        ]
+
+        key = S3FileExtractor(fake_s3_client).get_latest_file_key("fake-bucket")
+
+        assert key == "new.json"
+        assert fake_s3_client.list_objects_v2.call_args.kwargs["ContinuationToken"] == "next"
+
+    def test_get_keys_since_reads_one_manifest_per_hour(self, fake_s3_client):
+        """Test that new keys are resolved hour by hour, listing only hours without a manifest."""
+        manifests = {
+            "bluesky/manifests/2025/08/04/11/manifest.json": {"batches": [{"key": "k1"}, {"key": "k2"}]},
+        }
+        missing = fake_s3_client.get_object.side_effect
+        fake_s3_client.get_object.side_effect = lambda Bucket, Key: (
+            {"Body": MagicMock(read=MagicMock(return_value=json.dumps(manifests[Key]).encode()))}
+            if Key in manifests else missing(Bucket, Key))
+        fake_s3_client.list_objects_v2.return_value = {
+            "Contents": [{"Key": "k4", "LastModified": 4}, {"Key": "k3", "LastModified": 3}]}
+
+        keys = S3FileExtractor(fake_s3_client).get_keys_since(
+            "fake-bucket", datetime(2025, 8, 4, 11, 40, tzinfo=timezone.utc),
+            until=datetime(2025, 8, 4, 12, 5, tzinfo=timezone.utc))
+
+        assert keys == ["k1", "k2", "k3", "k4"]
+        fake_s3_client.list_objects_v2.assert_called_once_with(
+            Bucket="fake-bucket", Prefix="bluesky/raw_posts/2025/08/04/12/")
+
 
 class TestConverter:
     """Tests checking Converter class."""
@@ -97,6 +147,67 @@ class TestConverter:
         assert isinstance(dicts, list)
         assert dicts[0]["text"] == "hello"
 
+    def test_get_latest_file_as_dicts_reads_compressed_ndjson(self, fake_s3_client):
+        """Test that a gzip compressed NDJSON batch is read transparently."""
+        body = gzip.compress(b'{"text": "hello"}\n{"text": "world"}\n')
+        fake_s3_client.body = body
+        converter = Converter(S3FileExtractor(fake_s3_client))
+
+        dicts = converter.get_latest_file_as_dicts("fake-bucket")
+
+        assert dicts == [{"text": "hello"}, {"text": "world"}]
+
+    @pytest.mark.parametrize("content", [
+        b'[{"text": "hello"}, {"text": "world"}]',
+        b'{"text": "hello"}\n{"text": "world"}\n',
+        gzip.compress(b'{"text": "hello"}\n{"text": "world"}\n'),
+        zstandard.ZstdCompressor().compress(b'{"text": "hello"}\n{"text": "world"}\n'),
+    ])
+    def test_parse_batch_formats(self, content):
+        """Test that legacy arrays and compressed or plain NDJSON parse the same."""
+        assert Converter.parse_batch(content) == [{"text": "hello"}, {"text": "world"}]
+
+    @pytest.mark.parametrize("encode", [
+        lambda items: json.dumps(items).encode(),
+        lambda items: b"[" + b",".join(json.dumps(item).encode() for item in items) + b"]",
+        lambda items: "".join(json.dumps(item) + "\n" for item in items).encode(),
+        # one gzip member or zstd frame per multipart upload part
+        lambda items: b"".join(gzip.compress(json.dumps(item).encode() + b"\n") for item in items),
+        lambda items: b"".join(zstandard.ZstdCompressor().compress(json.dumps(item).encode() + b"\n")
+                               for item in items),
+    ])
+    def test_iter_batch_across_chunk_boundaries(self, encode):
+        """Test that items split across small reads, including multi-byte characters, are rebuilt."""
+        items = [{"text": f"post {number} \u00e9\u2603 [with, brackets]\nand lines"}
+                 for number in range(50)]
+
+        streamed = list(Converter.iter_batch(io.BytesIO(encode(items)), chunk_size=7))
+
+        assert streamed == items
+
+    def test_iter_batch_is_lazy(self):
+        """Test that the first message is yielded before the rest of the body is read."""
+        body = io.BytesIO(b"".join(b'{"text": "post"}\n' for _ in range(10000)))
+
+        messages = Converter.iter_batch(body, chunk_size=1024)
+        next(messages)
+
+        assert body.tell() <= 1024 + 4
+
+    def test_iter_batch_truncated_array_raises(self):
+        """Test that a batch cut off part way through an item is reported."""
+        with pytest.raises(json.JSONDecodeError):
+            list(Converter.iter_batch(io.BytesIO(b'[{"text": "hello"}, {"text": "wor'), 8))
+
+    def test_iter_file_messages_streams_s3_body(self, fake_s3_client):
+        """Test that messages are streamed from the object body."""
+        converter = Converter(S3FileExtractor(fake_s3_client))
+
+        messages = converter.iter_file_messages("fake-bucket", "file2.json")
+
+        assert [message["text"] for message in messages] == ["hello"]
+        fake_s3_client.get_object.assert_called_once_with(Bucket="fake-bucket", Key="file2.json")
+
 
 class TestTransformer:
     """Tests checking Transformer class."""
@@ -112,4 +223,69 @@ class TestTransformer:
         assert isinstance(result, pd.DataFrame)
         assert not result.empty
         assert "topic_id" in result.columns
-        assert "sentiment_label" in result.columns
\ No newline at end of file
+        assert "sentiment_label" in result.columns
+
+    def test_transform_messages_into_dataframe_scores_in_chunks(self, fake_dataframe, sample_message):
+        """Test that messages are handed to the transformer in chunks and the results joined."""
+        def transform_columns(messages, columns):
+            for column, values in fake_dataframe.items():
+                columns[column].extend(values)
+            return columns
+
+        mock_transformer = MagicMock()
+        mock_transformer.transform_columns.side_effect = transform_columns
+
+        result = Converter.transform_messages_into_dataframe(
+            [sample_message] * 5, mock_transformer, chunk_size=2)
+
+        assert [len(call.args[0]) for call in mock_transformer.transform_columns.call_args_list] == [2, 2, 1]
+        assert len(result) == 3
+        assert list(result.index) == [0, 1, 2]
+        assert list(result.columns) == list(fake_dataframe.columns)
+
+    def test_transform_messages_into_dataframe_shares_columns(self, sample_message):
+        """Test that every chunk appends to the same columns rather than building its own frame."""
+        mock_transformer = MagicMock()
+
+        Converter.transform_messages_into_dataframe(
+            [sample_message] * 3, mock_transformer, chunk_size=1)
+
+        columns = [call.kwargs["columns"] for call in mock_transformer.transform_columns.call_args_list]
+        assert len(columns) == 3
+        assert columns[0] is columns[1] is columns[2]
+
+    def test_transform_messages_into_dataframe_counts_rejected_messages(self, sample_message):
+        """Test that invalid messages are skipped and counted rather than stopping the batch."""
+        mock_transformer = MagicMock()
+        rejected = Counter()
+        messages = [sample_message, {**sample_message, "langs": ["de"]}, {"text": "no fields"},
+                    sample_message]
+
+        Converter.transform_messages_into_dataframe(
+            messages, mock_transformer, chunk_size=2, rejected=rejected)
+
+        assert [len(call.args[0]) for call in mock_transformer.transform_columns.call_args_list] == [1, 1]
+        assert rejected == {"not_english": 1, "missing_fields": 1}
+
+    def test_stream_mentions_yields_a_frame_per_chunk(self, sample_message):
+        """Test that each chunk is matched and scored into its own frame, in order."""
+        mock_transformer = MagicMock()
+        mock_transformer.match.side_effect = lambda batch: list(batch.texts)
+        mock_transformer.score_matches.side_effect = lambda matched: {"topic_id": matched}
+        messages = [{**sample_message, "text": str(number)} for number in range(5)]
+        rejected = Counter()
+
+        frames = list(Converter.stream_mentions(
+            messages + [{"text": "no fields"}], mock_transformer, chunk_size=2,
+            rejected=rejected, queue_size=1))
+
+        assert [df["topic_id"].tolist() for df in frames] == [["0", "1"], ["2", "3"], ["4"]]
+        assert rejected == {"missing_fields": 1}
+
+    def test_transform_messages_into_dataframe_no_mentions(self, sample_message):
+        """Test that an empty DataFrame is returned when nothing mentions a topic."""
+        mock_transformer = MagicMock()
+
+        result = Converter.transform_messages_into_dataframe([sample_message], mock_transformer)
+
+        assert result.empty
@@ -0,0 +1,248 @@
+""" Test file for the sentiment backends module."""
+
+import os
+import json
+from pathlib import Path
+from unittest.mock import patch
+
+import pytest
+import torch
+
+from benchmark_sentiment import random_weights_pipeline, load_corpus
+from sentiment_backends import (QUANTIZED, ONNX, quantize, export_onnx, onnx_pipeline,
+                                OnnxSentimentPipeline, parity, local_pipeline, model_source)
+from bake_model import save
+from transform import MessageTransformer, MAX_TOKENS
+
+CORPUS = load_corpus()
+TEXTS = [row["text"] for row in CORPUS]
+
+
+def fake_export(reference, directory, source):
+    """Stands in for export_onnx, writing an empty model and the source it was made from"""
+    exported = Path(directory)
+    exported.mkdir(parents=True, exist_ok=True)
+    (exported / "model.onnx").write_bytes(b"")
+    (exported / "source.json").write_text(json.dumps(source))
+
+
+@pytest.fixture(scope="module")
+def reference():
+    """A small bertweet-shaped pipeline trained for a few steps on the labelled
+    corpus, so its labels vary like the real model's."""
+    trained = random_weights_pipeline(TEXTS, layers=2, hidden=64)
+    model = trained.model.train()
+    encoded = trained.tokenizer(TEXTS, padding=True, return_tensors="pt")
+    labels = torch.tensor([model.config.label2id[row["label"]] for row in CORPUS])
+    optimiser = torch.optim.AdamW(model.parameters(), lr=1e-3)
+    for _ in range(40):
+        loss = model(**encoded, labels=labels).loss
+        optimiser.zero_grad()
+        loss.backward()
+        optimiser.step()
+    model.eval()
+    return trained
+
+
+def score(sentiment_pipeline) -> list[dict]:
+    """Scores the corpus the way MessageTransformer does"""
+    return sentiment_pipeline(TEXTS, batch_size=32, truncation=True, max_length=MAX_TOKENS)
+
+
+class TestParity:
+    """Parity of each backend with the full precision reference."""
+
+    def test_reference_labels_vary(self, reference):
+        """Test that the reference gives every label, so agreement means something"""
+        assert {sentiment['label'] for sentiment in score(reference)} == {'POS', 'NEG', 'NEU'}
+
+    def test_quantized_parity(self, reference):
+        """Test that int8 quantisation keeps the labels and drifts the scores little"""
+        result = parity(score(reference), score(quantize(reference)))
+
+        assert result['label_agreement'] >= 0.95
+        assert result['mean_score_drift'] < 0.02
+
+    def test_quantized_leaves_reference_untouched(self, reference):
+        """Test that quantising copies the model rather than changing it"""
+        quantize(reference)
+
+        assert type(reference.model.classifier.dense) is torch.nn.Linear
+
+    def test_onnx_parity(self, reference, tmp_path):
+        """Test that the ONNX export gives the same labels and practically the same scores"""
+        export_onnx(reference, str(tmp_path))
+
+        result = parity(score(reference), score(OnnxSentimentPipeline(str(tmp_path))))
+
+        assert result['label_agreement'] == 1.0
+        assert result['max_score_drift'] < 1e-4
+
+
+class TestOnnxSentimentPipeline:
+    """Test cases for OnnxSentimentPipeline class."""
+
+    def test_single_text_returns_a_list_like_transformers(self, reference, tmp_path):
+        """Test that one text gives a one item list, like a transformers pipeline"""
+        export_onnx(reference, str(tmp_path))
+        sentiment_pipeline = OnnxSentimentPipeline(str(tmp_path))
+
+        result = sentiment_pipeline("passed my driving test!!!")
+
+        assert len(result) == 1
+        assert result[0]['label'] in ('POS', 'NEG', 'NEU')
+        assert 0 <= result[0]['score'] <= 1
+
+    def test_truncates_long_texts(self, reference, tmp_path):
+        """Test that texts past the model's length are truncated rather than failing"""
+        export_onnx(reference, str(tmp_path))
+        sentiment_pipeline = OnnxSentimentPipeline(str(tmp_path))
+
+        result = sentiment_pipeline([" ".join(TEXTS)], truncation=True, max_length=MAX_TOKENS)
+
+        assert len(result) == 1
+
+    @patch('sentiment_backends.export_onnx', side_effect=fake_export)
+    @patch('sentiment_backends.pipeline')
+    @patch('sentiment_backends.OnnxSentimentPipeline')
+    def test_onnx_pipeline_exports_once(self, mock_onnx, mock_pipeline, mock_export, tmp_path):
+        """Test that the model is only exported when the directory holds no export of it"""
+        onnx_pipeline("some-model", str(tmp_path))
+        onnx_pipeline("some-model", str(tmp_path))
+
+        mock_export.assert_called_once_with(mock_pipeline.return_value, str(tmp_path),
+                                            {"model": "some-model"})
+        assert mock_onnx.call_count == 2
+
+    @patch('sentiment_backends.export_onnx', side_effect=fake_export)
+    @patch('sentiment_backends.pipeline')
+    @patch('sentiment_backends.OnnxSentimentPipeline')
+    def test_onnx_pipeline_reexports_changed_model(self, mock_onnx, mock_pipeline, mock_export,
+                                                   tmp_path):
+        """Test that an export of another model, or of weights since saved over, is replaced"""
+        baked = tmp_path / "baked"
+        baked.mkdir()
+        (baked / "model.safetensors").write_bytes(b"old weights")
+        exports = str(tmp_path / "onnx")
+
+        onnx_pipeline("some-model", exports)
+        onnx_pipeline(str(baked), exports)
+        onnx_pipeline(str(baked), exports)
+        (baked / "model.safetensors").write_bytes(b"new, larger weights")
+        onnx_pipeline(str(baked), exports)
+
+        assert mock_export.call_count == 3
+
+    @patch('sentiment_backends.pipeline')
+    @patch('sentiment_backends.OnnxSentimentPipeline')
+    def test_export_without_source_is_replaced(self, mock_onnx, mock_pipeline, tmp_path):
+        """Test that an export that did not record its source is not trusted"""
+        (tmp_path / "model.onnx").write_bytes(b"")
+
+        with patch('sentiment_backends.export_onnx', side_effect=fake_export) as mock_export:
+            onnx_pipeline("some-model", str(tmp_path))
+
+        mock_export.assert_called_once()
+
+    @patch('sentiment_backends.access', return_value=False)
+    @patch('sentiment_backends.pipeline')
+    @patch('sentiment_backends.OnnxSentimentPipeline')
+    def test_stale_export_in_read_only_directory_used(self, mock_onnx, mock_pipeline,
+                                                      mock_access, tmp_path, caplog):
+        """Test that an export that cannot be replaced is loaded with a warning"""
+        fake_export(None, str(tmp_path), {"model": "other-model"})
+
+        with patch('sentiment_backends.export_onnx') as mock_export:
+            onnx_pipeline("some-model", str(tmp_path))
+
+        mock_export.assert_not_called()
+        mock_onnx.assert_called_once_with(str(tmp_path))
+        assert "read-only" in caplog.text
+
+
+class TestBakedModel:
+    """Test cases for saving the model into the image and loading it back."""
+
+    def test_save_writes_safetensors(self, reference, tmp_path):
+        """Test that the weights are saved as safetensors with the tokenizer"""
+        weights = save(reference, str(tmp_path))
+
+        assert weights == str(tmp_path / "model.safetensors")
+        assert (tmp_path / "tokenizer.json").exists()
+        assert not list(tmp_path.glob("*.bin"))
+
+    def test_baked_source_ignores_modification_times(self, reference, tmp_path):
+        """Test that a baked model is identified by its weights' digest, so the
+        times rounded by an image layer do not make its export look stale"""
+        weights = save(reference, str(tmp_path))
+        source = model_source(str(tmp_path))
+
+        os.utime(weights, (0, 0))
+
+        assert model_source(str(tmp_path)) == source
+        assert len(source["weights_sha256"]) == 64
+
+    def test_local_pipeline_matches_reference(self, reference, tmp_path, monkeypatch):
+        """Test that the baked model loads offline and scores like the original"""
+        monkeypatch.setenv("HF_HUB_OFFLINE", "1")
+        save(reference, str(tmp_path))
+
+        result = parity(score(reference), score(local_pipeline(str(tmp_path))))
+
+        assert result['label_agreement'] == 1.0
+        assert result['max_score_drift'] < 1e-5
+
+
+class TestTransformerBackends:
+    """Test cases for choosing a backend on MessageTransformer."""
+
+    def test_unknown_backend_raises_error(self):
+        """Test that an unknown backend is refused up front"""
+        with pytest.raises(ValueError):
+            MessageTransformer({'trump': 1}, backend="tpu")
+
+    @patch('transform.onnx_pipeline')
+    @patch('transform.pipeline')
+    def test_onnx_backend_skips_pytorch_pipeline(self, mock_pipeline, mock_onnx_pipeline):
+        """Test that the ONNX backend is loaded without the PyTorch pipeline"""
+        transformer = MessageTransformer({'trump': 1}, backend=ONNX)
+
+        assert transformer.sentiment_pipeline is mock_onnx_pipeline.return_value
+        mock_pipeline.assert_not_called()
+
+    @patch('transform.quantize')
+    @patch('transform.pipeline')
+    def test_quantized_backend_wraps_pytorch_pipeline(self, mock_pipeline, mock_quantize):
+        """Test that the quantised backend quantises the loaded PyTorch pipeline"""
+        transformer = MessageTransformer({'trump': 1}, backend=QUANTIZED)
+
+        assert transformer.sentiment_pipeline is mock_quantize.return_value
+        mock_quantize.assert_called_once_with(mock_pipeline.return_value)
+
+    @patch('transform.local_pipeline')
+    @patch('transform.pipeline')
+    def test_baked_model_is_loaded_locally(self, mock_pipeline, mock_local_pipeline, tmp_path):
+        """Test that a model baked into model_path is loaded from there"""
+        transformer = MessageTransformer({'trump': 1}, model_path=str(tmp_path))
+
+        assert transformer.sentiment_pipeline is mock_local_pipeline.return_value
+        mock_local_pipeline.assert_called_once_with(str(tmp_path))
+        mock_pipeline.assert_not_called()
+
+    @patch('transform.local_pipeline')
+    @patch('transform.pipeline')
+    def test_missing_baked_model_falls_back_to_hub(self, mock_pipeline, mock_local_pipeline,
+                                                   tmp_path):
+        """Test that the hub model is loaded when model_path holds no model"""
+        transformer = MessageTransformer({'trump': 1}, model_path=str(tmp_path / "missing"))
+
+        assert transformer.sentiment_pipeline is mock_pipeline.return_value
+        mock_local_pipeline.assert_not_called()
+
+    @patch('transform.onnx_pipeline')
+    def test_onnx_backend_exports_baked_model(self, mock_onnx_pipeline, tmp_path):
+        """Test that the ONNX backend exports from the baked model, not the hub"""
+        transformer = MessageTransformer({'trump': 1}, backend=ONNX, model_path=str(tmp_path))
+
+        assert transformer.sentiment_pipeline is mock_onnx_pipeline.return_value
+        mock_onnx_pipeline.assert_called_once_with(str(tmp_path))
@@ -0,0 +1,92 @@
+""" Test file for the sentiment cache module."""
+
+import threading
+
+from sentiment_cache import SentimentCache, normalise, text_key
+
+POS = {'label': 'POS', 'score': 0.9}
+NEG = {'label': 'NEG', 'score': 0.8}
+
+
+class TestTextKey:
+    """Test cases for text normalisation and keys."""
+
+    def test_normalise_collapses_whitespace(self):
+        """Test that runs of whitespace and surrounding whitespace are folded"""
+        assert normalise("  I love\n\nthis\t ") == "I love this"
+
+    def test_normalise_folds_compatibility_forms(self):
+        """Test that full-width and other compatibility characters are folded"""
+        assert normalise("ｆｏｏｔｂａｌｌ") == "football"
+
+    def test_equal_after_normalising_share_a_key(self):
+        """Test that texts differing only in whitespace share a key"""
+        assert text_key("I love  this") == text_key("I love this ")
+        assert text_key("I love this") != text_key("I hate this")
+        assert len(text_key("x" * 10000)) == 16
+
+
+class TestSentimentCache:
+    """Test cases for SentimentCache class."""
+
+    def test_get_and_put(self):
+        """Test that a cached sentiment is returned and counted as a hit"""
+        cache = SentimentCache(max_size=10)
+
+        assert cache.get(b"a") is None
+        cache.put(b"a", POS)
+
+        assert cache.get(b"a") == POS
+        assert cache.stats() == {'hits': 1, 'misses': 1, 'hit_ratio': 0.5, 'size': 1}
+
+    def test_evicts_least_recently_used(self):
+        """Test that the least recently used entry is dropped once full"""
+        cache = SentimentCache(max_size=2)
+        cache.put(b"a", POS)
+        cache.put(b"b", NEG)
+        cache.get(b"a")
+
+        cache.put(b"c", POS)
+
+        assert len(cache) == 2
+        assert cache.get(b"b") is None
+        assert cache.get(b"a") == POS
+
+    def test_zero_size_disables_caching(self):
+        """Test that a cache of size zero keeps nothing"""
+        cache = SentimentCache(max_size=0)
+
+        cache.put(b"a", POS)
+
+        assert cache.get(b"a") is None
+        assert len(cache) == 0
+
+    def test_reset_stats_keeps_entries(self):
+        """Test that resetting the counts keeps what is cached"""
+        cache = SentimentCache(max_size=10)
+        cache.put(b"a", POS)
+        cache.get(b"a")
+        cache.record_hits(3)
+
+        cache.reset_stats()
+
+        assert cache.stats() == {'hits': 0, 'misses': 0, 'hit_ratio': 0.0, 'size': 1}
+
+    def test_thread_safe(self):
+        """Test that concurrent use keeps the size bound and counts"""
+        cache = SentimentCache(max_size=50)
+
+        def use(worker):
+            for number in range(1000):
+                key = f"{worker}-{number % 100}".encode()
+                if cache.get(key) is None:
+                    cache.put(key, POS)
+
+        threads = [threading.Thread(target=use, args=(worker,)) for worker in range(4)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        assert len(cache) == 50
+        assert cache.hits + cache.misses == 4000
@@ -0,0 +1,130 @@
+""" Test file for the sharded inference module."""
+
+import os
+import signal
+from unittest.mock import patch
+
+import pytest
+
+from sharded_inference import ShardedScorer, worker_count, threads_per_worker
+from transform import MessageTransformer
+from sentiment_backends import ONNX
+
+
+def score_lengths(texts: list[str], batch_size: int) -> list[dict]:
+    """Stands in for the model, scoring each text by its length and the process it ran in"""
+    return [{"label": "NEU", "score": len(text), "pid": os.getpid()} for text in texts]
+
+
+def fail_on_boom(texts: list[str], batch_size: int) -> list[dict]:
+    """Stands in for a model that breaks on one text"""
+    if "boom" in texts:
+        raise MemoryError("out of memory")
+    return score_lengths(texts, batch_size)
+
+
+class TestShardedScorer:
+    """Test cases for scoring texts across forked workers."""
+
+    def test_results_keep_original_order(self):
+        """Test that every text gets its own result, whatever shard scored it"""
+        texts = ["x" * length for length in (9, 3, 7, 1, 5, 8, 2, 6, 4, 10)]
+        with ShardedScorer(score_lengths, workers=3) as scorer:
+            results = scorer.score(texts, batch_size=2)
+
+        assert [result["score"] for result in results] == [len(text) for text in texts]
+
+    def test_shards_run_in_worker_processes(self):
+        """Test that the texts are split between the workers, not scored in this process"""
+        with ShardedScorer(score_lengths, workers=2) as scorer:
+            results = scorer.score(["a"] * 8, batch_size=2)
+
+        pids = {result["pid"] for result in results}
+        assert len(pids) == 2
+        assert os.getpid() not in pids
+
+    def test_few_texts_use_fewer_workers(self):
+        """Test that no worker is sent less than a batch of texts"""
+        with ShardedScorer(score_lengths, workers=4) as scorer:
+            results = scorer.score(["a", "b", "c"], batch_size=32)
+
+        assert len({result["pid"] for result in results}) == 1
+
+    def test_no_texts(self):
+        """Test that nothing is sent to the workers for no texts"""
+        with ShardedScorer(score_lengths, workers=2) as scorer:
+            assert scorer.score([], batch_size=32) == []
+
+    def test_worker_error_raised_and_workers_still_usable(self):
+        """Test that a failing shard raises here, and later texts are still scored"""
+        with ShardedScorer(fail_on_boom, workers=2) as scorer:
+            with pytest.raises(RuntimeError, match="MemoryError"):
+                scorer.score(["boom", "a", "b", "c"], batch_size=1)
+
+            assert len(scorer.score(["a", "b", "c", "d"], batch_size=1)) == 4
+
+    def test_dead_worker_never_returns_stale_results(self):
+        """Test that after a worker is killed every call raises, rather than
+        returning replies meant for an earlier call"""
+        with ShardedScorer(score_lengths, workers=2) as scorer:
+            os.kill(scorer._processes[1].pid, signal.SIGKILL)
+            scorer._processes[1].join(timeout=5)
+
+            with pytest.raises(RuntimeError, match="the worker exited"):
+                scorer.score(["a", "bb"], batch_size=1)
+            for texts in (["zzz"], ["yyyy"]):
+                with pytest.raises(RuntimeError, match="no longer used"):
+                    scorer.score(texts, batch_size=32)
+
+    def test_close_stops_workers(self):
+        """Test that closing the scorer ends the worker processes"""
+        scorer = ShardedScorer(score_lengths, workers=2)
+        processes = list(scorer._processes)
+        scorer.close()
+
+        assert not any(process.is_alive() for process in processes)
+
+    @patch('sharded_inference.cpu_count', return_value=6)
+    def test_worker_and_thread_counts(self, mock_cpu_count):
+        """Test that 0 workers means one per core, and workers share the cores"""
+        assert worker_count(0) == 6
+        assert worker_count(2) == 2
+        assert threads_per_worker(2) == 3
+        assert threads_per_worker(12) == 1
+
+
+class TestTransformerWorkers:
+    """Test cases for starting workers on MessageTransformer."""
+
+    @patch('transform.pipeline')
+    def test_workers_score_batches(self, mock_pipeline):
+        """Test that the model is loaded before forking and batches go to the workers"""
+        mock_pipeline.return_value.side_effect = lambda texts, **_: [
+            {"label": "POS", "score": len(text) / 10} for text in texts]
+        transformer = MessageTransformer({'trump': 1})
+        transformer.start_workers(2)
+
+        try:
+            sentiments = transformer.get_sentiments(["trump", "trump is great"], batch_size=1)
+        finally:
+            transformer.stop_workers()
+
+        mock_pipeline.assert_called_once()
+        assert mock_pipeline.return_value.call_count == 0  # called in the workers only
+        assert [sentiment["score"] for sentiment in sentiments] == [0.5, 1.4]
+
+    @patch('transform.ShardedScorer')
+    @patch('transform.pipeline')
+    def test_one_worker_scores_in_process(self, mock_pipeline, mock_scorer):
+        """Test that a single worker does not fork"""
+        MessageTransformer({'trump': 1}).start_workers(1)
+
+        mock_scorer.assert_not_called()
+
+    @patch('transform.ShardedScorer')
+    @patch('transform.onnx_pipeline')
+    def test_onnx_backend_scores_in_process(self, mock_onnx_pipeline, mock_scorer):
+        """Test that the ONNX backend, which is not fork safe, does not fork"""
+        MessageTransformer({'trump': 1}, backend=ONNX).start_workers(4)
+
+        mock_scorer.assert_not_called()
@@ -0,0 +1,98 @@
+# pylint: skip-file
+import threading
+import pytest
+from streaming import stream
+
+
+def numbers(count, read=None):
+    for number in range(count):
+        if read is not None:
+            read.append(number)
+        yield number
+
+
+class TestStream:
+    """Tests checking stream."""
+
+    @pytest.mark.parametrize("queue_size", [0, 1, 3])
+    def test_items_pass_every_stage_in_order(self, queue_size):
+        """Test that each item goes through the stages in turn and comes out in order."""
+        result = list(stream(numbers(20), lambda n: n * 2, lambda n: n + 1, queue_size=queue_size))
+
+        assert result == [n * 2 + 1 for n in range(20)]
+
+    def test_stages_overlap(self):
+        """Test that the source is read on while a stage is still working on an earlier item."""
+        second_read = threading.Event()
+
+        def source():
+            yield 1
+            second_read.set()
+            yield 2
+
+        def stage(item):
+            if item == 1:
+                assert second_read.wait(timeout=5)
+            return item
+
+        assert list(stream(source(), stage, queue_size=1)) == [1, 2]
+
+    def test_read_ahead_is_bounded_by_queue_size(self):
+        """Test that a slow consumer holds the source back, so memory stays bounded."""
+        read = []
+        consumed = 0
+        ahead = 0
+        for _ in stream(numbers(50, read), lambda n: n, queue_size=1):
+            threading.Event().wait(0.005)
+            consumed += 1
+            ahead = max(ahead, len(read) - consumed)
+
+        # an item waiting in each of the two queues, and one in hand per thread
+        assert ahead <= 4
+
+    def test_stage_error_raised_and_threads_stopped(self):
+        """Test that an error in a stage is raised to the caller and every thread ends."""
+        before = threading.active_count()
+
+        def stage(item):
+            if item == 3:
+                raise ValueError("bad chunk")
+            return item
+
+        with pytest.raises(ValueError, match="bad chunk"):
+            list(stream(numbers(1000), stage, queue_size=2))
+
+        assert threading.active_count() == before
+
+    def test_source_error_raised(self):
+        """Test that an error reading the source is raised to the caller."""
+        def source():
+            yield 1
+            raise OSError("connection reset")
+
+        with pytest.raises(OSError, match="connection reset"):
+            list(stream(source(), lambda n: n, queue_size=2))
+
+    def test_closing_early_stops_threads(self):
+        """Test that closing the stream before the end stops reading the source."""
+        before = threading.active_count()
+        read = []
+        items = stream(numbers(10_000, read), lambda n: n, queue_size=1)
+
+        assert next(items) == 0
+        items.close()
+
+        assert threading.active_count() == before
+        assert len(read) < 10
+
+    def test_zero_queue_size_runs_in_calling_thread(self):
+        """Test that with no queues every stage runs in the caller's thread, in turn."""
+        threads = set()
+
+        def stage(item):
+            threads.add(threading.current_thread())
+            return item
+
+        list(stream(numbers(5), stage, queue_size=0))
+
+        assert threads == {threading.current_thread()}
@@ -0,0 +1,66 @@
+""" Test file for the topic matcher module."""
+
+import pytest
+
+from topic_matcher import TopicMatcher
+
+AUTOMATON = 0  # scan_below forcing the Aho-Corasick automaton
+SCAN = 1000  # scan_below forcing one search per topic
+
+
+@pytest.fixture(params=[AUTOMATON, SCAN], ids=["automaton", "scan"])
+def scan_below(request):
+    """Runs each test against both ways of matching."""
+    return request.param
+
+
+class TestTopicMatcher:
+    """Test cases for TopicMatcher class."""
+
+    def test_finds_overlapping_topics(self, scan_below):
+        """Test that topics inside and overlapping each other are all found"""
+        matcher = TopicMatcher({'he': 1, 'she': 2, 'his': 3, 'hers': 4}, scan_below=scan_below)
+
+        assert matcher.find('ushers') == ['he', 'she', 'hers']
+
+    def test_case_insensitive(self, scan_below):
+        """Test that topics and text are matched regardless of case"""
+        matcher = TopicMatcher({'Trump': 1, 'biden': 2}, scan_below=scan_below)
+
+        assert matcher.find('I am TRUMP and Biden') == ['Trump', 'biden']
+
+    def test_keeps_topics_dict_order(self, scan_below):
+        """Test that topics are returned in the order of the topics dict, not the text"""
+        matcher = TopicMatcher({'football': 1, 'trump': 5, 'cricket': 2}, scan_below=scan_below)
+
+        assert matcher.find('cricket then trump then cricket') == ['trump', 'cricket']
+
+    def test_no_topics_found(self, scan_below):
+        """Test that a text without topics gives an empty list"""
+        matcher = TopicMatcher({'trump': 1, '': 2}, scan_below=scan_below)
+
+        assert matcher.find('I love cats and dogs') == []
+
+    def test_substrings_match_by_default(self, scan_below):
+        """Test that a topic inside a longer word matches without whole_words"""
+        matcher = TopicMatcher({'art': 1}, scan_below=scan_below)
+
+        assert matcher.find('so smart') == ['art']
+
+    def test_whole_words(self, scan_below):
+        """Test that with whole_words a topic must not be part of a longer word"""
+        matcher = TopicMatcher({'art': 1, 'modern art': 2, 'c++': 3},
+                               whole_words=True, scan_below=scan_below)
+
+        assert matcher.find('so smart') == []
+        assert matcher.find('arts and (art)') == ['art']
+        assert matcher.find('smart modern art') == ['art', 'modern art']
+        assert matcher.find('I like c++!') == ['c++']
+
+    def test_many_topics(self):
+        """Test that the automaton is used for many topics and finds the right ones"""
+        topics = {f'topic{number}x': number for number in range(500)}
+
+        matcher = TopicMatcher(topics)
+
+        assert matcher.find('about topic42x and TOPIC7X') == ['topic7x', 'topic42x']
@@ -6,7 +6,8 @@ import regex as re
 from datetime import datetime
 from unittest.mock import Mock, patch, MagicMock
 
-from transform import Message, MessageTransformer, MessageError
+from transform import Message, MessageBatch, MessageTransformer, MessageError
+from sentiment_cache import SentimentCache
 
 TOPICS_DICT = {'trump': 1, 'biden': 2}
 
@@ -98,6 +99,73 @@ class TestMessage:
         assert timestamp1 is timestamp2  # same object reference
 
 
+def raw_message(**fields) -> dict:
+    """A valid raw message, with any fields overridden or, set to None, removed"""
+    message = {'text': 'Test message', 'langs': ['en'], '$type': 'app.bsky.feed.post',
+               'createdAt': '2025-07-28T12:36:42.475Z', **fields}
+    return {field: value for field, value in message.items() if value is not None}
+
+
+class TestMessageBatch:
+    """Test cases for validating raw messages together."""
+
+    def test_valid_messages_kept_in_order(self):
+        """Test that valid messages keep their text and parsed timestamp, in order"""
+        batch = MessageBatch.from_raw([raw_message(text='first'),
+                                       raw_message(text='second', createdAt='2025-07-28T13:00:00Z')])
+
+        assert batch.texts == ['first', 'second']
+        assert [timestamp.hour for timestamp in batch.timestamps] == [12, 13]
+        assert batch.timestamps[0].second == 42
+        assert batch.rejected == {}
+        assert len(batch) == 2
+
+    @pytest.mark.parametrize("missing_field", ["text", "langs", "$type", "createdAt"])
+    def test_missing_field_rejected(self, missing_field):
+        """Test that a message missing any required field is counted, not raised"""
+        batch = MessageBatch.from_raw([raw_message(**{missing_field: None}), raw_message()])
+
+        assert len(batch) == 1
+        assert batch.rejected == {'missing_fields': 1}
+
+    def test_rejections_counted_by_reason(self):
+        """Test that non-English posts, unparseable timestamps and non-text posts are counted apart"""
+        batch = MessageBatch.from_raw([
+            raw_message(langs=['ja']),
+            raw_message(langs=[]),
+            raw_message(langs=['ja', 'en'], text='bilingual'),
+            raw_message(createdAt='yesterday'),
+            raw_message(text=42),
+            raw_message(text='kept'),
+        ])
+
+        assert batch.texts == ['bilingual', 'kept']
+        assert batch.rejected == {'not_english': 2, 'invalid_timestamp': 1, 'missing_fields': 1}
+
+    @pytest.mark.parametrize("record", [None, [], "text", 42])
+    def test_record_that_is_not_an_object_rejected(self, record):
+        """Test that a null, array or scalar line is counted as missing fields, not raised"""
+        batch = MessageBatch.from_raw([raw_message(text='first'), record, raw_message(text='kept')])
+
+        assert batch.texts == ['first', 'kept']
+        assert batch.rejected == {'missing_fields': 1}
+
+    def test_timestamps_parsed_like_message(self):
+        """Test that timestamps are parsed exactly as Message.timestamp parses them"""
+        created = ['2025-07-28T14:36:42+02:00', '2025-07-28T12:36:42.475Z', '2025-08-04T12:23:52']
+        batch = MessageBatch.from_raw([raw_message(createdAt=value) for value in created])
+
+        assert batch.timestamps == [Message(raw_message(createdAt=value)).timestamp
+                                    for value in created]
+
+    def test_empty_batch(self):
+        """Test that no messages give an empty batch"""
+        batch = MessageBatch.from_raw([])
+
+        assert len(batch) == 0
+        assert batch.rejected == {}
+
+
 class TestMessageTransformer:
     """Test cases for MessageTransformer class."""
 
@@ -184,6 +252,143 @@ class TestMessageTransformer:
         assert result == {'label': 'POS', 'score': 0.7}
         mock_pipeline_instance.assert_called_once()
 
+    @patch('transform.pipeline')
+    def test_get_sentiments_batches_sorted_by_length(self, mock_pipeline, transformer):
+        """Test that texts are scored in length-sorted batches and returned in order"""
+        mock_pipeline_instance = Mock()
+        mock_pipeline.return_value = mock_pipeline_instance
+        mock_pipeline_instance.side_effect = lambda texts, **kwargs: [
+            {'label': 'POS', 'score': len(text) / 100} for text in texts]
+        texts = ["a" * 30, "a" * 10, "a" * 20]
+
+        result = transformer.get_sentiments(texts, batch_size=2)
+
+        assert [sentiment['score'] for sentiment in result] == [0.3, 0.1, 0.2]
+        batches = [call.args[0] for call in mock_pipeline_instance.call_args_list]
+        assert batches == [["a" * 10, "a" * 20], ["a" * 30]]
+        assert mock_pipeline_instance.call_args.kwargs["truncation"] is True
+
+    @patch('transform.pipeline')
+    def test_get_sentiments_takes_best_label_of_each_text(self, mock_pipeline, transformer):
+        """Test that each text's highest scoring label is kept when all labels are returned"""
+        mock_pipeline_instance = Mock()
+        mock_pipeline.return_value = mock_pipeline_instance
+        mock_pipeline_instance.return_value = [
+            [{'label': 'NEG', 'score': 0.2}, {'label': 'POS', 'score': 0.8}]]
+
+        result = transformer.get_sentiments(["I love this!"])
+
+        assert result == [{'label': 'POS', 'score': 0.8}]
+
+    @patch('transform.pipeline')
+    def test_get_sentiments_falls_back_to_single_texts(self, mock_pipeline, transformer):
+        """Test that a failed batch is scored one text at a time, skipping texts that fail"""
+        def score(texts, **kwargs):
+            if isinstance(texts, list):
+                raise RuntimeError("index out of range")
+            if texts == "bad":
+                raise IndexError("index out of range")
+            return [{'label': 'NEU', 'score': 0.5}]
+
+        mock_pipeline.return_value = Mock(side_effect=score)
+
+        result = transformer.get_sentiments(["good", "bad"])
+
+        assert result == [{'label': 'NEU', 'score': 0.5}, None]
+
+    @patch('transform.pipeline')
+    def test_get_sentiments_scores_repeated_texts_once(self, mock_pipeline, transformer):
+        """Test that texts repeated in a call or cached by an earlier one skip the model"""
+        mock_pipeline_instance = Mock()
+        mock_pipeline.return_value = mock_pipeline_instance
+        mock_pipeline_instance.side_effect = lambda texts, **kwargs: [
+            {'label': 'POS', 'score': 0.9} for _ in texts]
+
+        first = transformer.get_sentiments(["spam", "spam  ", "other"])
+        second = transformer.get_sentiments(["spam", "new"])
+
+        batches = [call.args[0] for call in mock_pipeline_instance.call_args_list]
+        assert batches == [["spam", "other"], ["new"]]
+        assert first == [{'label': 'POS', 'score': 0.9}] * 3
+        assert second == [{'label': 'POS', 'score': 0.9}] * 2
+        assert transformer.cache.stats() == {
+            'hits': 2, 'misses': 3, 'hit_ratio': 0.4, 'size': 3}
+
+    @patch('transform.pipeline')
+    def test_get_sentiment_uses_cache(self, mock_pipeline, transformer):
+        """Test that a cached text is not scored again"""
+        mock_pipeline_instance = Mock()
+        mock_pipeline.return_value = mock_pipeline_instance
+        mock_pipeline_instance.return_value = [{'label': 'NEG', 'score': 0.6}]
+
+        transformer.get_sentiment("I hate this")
+        result = transformer.get_sentiment("I hate this")
+
+        assert result == {'label': 'NEG', 'score': 0.6}
+        mock_pipeline_instance.assert_called_once()
+
+    @patch('transform.pipeline')
+    def test_disabled_cache_still_scores_repeats_once(self, mock_pipeline):
+        """Test that with a zero size cache nothing is kept, but repeats in a call share a result"""
+        mock_pipeline_instance = Mock()
+        mock_pipeline.return_value = mock_pipeline_instance
+        mock_pipeline_instance.side_effect = lambda texts, **kwargs: [
+            {'label': 'POS', 'score': 0.9} for _ in texts]
+        transformer = MessageTransformer({'trump': 1}, cache=SentimentCache(max_size=0))
+
+        transformer.get_sentiments(["spam", "spam"])
+        transformer.get_sentiments(["spam"])
+
+        assert mock_pipeline_instance.call_count == 2
+        assert len(transformer.cache) == 0
+
+    @patch('transform.pipeline')
+    def test_transform_batch(self, mock_pipeline, transformer):
+        """Test that only messages mentioning topics are scored, in one batch"""
+        mock_pipeline_instance = Mock()
+        mock_pipeline.return_value = mock_pipeline_instance
+        mock_pipeline_instance.side_effect = lambda texts, **kwargs: [
+            {'label': 'POS', 'score': 0.9} for _ in texts]
+        messages = [Message({'text': text, 'langs': ['en'], '$type': 'app.bsky.feed.post',
+                             'createdAt': '2025-07-28T12:36:42.475Z'})
+                    for text in ('trump and biden', 'cats', 'biden')]
+
+        result = transformer.transform_batch(messages)
+
+        mock_pipeline_instance.assert_called_once()
+        assert mock_pipeline_instance.call_args.args[0] == ['biden', 'trump and biden']
+        assert result['topic_id'].tolist() == [1, 2, 2]
+        assert all(result['sentiment_label'] == 'POS')
+
+    @patch('transform.pipeline')
+    def test_transform_batch_no_topics_found(self, mock_pipeline, transformer):
+        """Test that a batch without topics gives an empty DataFrame without scoring"""
+        message = Message({'text': 'cats', 'langs': ['en'], '$type': 'app.bsky.feed.post',
+                           'createdAt': '2025-07-28T12:36:42.475Z'})
+
+        result = transformer.transform_batch([message])
+
+        assert result.empty
+        mock_pipeline.return_value.assert_not_called()
+
+    @patch('transform.pipeline')
+    def test_transform_columns_appends_to_given_columns(self, mock_pipeline, transformer):
+        """Test that a second batch extends the columns of the first"""
+        mock_pipeline.return_value.side_effect = lambda texts, **kwargs: [
+            {'label': 'NEG', 'score': 0.7} for _ in texts]
+        first = [Message({'text': 'trump and biden', 'langs': ['en'], '$type': 'app.bsky.feed.post',
+                          'createdAt': '2025-07-28T12:36:42.475Z'})]
+        second = [Message({'text': 'biden again', 'langs': ['en'], '$type': 'app.bsky.feed.post',
+                           'createdAt': '2025-07-28T13:00:00.000Z'})]
+
+        columns = transformer.transform_columns(first)
+        result = transformer.transform_columns(second, columns=columns)
+
+        assert result is columns
+        assert columns['topic_id'] == [1, 2, 2]
+        assert columns['sentiment_label'] == ['NEG'] * 3
+        assert [timestamp.hour for timestamp in columns['timestamp']] == [12, 12, 13]
+
     def test_find_topics_in_text(self, transformer):
         """Test topic finding in text"""
 
@@ -209,19 +414,12 @@ class TestMessageTransformer:
         assert 'biden' in topics_found
         assert len(topics_found) == 2
 
-    def test_create_dataframe(self, transformer):
-        """Test DataFrame creation"""
-        sentiment = {'label': 'POS', 'score': 0.8}
-        timestamp = datetime(2025, 7, 28, 12, 36, 42)
-
-        df = transformer.create_dataframe(1, sentiment, timestamp)
+    def test_find_topics_whole_words(self):
+        """Test that whole_words stops topics matching inside longer words"""
+        transformer = MessageTransformer({'art': 1}, whole_words=True)
 
-        assert isinstance(df, pd.DataFrame)
-        assert len(df) == 1
-        assert df.iloc[0]['topic_id'] == 1
-        assert df.iloc[0]['sentiment_label'] == 'POS'
-        assert df.iloc[0]['sentiment_score'] == 0.8
-        assert df.iloc[0]['timestamp'] == timestamp
+        assert transformer.find_topics_in_text("so smart") == []
+        assert transformer.find_topics_in_text("modern art") == ['art']
 
     @patch('transform.pipeline')
     def test_transform_success(self, mock_pipeline, transformer, sample_message_2):
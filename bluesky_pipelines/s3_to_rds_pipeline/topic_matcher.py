@@ -0,0 +1,93 @@
+"""Aho-Corasick automaton finding every subscribed topic mentioned in a text
+in one pass over it, however many topics there are."""
+
+from collections import deque
+
+SCAN_BELOW = 100  # topics below which searching the text for each one is faster
+
+
+class TopicMatcher:
+    """Case-insensitive multi-topic matcher, built once from the topics dict.
+    With whole_words, a topic only matches where it is not part of a longer
+    word, so "art" is found in "modern art" but not in "smart"."""
+
+    def __init__(self, topics: dict | list, whole_words: bool = False,
+                 scan_below: int = SCAN_BELOW):
+        self.topics = list(topics)
+        self.whole_words = whole_words
+        self._patterns = [(topic, topic.lower()) for topic in self.topics if topic]
+        # the automaton walks the text in Python, so for a few topics
+        # lowering the text once and searching it per topic in C is faster
+        self._scan = len(self.topics) < scan_below
+        # per state: transitions by character, failure state, and the
+        # (length, topic index) pairs of every topic ending there
+        self._goto = [{}]
+        self._fail = [0]
+        self._output = [[]]
+        if not self._scan:
+            for index, (_, pattern) in enumerate(self._patterns):
+                self._add(pattern, index)
+            self._link()
+
+    def _add(self, pattern: str, index: int) -> None:
+        """Adds a lowercased topic to the trie."""
+        state = 0
+        for char in pattern:
+            next_state = self._goto[state].get(char)
+            if next_state is None:
+                next_state = len(self._goto)
+                self._goto[state][char] = next_state
+                self._goto.append({})
+                self._fail.append(0)
+                self._output.append([])
+            state = next_state
+        self._output[state].append((len(pattern), index))
+
+    def _link(self) -> None:
+        """Sets failure links breadth first, merging each state's outputs
+        with those of the longest suffix that is also in the trie."""
+        queue = deque(self._goto[0].values())
+        while queue:
+            state = queue.popleft()
+            for char, next_state in self._goto[state].items():
+                queue.append(next_state)
+                fail = self._fail[state]
+                while fail and char not in self._goto[fail]:
+                    fail = self._fail[fail]
+                self._fail[next_state] = self._goto[fail].get(char, 0)
+                self._output[next_state] = (self._output[next_state]
+                                            + self._output[self._fail[next_state]])
+
+    @staticmethod
+    def _is_word_char(text: str, position: int) -> bool:
+        return 0 <= position < len(text) and (text[position].isalnum() or text[position] == "_")
+
+    def _is_whole_word(self, text: str, start: int, end: int) -> bool:
+        return not (self._is_word_char(text, start - 1) or self._is_word_char(text, end))
+
+    def _occurs(self, text: str, pattern: str) -> bool:
+        """Whether a lowercased topic occurs in a lowercased text."""
+        start = text.find(pattern)
+        while start != -1 and not self._is_whole_word(text, start, start + len(pattern)):
+            start = text.find(pattern, start + 1)
+        return start != -1
+
+    def find(self, text: str) -> list[str]:
+        """Returns the topics mentioned in text, in the order of the topics dict."""
+        text = text.lower()
+        if self._scan and not self.whole_words:
+            return [topic for topic, pattern in self._patterns if pattern in text]
+        if self._scan:
+            return [topic for topic, pattern in self._patterns if self._occurs(text, pattern)]
+        goto, fail, output = self._goto, self._fail, self._output
+        found = set()
+        state = 0
+        for position, char in enumerate(text):
+            while state and char not in goto[state]:
+                state = fail[state]
+            state = goto[state].get(char, 0)
+            for length, index in output[state]:
+                if not self.whole_words or self._is_whole_word(
+                        text, position + 1 - length, position + 1):
+                    found.add(index)
+        return [self._patterns[index][0] for index in sorted(found)]
@@ -2,15 +2,28 @@
 DataFrame ready to load into the database. """
 # pylint: disable=W1203
 
+from os import environ, path
 from datetime import datetime
 import time
 import logging
+import numpy as np
 import pandas as pd
 from transformers import pipeline
 from collections.abc import Callable
+from topic_matcher import TopicMatcher
+from sentiment_cache import SentimentCache, text_key
+from sentiment_backends import (SENTIMENT_BACKEND, BACKENDS, QUANTIZED, ONNX,
+                                quantize, onnx_pipeline, local_pipeline)
+from sharded_inference import INFERENCE_WORKERS, ShardedScorer, worker_count
 
 
 TRANSFORMER_MODEL = "finiteautomata/bertweet-base-sentiment-analysis"
+SENTIMENT_BATCH_SIZE = int(environ.get("SENTIMENT_BATCH_SIZE", "32"))  # texts per forward pass
+MAX_TOKENS = 128  # bertweet's maximum sequence length, longer texts are truncated
+SENTIMENT_MODEL_PATH = environ.get("SENTIMENT_MODEL_PATH", "")  # baked in by bake_model.py
+TOPIC_WHOLE_WORDS = environ.get("TOPIC_WHOLE_WORDS", "false").lower() == "true"
+MENTION_COLUMNS = ("topic_id", "timestamp", "sentiment_label", "sentiment_score")
+REQUIRED_FIELDS = ("text", "langs", "$type", "createdAt")
 
 logging.basicConfig(
     level=logging.INFO,
@@ -61,25 +74,106 @@ class Message:
         return self._timestamp
 
 
+class MessageBatch:
+    """The text and timestamp of many messages, in columns."""
+
+    def __init__(self, texts: list[str], timestamps: list[datetime],
+                 rejected: dict[str, int] | None = None):
+        self.texts = texts
+        self.timestamps = timestamps
+        self.rejected = rejected or {}
+
+    def __len__(self) -> int:
+        return len(self.texts)
+
+    @classmethod
+    def from_messages(cls, messages: list[Message]) -> "MessageBatch":
+        """A batch of messages that have already been validated one at a time."""
+        return cls([message.text for message in messages],
+                   [message.timestamp for message in messages])
+
+    @classmethod
+    def from_raw(cls, items: list[dict]) -> "MessageBatch":
+        """Validates raw messages together, as masks over the batch rather than
+        a Message each, parsing the timestamps of only the messages that pass.
+        Messages that fail, including records that are not objects at all, are
+        counted by reason in rejected instead of raising MessageError."""
+        count = len(items)
+        required = set(REQUIRED_FIELDS)
+        complete = np.fromiter((isinstance(item, dict) and required <= item.keys()
+                                and isinstance(item["text"], str)
+                                for item in items), dtype=bool, count=count)
+        english = complete & np.fromiter((keep and _is_english(item.get("langs"))
+                                          for item, keep in zip(items, complete)),
+                                         dtype=bool, count=count)
+        timestamps = [_parse_timestamp(item["createdAt"]) if keep else None
+                      for item, keep in zip(items, english)]
+        valid = english & np.fromiter((timestamp is not None for timestamp in timestamps),
+                                      dtype=bool, count=count)
+        rejected = {"missing_fields": count - int(complete.sum()),
+                    "not_english": int(complete.sum() - english.sum()),
+                    "invalid_timestamp": int(english.sum() - valid.sum())}
+        indices = np.flatnonzero(valid)
+        return cls([items[index]["text"] for index in indices],
+                   [timestamps[index] for index in indices],
+                   {reason: total for reason, total in rejected.items() if total})
+
+
+def _is_english(langs) -> bool:
+    return isinstance(langs, (list, tuple, str)) and "en" in langs
+
+
+def _parse_timestamp(value) -> datetime | None:
+    """The timestamp as Message.timestamp parses it, or None if it is not one"""
+    try:
+        return datetime.fromisoformat(value)
+    except (TypeError, ValueError):
+        return None
+
+
 class MessageTransformer:
     """Transforms API messages into DataFrames for database loading."""
 
-    def __init__(self, topics_dict: dict, sentiment_model: str = TRANSFORMER_MODEL):
+    def __init__(self, topics_dict: dict, sentiment_model: str = TRANSFORMER_MODEL,
+                 whole_words: bool = TOPIC_WHOLE_WORDS, cache: SentimentCache | None = None,
+                 backend: str = SENTIMENT_BACKEND, model_path: str = SENTIMENT_MODEL_PATH):
+        if backend not in BACKENDS:
+            raise ValueError(f"Unknown sentiment backend: {backend}")
         self.sentiment_model = sentiment_model
+        self.backend = backend
+        self.model_path = model_path
         self._sentiment_pipeline = None
+        self._workers = None
         self._topics = topics_dict
+        self._matcher = TopicMatcher(topics_dict, whole_words=whole_words)
+        self.cache = cache if cache is not None else SentimentCache()
 
     @property
     def sentiment_pipeline(self) -> Callable:
-        """Lazy loading of sentiment analysis pipeline"""
+        """Lazy loading of sentiment analysis pipeline, run by the chosen backend.
+        A copy of the model baked into model_path is loaded from there instead."""
         if self._sentiment_pipeline is None:
-            self._sentiment_pipeline = pipeline(model=self.sentiment_model)
+            baked = bool(self.model_path) and path.isdir(self.model_path)
+            if self.backend == ONNX:
+                self._sentiment_pipeline = onnx_pipeline(
+                    self.model_path if baked else self.sentiment_model)
+            elif baked:
+                self._sentiment_pipeline = local_pipeline(self.model_path)
+            else:
+                self._sentiment_pipeline = pipeline(model=self.sentiment_model)
+            if self.backend == QUANTIZED:
+                self._sentiment_pipeline = quantize(self._sentiment_pipeline)
+            logging.info(f"Loaded {self.sentiment_model} with the {self.backend} backend")
         return self._sentiment_pipeline
 
     def get_sentiment(self, text: str) -> dict:
         """Analyses text sentiment using transformer model
         Returns:
             dict with label ('POS', 'NEG', 'NEU') and confidence score (0-1)"""
+        key = text_key(text)
+        cached = self.cache.get(key)
+        if cached is not None:
+            return cached
         logging.info("Running sentiment analysis...")
         time1 = time.time()
         llm_pipeline = self.sentiment_pipeline
@@ -87,28 +181,113 @@ class MessageTransformer:
         time2 = time.time()
         logging.info(
             f"Sentiment analysis complete in {round(time2-time1, 2)} seconds")
-        return max(sentiments, key=lambda sentiment: sentiment.get("score"))
+        sentiment = max(sentiments, key=lambda sentiment: sentiment.get("score"))
+        self.cache.put(key, sentiment)
+        return sentiment
+
+    @staticmethod
+    def _best(result: dict | list[dict]) -> dict:
+        """The top label of one text's result, which the pipeline returns as a
+        dict, or as a list of dicts when every label is scored."""
+        if isinstance(result, dict):
+            return result
+        return max(result, key=lambda sentiment: sentiment.get("score"))
+
+    def get_sentiments(self, texts: list[str],
+                       batch_size: int = SENTIMENT_BATCH_SIZE) -> list[dict | None]:
+        """Analyses the sentiment of many texts, batch_size texts per forward pass.
+        Texts already in the cache, or repeated in texts, are only scored once.
+        Results are returned in the original order, and a text that cannot be
+        scored gets None.
+        Returns:
+            list of dicts with label ('POS', 'NEG', 'NEU') and confidence score (0-1)"""
+        time1 = time.time()
+        keys = [text_key(text) for text in texts]
+        sentiments = [None] * len(texts)
+        first = {}
+        for index, key in enumerate(keys):
+            if key not in first:
+                first[key] = index
+                sentiments[index] = self.cache.get(key)
+
+        uncached = [index for index in first.values() if sentiments[index] is None]
+        scored = self._score_batches([texts[index] for index in uncached], batch_size)
+        for index, sentiment in zip(uncached, scored):
+            sentiments[index] = sentiment
+            if sentiment is not None:
+                self.cache.put(keys[index], sentiment)
+
+        repeats = [index for index, key in enumerate(keys) if first[key] != index]
+        for index in repeats:
+            sentiments[index] = sentiments[first[keys[index]]]
+        self.cache.record_hits(len(repeats))
+
+        time2 = time.time()
+        logging.info(
+            f"Sentiment analysis of {len(texts)} texts ({len(uncached)} not cached) "
+            f"complete in {round(time2-time1, 2)} seconds")
+        return sentiments
+
+    def start_workers(self, workers: int = INFERENCE_WORKERS) -> None:
+        """Loads the model, then forks worker processes that share it to score
+        every later batch of texts between them. Call it before starting any
+        threads. With one worker, or the ONNX backend, whose runtime is not
+        fork safe and already uses every core, texts are scored in this process."""
+        if worker_count(workers) < 2 or self.backend == ONNX or self._workers is not None:
+            return
+        import torch  # pylint: disable=C0415
+
+        # this process only waits on the workers, and with one thread torch
+        # never starts the OpenMP thread pool that a forked child deadlocks on
+        torch.set_num_threads(1)
+        _ = self.sentiment_pipeline
+        self._workers = ShardedScorer(self._score_local, workers)
+
+    def stop_workers(self) -> None:
+        """Stops the worker processes, scoring in this process again."""
+        if self._workers is not None:
+            self._workers.close()
+            self._workers = None
+
+    def _score_batches(self, texts: list[str], batch_size: int) -> list[dict | None]:
+        """Scores texts in batches, split between the worker processes once
+        they are started, returning the results in the original order."""
+        if self._workers is not None:
+            return self._workers.score(texts, batch_size)
+        return self._score_local(texts, batch_size)
+
+    def _score_local(self, texts: list[str], batch_size: int) -> list[dict | None]:
+        """Runs the model over texts sorted by length, so each batch is padded
+        to similar lengths, returning the results in the original order."""
+        if not texts:
+            return []
+        llm_pipeline = self.sentiment_pipeline
+        order = sorted(range(len(texts)), key=lambda index: len(texts[index]))
+        sentiments = [None] * len(texts)
+
+        for start in range(0, len(order), batch_size):
+            indices = order[start:start + batch_size]
+            try:
+                results = llm_pipeline([texts[index] for index in indices],
+                                       batch_size=len(indices),
+                                       truncation=True, max_length=MAX_TOKENS)
+            except (IndexError, RuntimeError, ValueError) as e:
+                logging.warning(f"Batch of {len(indices)} failed ({e}), scoring one at a time.")
+                results = []
+                for index in indices:
+                    try:
+                        results.append(llm_pipeline(
+                            texts[index], truncation=True, max_length=MAX_TOKENS))
+                    except (IndexError, RuntimeError, ValueError):
+                        logging.error("Could not score a message, skipping it.")
+                        results.append(None)
+            for index, result in zip(indices, results):
+                sentiments[index] = self._best(result) if result else None
+        return sentiments
 
     def find_topics_in_text(self, text: str) -> list[str]:
-        """Finds which subscribed topics are mentioned in the text."""
-        logging.info("Matching topics in topics list...")
-        topics_found = []
-
-        for topic in self._topics.keys():
-            if topic.lower() in text.lower():
-                topics_found.append(topic)
-
-        return topics_found
-
-    def create_dataframe(self, topic_id: str, sentiment: dict, timestamp: datetime) -> pd.DataFrame:
-        """Creates a single-row DataFrame with the given data."""
-        logging.info("Creating DataFrame...")
-        return pd.DataFrame({
-            "topic_id": [topic_id],
-            "timestamp": [timestamp],
-            "sentiment_label": [sentiment.get("label")],
-            "sentiment_score": [sentiment.get("score")]
-        })
+        """Finds which subscribed topics are mentioned in the text, in one pass over it."""
+        return self._matcher.find(text)
 
     def transform(self, message: Message) -> pd.DataFrame | None:
         """Converts message to DataFrame.
@@ -127,17 +306,69 @@ class MessageTransformer:
             logging.error("Token indices sequence length over 128, skipping message.")
             return None
 
-        dataframes = []
-        for topic in topics_found:
-            df = self.create_dataframe(
-                self._topics[topic], sentiment, message.timestamp)
-            dataframes.append(df)
+        df = pd.DataFrame({
+            "topic_id": [self._topics[topic] for topic in topics_found],
+            "timestamp": [message.timestamp] * len(topics_found),
+            "sentiment_label": [sentiment.get("label")] * len(topics_found),
+            "sentiment_score": [sentiment.get("score")] * len(topics_found)
+        })
 
         time2 = time.time()
         logging.info(
             f"transform script complete in {round(time2-time1, 2)} seconds")
 
-        return pd.concat(dataframes, ignore_index=True)
+        return df
+
+    def transform_batch(self, messages: list[Message] | MessageBatch,
+                        batch_size: int = SENTIMENT_BATCH_SIZE) -> pd.DataFrame:
+        """Converts many messages to one DataFrame, scoring the sentiment of
+        every message that mentions a topic in batches.
+        Returns:
+            DataFrame ready for database loading, empty if no topics found."""
+        return pd.DataFrame(self.transform_columns(messages, batch_size))
+
+    def transform_columns(self, messages: list[Message] | MessageBatch,
+                          batch_size: int = SENTIMENT_BATCH_SIZE,
+                          columns: dict[str, list] | None = None) -> dict[str, list]:
+        """Appends a row per topic mentioned by each message to columns, a
+        list per column of the mention table, so many batches can fill the
+        same lists and become one DataFrame at the end.
+        Returns:
+            columns, or new lists if none were given."""
+        return self.score_matches(self.match(messages), batch_size, columns)
+
+    def match(self, messages: list[Message] | MessageBatch) -> list[tuple[str, datetime, list[str]]]:
+        """The text, timestamp and topics found of each message mentioning a topic."""
+        if not isinstance(messages, MessageBatch):
+            messages = MessageBatch.from_messages(messages)
+        matched = []
+        for text, timestamp in zip(messages.texts, messages.timestamps):
+            topics_found = self.find_topics_in_text(text)
+            if topics_found:
+                matched.append((text, timestamp, topics_found))
+        logging.info(f"{len(matched)} of {len(messages)} messages mention a topic")
+        return matched
+
+    def score_matches(self, matched: list[tuple[str, datetime, list[str]]],
+                      batch_size: int = SENTIMENT_BATCH_SIZE,
+                      columns: dict[str, list] | None = None) -> dict[str, list]:
+        """Scores the sentiment of matched messages in batches, appending a row
+        per topic found to columns, or new lists if none were given."""
+        if columns is None:
+            columns = {column: [] for column in MENTION_COLUMNS}
+        sentiments = self.get_sentiments([text for text, _, _ in matched], batch_size)
+
+        topic_ids, timestamps = columns["topic_id"], columns["timestamp"]
+        labels, scores = columns["sentiment_label"], columns["sentiment_score"]
+        for (_, timestamp, topics_found), sentiment in zip(matched, sentiments):
+            if sentiment is None:
+                continue
+            count = len(topics_found)
+            topic_ids.extend(self._topics[topic] for topic in topics_found)
+            timestamps.extend([timestamp] * count)
+            labels.extend([sentiment.get("label")] * count)
+            scores.extend([sentiment.get("score")] * count)
+        return columns
 
 
 def main():
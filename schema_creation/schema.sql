@@ -34,3 +34,9 @@ CREATE TABLE bluesky.mention(
     FOREIGN KEY(topic_id) REFERENCES bluesky.topic (topic_id) ON DELETE CASCADE
 );
 
+CREATE TABLE bluesky.processed_batch(
+    batch_key TEXT PRIMARY KEY,
+    processed_at TIMESTAMP NOT NULL DEFAULT CURRENT_TIMESTAMP,
+    message_count INT NOT NULL,
+    mention_count INT NOT NULL
+);
@@ -313,13 +313,14 @@ resource "aws_lambda_function" "lambda_function" {
 
   environment {
     variables = {
-      DB_HOST     = var.DB_HOST
-      DB_PORT     = var.DB_PORT
-      DB_USER     = var.DB_USERNAME
-      DB_PASSWORD = var.DB_PASSWORD
-      DB_NAME     = var.DB_NAME
-      DB_SCHEMA   = var.DB_SCHEMA
-      HF_HOME     = "/tmp/hf/"
+      DB_HOST           = var.DB_HOST
+      DB_PORT           = var.DB_PORT
+      DB_USER           = var.DB_USERNAME
+      DB_PASSWORD       = var.DB_PASSWORD
+      DB_NAME           = var.DB_NAME
+      DB_SCHEMA         = var.DB_SCHEMA
+      HF_HOME           = "/tmp/hf/"
+      INFERENCE_WORKERS = "0" # one forked inference worker per vCPU
     }
   }
 }
@@ -407,6 +408,7 @@ resource "aws_s3_bucket_notification" "s3_trigger" {
   lambda_function {
     lambda_function_arn = aws_lambda_function.lambda_function.arn
     events              = ["s3:ObjectCreated:*"]
+    filter_prefix       = "bluesky/raw_posts/"
   }
 
   depends_on = [aws_lambda_permission.allow_s3]
@@ -551,6 +553,9 @@ resource "aws_cloudwatch_event_rule" "s3_put_event" {
       bucket = {
         name = ["c18-trend-getter-s3"]
       }
+      object = {
+        key = [{ prefix = "bluesky/raw_posts/" }]
+      }
     }
   })
 }